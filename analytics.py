@@ -0,0 +1,131 @@
+import numpy as np
+
+import planets
+from converters import numformat
+from rules import (
+    CREDIT_STORAGE, HYDRO_STORAGE, MAX_LEVEL, PTYPE, SHIPMENT_VALUE,
+    UPGRADE_COST, shipment_base
+)
+
+
+# Per-slot constants, broadcast across every player row
+SLOT_SHIPMENT_BASE = np.array(
+    [shipment_base(ptype, ptier) for ptype, ptier, _ in planets.PORDER]
+)
+SLOT_PTYPE = np.array([ptype.value for ptype, _, _ in planets.PORDER])
+SLOT_HYDRO = SLOT_PTYPE != PTYPE.Fire.value
+
+
+def pack(players):
+    """
+    Returns (pids, levels, upgrading) for the given player info, with
+    levels and upgrading as (players x 16) matrices.
+    """
+    pids, levels, until = [], [], []
+    # Copies each Player's typed arrays straight into the matrices
+    for pid, player in players.items():
+        pids.append(pid)
+        levels.append(player.levels.tobytes())
+        until.append(player.until.tobytes())
+    shape = (len(pids), len(planets.PORDER))
+    levels = np.frombuffer(
+        b"".join(levels), dtype=np.uint8
+    ).reshape(shape).astype(np.int64)
+    until = np.frombuffer(b"".join(until), dtype=np.int64).reshape(shape)
+    return pids, levels, until != 0
+
+
+def compute_caps(levels, upgrading):
+    """
+    Returns cur_cc, fut_cc, cur_hc, fut_hc arrays, one entry per player.
+    Matches planets._compute_cap for every row.
+    """
+    credit = np.asarray(CREDIT_STORAGE)
+    hydro = np.asarray(HYDRO_STORAGE)
+    fut_levels = levels + upgrading
+    cur_hc = np.where(SLOT_HYDRO, hydro[levels], 0)
+    fut_hc = np.where(SLOT_HYDRO, hydro[fut_levels], 0)
+    return (
+        credit[levels].sum(axis=1), credit[fut_levels].sum(axis=1),
+        cur_hc.sum(axis=1), fut_hc.sum(axis=1)
+    )
+
+
+def compute_income(levels):
+    """
+    Returns a (players x 16) matrix of hourly shipment value per planet.
+    """
+    return np.asarray(SHIPMENT_VALUE)[SLOT_SHIPMENT_BASE + levels]
+
+
+def compute_roi(levels, upgrading):
+    """
+    Returns (players x 16) matrices of credit cap and hourly income gained
+    per credit spent on each planet's next upgrade. Planets that are
+    empty, maxed or already upgrading are 0.
+    """
+    max_level = np.array([MAX_LEVEL[ptier] for _, ptier, _ in planets.PORDER])
+    cost = np.asarray(UPGRADE_COST)[levels]
+    open_ = (levels > 0) & (levels < max_level) & ~upgrading & (cost > 0)
+    nxt = np.minimum(levels + 1, max_level)
+    credit = np.asarray(CREDIT_STORAGE)
+    shipments = np.asarray(SHIPMENT_VALUE)
+    cc_gain = credit[nxt] - credit[levels]
+    cr_gain = (
+        shipments[SLOT_SHIPMENT_BASE + nxt] -
+        shipments[SLOT_SHIPMENT_BASE + levels]
+    )
+    safe_cost = np.where(open_, cost, 1)
+    return (
+        np.where(open_, cc_gain / safe_cost, 0.0),
+        np.where(open_, cr_gain / safe_cost, 0.0)
+    )
+
+
+async def guild_report(inter):
+    """
+    Summarizes caps, upgrades in progress and shipments across all players.
+    """
+    planets._read_player_info()
+    pids, levels, upgrading = pack(planets.PLAYER_INFO)
+    if not pids:
+        await inter.response.send_message("No players registered yet.")
+        return
+
+    cur_cc, fut_cc, cur_hc, fut_hc = compute_caps(levels, upgrading)
+    income = compute_income(levels)
+    cc_roi, _ = compute_roi(levels, upgrading)
+
+    def spread(values, unit):
+        p10, p50, p90 = np.percentile(values, [10, 50, 90]).astype(int)
+        return (
+            f"{numformat(int(values.min()))} / {numformat(int(p10))} / "
+            f"{numformat(int(p50))} / {numformat(int(p90))} / "
+            f"{numformat(int(values.max()))} {unit}"
+        )
+
+    by_type = np.bincount(
+        np.broadcast_to(SLOT_PTYPE, levels.shape).ravel(),
+        weights=income.ravel(), minlength=len(PTYPE) + 1
+    )
+    type_lines = "\n".join(
+        f"- {planets.PTYPE_EMOJI[ptype.value]} {ptype.name}: "
+        f"{numformat(int(by_type[ptype.value]))} CR/h"
+        for ptype in PTYPE
+    )
+    best_roi = cc_roi.max(axis=1)
+
+    await inter.response.send_message(
+        f"Guild report for {len(pids)} players "
+        f"(min / p10 / median / p90 / max):\n"
+        f"Credit Cap: {spread(cur_cc, 'CR')}\n"
+        f"Upgraded Credit Cap: {spread(fut_cc, 'CR')}\n"
+        f"Hydro Cap: {spread(cur_hc, 'H')}\n"
+        f"Upgraded Hydro Cap: {spread(fut_hc, 'H')}\n"
+        f"Upgrades in progress: {int(upgrading.sum())} across "
+        f"{int(upgrading.any(axis=1).sum())} players\n"
+        f"Median best next upgrade: "
+        f"{numformat(int(np.median(best_roi) * 1000))} CC per 1k CR\n"
+        f"Hourly shipments: {numformat(int(income.sum()))} CR/h\n"
+        f"{type_lines}"
+    )
@@ -0,0 +1,414 @@
+"""
+Benchmarks the planets and research hot paths on synthetic populations.
+
+Usage: python benchmark.py [--sizes 100 1000 ...] [--output results.json]
+
+Run from the repository root (the game data files are read from the
+working directory). Player data is generated into a temporary directory,
+so player_info.json is never touched. Startup is timed in fresh processes,
+with the game data read from JSON and from its snapshot. Results are
+written as JSON so runs on different commits can be compared.
+"""
+import asyncio
+import random
+import shutil
+import sys
+from argparse import ArgumentParser
+from json import dump, dumps, loads
+from os import path
+from platform import python_version
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+
+import gamedata
+import planets
+import research
+from player import Player
+from rules import MAX_LEVEL
+from store import JournalStore
+
+
+STRESS_CLIENTS = 50  # Concurrent command streams in the stress test
+
+
+### Fakes standing in for disnake objects
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, content, **kwargs):
+        self.messages.append(content)
+
+
+class FakeChannel:
+    def __init__(self, id=0):
+        self.id = id
+        self.messages = []
+
+    async def send(self, content, **kwargs):
+        self.messages.append(content)
+
+
+class FakeAuthor:
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeClient:
+    def get_emoji(self, emoji_id):
+        return f"<:e:{emoji_id}>"
+
+
+class FakeInter:
+    def __init__(self, author_id, channel=None):
+        self.author = FakeAuthor(author_id)
+        self.response = FakeResponse()
+        self.channel = channel or FakeChannel()
+        self.client = FakeClient()
+
+
+### Synthetic data
+
+def synthetic_player(rng, now):
+    """
+    Returns a player in JSON form. Players unlock slots in PORDER order,
+    and levels and running upgrades follow how far along the player is.
+    """
+    progress = rng.betavariate(2, 2)
+    unlocked = max(1, round(len(planets.PORDER) * progress ** 0.7))
+    player = []
+    for i, (_, ptier, _) in enumerate(planets.PORDER):
+        if i >= unlocked:
+            player.append([None, 0, None])
+            continue
+        top = MAX_LEVEL[ptier]
+        level = min(top, max(1, round(rng.gauss(progress * top, top / 6))))
+        upgr_until = None
+        if level < top and rng.random() < 0.15:
+            # A few timers have already run out
+            upgr_until = now + rng.randint(-86400, 14 * 86400)
+        player.append([f"P{i}-{rng.randrange(1000)}", level, upgr_until])
+    return {
+        "planets": player,
+        "settings": {"ping_when_upgraded": rng.random() < 0.5}
+    }
+
+
+def synthetic_population(size, seed=0):
+    """
+    Returns {pid: player} for size synthetic players.
+    """
+    rng = random.Random(seed)
+    now = int(time())
+    return {
+        str(10**17 + i): synthetic_player(rng, now) for i in range(size)
+    }
+
+
+def synthetic_blueprints(rng):
+    """
+    Returns the five blueprint strings artifact_count takes.
+    """
+    research.load_info()
+    return [
+        " ".join(
+            str(rng.randint(0, req)) for _, _, req in research.RESEARCH[cat]
+        )
+        for cat in ["Trade", "Mining", "Weapons", "Shields", "Support"]
+    ]
+
+
+### Timing
+
+def timed(results, size, op, calls, func):
+    """
+    Runs func, recording its total and per-call time under op.
+    """
+    start = perf_counter()
+    func()
+    elapsed = perf_counter() - start
+    _record(results, size, op, calls, elapsed)
+
+
+async def atimed(results, size, op, calls, coro_func):
+    """
+    Awaits coro_func(), recording its total and per-call time under op.
+    """
+    start = perf_counter()
+    await coro_func()
+    elapsed = perf_counter() - start
+    _record(results, size, op, calls, elapsed)
+
+
+def _record(results, size, op, calls, elapsed):
+    results.append({
+        "players": size,
+        "op": op,
+        "calls": calls,
+        "total_s": elapsed,
+        "per_call_us": elapsed / max(1, calls) * 1e6,
+    })
+    print(
+        f"{size:>8} {op:<28} {calls:>8} calls "
+        f"{elapsed:10.4f}s {elapsed / max(1, calls) * 1e6:12.2f}us/call"
+    )
+
+
+async def bench_size(size, sample, cache_size, workdir, results):
+    """
+    Benchmarks every hot path against one synthetic population.
+    """
+    rng = random.Random(size)
+    population = synthetic_population(size)
+    store = JournalStore(
+        path.join(workdir, f"players_{size}.json"),
+        path.join(workdir, f"players_{size}.journal")
+    )
+    timed(results, size, "json_save", 1, lambda: _save(store, population))
+    loaded = []
+    timed(
+        results, size, "json_load", 1,
+        lambda: loaded.extend(planets._load_players(store))
+    )
+    planets._use_player_info(store, *loaded)
+
+    pids = rng.sample(list(planets.PLAYER_INFO), min(sample, size))
+    timed(
+        results, size, "_compute_cap (all players)", size,
+        lambda: [planets._compute_cap(p) for p in planets.PLAYER_INFO.values()]
+    )
+
+    async def each(command):
+        for pid in pids:
+            await command(FakeInter(int(pid)))
+
+    await atimed(
+        results, size, "list_planets", len(pids),
+        lambda: each(planets.list_planets)
+    )
+    await atimed(
+        results, size, "upgrade_details", len(pids),
+        lambda: each(planets.upgrade_details)
+    )
+
+    channel = FakeChannel()
+    await atimed(
+        results, size, "check_upgrades (expired)", 1,
+        lambda: planets.check_planet_upgrade_status(channel)
+    )
+    await atimed(
+        results, size, "check_upgrades (idle)", sample,
+        lambda: _repeat(planets.check_planet_upgrade_status, channel, sample)
+    )
+    await atimed(
+        results, size, "leaderboard", len(pids),
+        lambda: each(lambda inter: planets.leaderboard(inter, "cc", 10))
+    )
+    await atimed(
+        results, size, "shift_upgrade_times", len(pids),
+        lambda: each(lambda inter: planets.shift_upgrade_times(inter, 60))
+    )
+    await atimed(
+        results, size, "shift_all_upgrade_times", 1,
+        lambda: planets.shift_all_upgrade_times(FakeInter(0), 60)
+    )
+    await bench_stress(size, pids, sample * 10, store, results)
+    await planets.WRITER.flush()
+    timed(results, size, "json_compact", 1, store.compact)
+
+    planets.flush_player_info()  # Saves the leaderboards, as on shutdown
+    # Lazy loading: only the index is opened, players are read on first use
+    lazy = []
+    timed(
+        results, size, "lazy_open", 1,
+        lambda: lazy.extend(planets._load_players(store, cache_size))
+    )
+    planets._use_player_info(store, *lazy)
+    await atimed(
+        results, size, "list_planets (lazy)", len(pids),
+        lambda: each(planets.list_planets)
+    )
+
+    bps = [synthetic_blueprints(rng) for _ in range(sample)]
+
+    async def artifacts():
+        for bp in bps:
+            await research.artifact_count(
+                FakeInter(0), rng.randint(1, 11), *bp
+            )
+
+    await atimed(results, size, "artifact_count", len(bps), artifacts)
+
+
+async def bench_stress(size, pids, commands, store, results):
+    """
+    Runs a mix of changes and reads from STRESS_CLIENTS clients at once,
+    then checks that the store ends up matching the live player state.
+    """
+    rng = random.Random(size)
+    channel = FakeChannel()
+    per_client = max(1, commands // STRESS_CLIENTS)
+
+    async def command():
+        pid = rng.choice(pids)
+        inter = FakeInter(int(pid))
+        roll = rng.random()
+        if roll < 0.25:
+            names = [n for n in planets.PLAYER_INFO[pid].names if n]
+            await planets.upgrade_planet(
+                inter, rng.choice(names), rng.randint(60, 86400)
+            )
+        elif roll < 0.35:
+            slot = rng.randrange(len(planets.PORDER))
+            ptype, tier, disc = planets.PORDER[slot]
+            await planets.add_planet(
+                inter, f"S{slot}", rng.randint(1, MAX_LEVEL[tier] - 1),
+                ptype, tier, disc
+            )
+        elif roll < 0.4:
+            await planets.change_bool_settings(
+                inter, "ping_when_upgraded", rng.random() < 0.5
+            )
+        elif roll < 0.45:
+            await planets.shift_upgrade_times(inter, rng.randint(60, 3600))
+        elif roll < 0.65:
+            await planets.list_planets(inter)
+        elif roll < 0.85:
+            await planets.upgrade_details(inter)
+        elif roll < 0.95:
+            await planets.view_settings(inter)
+        else:
+            await planets.check_planet_upgrade_status(channel)
+
+    async def client():
+        for _ in range(per_client):
+            await command()
+
+    await atimed(
+        results, size, f"stress ({STRESS_CLIENTS} clients)",
+        per_client * STRESS_CLIENTS,
+        lambda: asyncio.gather(*(client() for _ in range(STRESS_CLIENTS)))
+    )
+    await planets.WRITER.flush()
+    stored = store.load()
+    consistent = all(
+        Player.from_json(stored[pid]).to_json() ==
+        planets.PLAYER_INFO[pid].to_json()
+        for pid in pids
+    )
+    stats = planets.STATE.stats()
+    print(
+        f"{'':>8} store matches live state: {consistent}, "
+        f"state queue wait {stats['wait_avg'] * 1e6:.0f}us avg / "
+        f"{stats['wait_max'] * 1e6:.0f}us max"
+    )
+
+
+def bench_startup(workdir, results):
+    """
+    Times bot startup and the first commands in fresh processes, with the
+    game data loaded from the JSON files and then from the snapshot.
+    """
+    for filename in gamedata.SOURCES.values():
+        shutil.copy(filename, workdir)
+    script = path.abspath(__file__)
+    compiler = path.join(path.dirname(script), "gamedata.py")
+    for mode in ["json", "snapshot"]:
+        if mode == "snapshot":
+            run(
+                [sys.executable, compiler],
+                cwd=workdir, check=True, capture_output=True
+            )
+        start = perf_counter()
+        child = run(
+            [sys.executable, script, "--startup-child"],
+            cwd=workdir, check=True, capture_output=True, text=True
+        )
+        elapsed = perf_counter() - start
+        timings = loads(child.stdout.splitlines()[-1])
+        _record(results, 0, f"process startup ({mode})", 1, elapsed)
+        for op, seconds in timings.items():
+            _record(results, 0, f"{op} ({mode})", 1, seconds)
+
+
+async def startup_child():
+    """
+    Prints the game data load time and first command latencies as JSON.
+    Run by bench_startup in a fresh process.
+    """
+    bps = synthetic_blueprints(random.Random(0))
+    timings = {"game data load": gamedata.LOAD_SECONDS}
+    start = perf_counter()
+    await planets.list_planets(FakeInter(1))
+    timings["first list_planets"] = perf_counter() - start
+    start = perf_counter()
+    await research.artifact_count(FakeInter(1), 11, *bps)
+    timings["first artifact_count"] = perf_counter() - start
+    planets.flush_player_info()
+    print(dumps(timings))
+
+
+async def _repeat(coro_func, arg, times):
+    for _ in range(times):
+        await coro_func(arg)
+
+
+def _save(store, population):
+    with open(store.snapshot, "w") as f:
+        dump(population, f)
+
+
+def _commit():
+    try:
+        return run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+async def main(sizes, sample, cache_size, output):
+    results = []
+    with TemporaryDirectory() as workdir:
+        bench_startup(workdir, results)
+        for size in sizes:
+            await bench_size(size, sample, cache_size, workdir, results)
+    with open(output, "w") as f:
+        dump({
+            "commit": _commit(),
+            "python": python_version(),
+            "timestamp": int(time()),
+            "sample": sample,
+            "results": results,
+        }, f, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+",
+        default=[100, 1000, 10000, 100000],
+        help="Population sizes to generate (up to 1000000)."
+    )
+    parser.add_argument(
+        "--sample", type=int, default=1000,
+        help="Players (or blueprint sets) per per-player command benchmark."
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=1000,
+        help="Players held by the lazy-loading cache."
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--startup-child", action="store_true", help=(
+        "Internal: time startup and first commands in this process."
+    ))
+    args = parser.parse_args()
+    if args.startup_child:
+        asyncio.run(startup_child())
+    else:
+        asyncio.run(
+            main(args.sizes, args.sample, args.cache_size, args.output)
+        )
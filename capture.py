@@ -0,0 +1,107 @@
+"""
+Opt-in capture of slash command traffic, for replaying offline with
+replay.py.
+
+Turned on by setting CAPTURE_FILE. Each command is written to it as one
+JSON line, [start time, command, author id, channel id, [arguments],
+latency in seconds], with arguments as the command's callback received
+them (after conversion). The players are saved next to it when capture
+starts (CAPTURE_FILE + ".start.json") and when the bot stops (".end.json"),
+so a replay starts from the same state and can check where it ends up.
+Each run of the bot starts a new capture. While off, recorded commands pay
+for a single global check.
+"""
+import json
+from asyncio import get_running_loop, sleep
+from enum import Enum
+from functools import wraps
+from inspect import signature
+from os import getenv
+from time import perf_counter, time
+
+
+ENABLED = False
+FILENAME = None
+LOG = None
+INTERVAL = 5.0  # Seconds between flushes of the log
+
+
+def recorded(command):
+    """
+    Decorator capturing each call of a slash command callback.
+    """
+    def decorator(func):
+        params = signature(func)
+
+        @wraps(func)
+        async def wrapper(inter, *args, **kwargs):
+            if not ENABLED:
+                return await func(inter, *args, **kwargs)
+            started = time()
+            start = perf_counter()
+            try:
+                return await func(inter, *args, **kwargs)
+            finally:
+                bound = params.bind(inter, *args, **kwargs)
+                bound.apply_defaults()
+                _, *values = bound.arguments.values()
+                _write([
+                    round(started, 3), command, inter.author.id,
+                    getattr(inter.channel, "id", None),
+                    [_plain(value) for value in values],
+                    round(perf_counter() - start, 6)
+                ])
+        return wrapper
+    return decorator
+
+
+async def start(players):
+    """
+    Turns capture on if configured, saving players() ({pid: player} in
+    JSON form) as the replay's starting point. Returns whether it is on.
+    """
+    global ENABLED, FILENAME, LOG
+    filename = getenv("CAPTURE_FILE")
+    if not filename or ENABLED:
+        return ENABLED
+    _save_players(filename + ".start.json", players())
+    FILENAME = filename
+    LOG = open(filename, "w")
+    ENABLED = True
+    get_running_loop().create_task(_flush())
+    return True
+
+
+def stop(players):
+    """
+    Turns capture off, saving players() as where the replay should end up.
+    Call on shutdown; does nothing if capture is off.
+    """
+    global ENABLED, LOG
+    if not ENABLED:
+        return
+    ENABLED = False
+    LOG.close()
+    LOG = None
+    _save_players(FILENAME + ".end.json", players())
+
+
+def _write(entry):
+    LOG.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def _plain(arg):
+    # Enum options (e.g. PTYPE) are written as their values
+    return arg.value if isinstance(arg, Enum) else arg
+
+
+def _save_players(filename, players):
+    with open(filename, "w") as f:
+        json.dump({"time": time(), "players": players}, f)
+
+
+async def _flush():
+    while ENABLED:
+        await sleep(INTERVAL)
+        if LOG is not None:
+            LOG.flush()
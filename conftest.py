@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import planets
+from store import JournalStore
+
+
+def player_json(*slots, offset=0):
+    """
+    Returns a player in JSON form with the given [name, level,
+    upgrade_until] planets in the first slots, and the rest empty.
+    """
+    data = {
+        "planets": [list(planet) for planet in slots] + [
+            [None, 0, None] for _ in range(len(planets.PORDER) - len(slots))
+        ],
+        "settings": {"ping_when_upgraded": False}, "blueprints": {}
+    }
+    if offset:
+        data["offset"] = offset
+    return data
+
+
+@pytest.fixture
+def load_planets(tmp_path):
+    """
+    Returns a function that loads {pid: player} into planets from a new
+    JournalStore (lazily with a cache_size), returning the store. Called
+    again without players, reloads the same store as a restart would.
+    """
+    snapshot = str(tmp_path / "players.json")
+
+    def load(players=None, cache_size=0):
+        if players is not None:
+            with open(snapshot, "w") as f:
+                json.dump(players, f)
+        store = JournalStore(snapshot, str(tmp_path / "players.journal"))
+        planets._use_player_info(
+            store, *planets._load_players(store, cache_size)
+        )
+        return store
+
+    yield load
+    if planets.WRITER is not None:
+        planets.WRITER.flush_sync()
+    planets.PLAYER_INFO = None
@@ -0,0 +1,139 @@
+from asyncio import Event, TimeoutError, wait_for
+from heapq import heapify, heappop, heappush
+from time import time
+
+
+class DeadlineIndex:
+    """
+    Upgrade deadlines in the order they fall due.
+
+    Timers are stored by their base deadline, in a min-heap per player.
+    A player's time offset (see Player) is only applied in the top-level
+    heap, which holds one entry per player: their earliest base deadline
+    minus their offset. Shifting every timer a player has is then a single
+    new top-level entry, with no timer re-keyed.
+
+    Cancelled or changed timers are not removed eagerly; instead
+    current(pid, slot) is asked for the live base deadline and any timer
+    that no longer matches is discarded when it reaches the top of its
+    player's heap. Top-level entries for an old head or offset are
+    discarded the same way.
+    """
+    def __init__(self, current):
+        self.current = current
+        self.timers = {}  # pid -> min-heap of (base deadline, slot)
+        self.offsets = {}  # pid -> time offset, if not 0
+        self.heads = {}  # pid -> (deadline, base deadline) of their entry
+        self.heap = []  # (deadline, base deadline, pid)
+        self.wake = Event()
+
+    def rebuild(self, entries, offsets=None):
+        """
+        Replaces the index with the given (base deadline, pid, slot) entries
+        and {pid: offset} time offsets.
+        """
+        self.timers = {}
+        for until, pid, slot in entries:
+            self.timers.setdefault(pid, []).append((until, slot))
+        self.offsets = {
+            pid: offset for pid, offset in (offsets or {}).items() if offset
+        }
+        self.heads = {}
+        self.heap = []
+        for pid, timers in self.timers.items():
+            heapify(timers)
+            base = timers[0][0]
+            self.heads[pid] = (base - self.offsets.get(pid, 0), base)
+            self.heap.append((*self.heads[pid], pid))
+        heapify(self.heap)
+        self.wake.set()
+
+    def push(self, until, pid, slot):
+        """
+        Adds a base deadline, waking the scheduler if it is now the earliest.
+        """
+        earliest = self.peek()
+        heappush(self.timers.setdefault(pid, []), (until, slot))
+        self._refresh(pid, earliest)
+
+    def shift(self, pid, offset):
+        """
+        Sets a player's time offset, moving all of their deadlines at once.
+        """
+        earliest = self.peek()
+        if offset:
+            self.offsets[pid] = offset
+        else:
+            self.offsets.pop(pid, None)
+        self._refresh(pid, earliest)
+
+    def peek(self):
+        """
+        Returns the earliest live deadline, or None if nothing is upgrading.
+        """
+        while self.heap:
+            due, base, pid = self.heap[0]
+            if self.heads.get(pid) == (due, base):
+                if self.current(pid, self.timers[pid][0][1]) == base:
+                    return due
+                # The player's earliest timer has changed since
+                heappop(self.heap)
+                del self.heads[pid]
+                self._refresh(pid)
+            else:
+                heappop(self.heap)
+        return None
+
+    def pop_expired(self, cur_time):
+        """
+        Removes and returns (pid, slot) for every live deadline <= cur_time.
+        """
+        expired = {}
+        while True:
+            due = self.peek()
+            if due is None or due > cur_time:
+                return list(expired)
+            _, _, pid = heappop(self.heap)
+            del self.heads[pid]
+            timers = self.timers[pid]
+            limit = cur_time + self.offsets.get(pid, 0)
+            while timers and timers[0][0] <= limit:
+                until, slot = heappop(timers)
+                if self.current(pid, slot) == until:
+                    expired[pid, slot] = None  # Drops duplicate pushes
+            self._refresh(pid)
+
+    async def sleep(self):
+        """
+        Sleeps until the earliest deadline, or until an earlier one is added.
+        """
+        self.wake.clear()
+        until = self.peek()
+        try:
+            await wait_for(
+                self.wake.wait(),
+                None if until is None else max(0, until - time())
+            )
+        except TimeoutError:
+            pass
+
+    def _refresh(self, pid, earliest=None):
+        """
+        Drops a player's dead timers, and gives their earliest live timer a
+        top-level entry if it doesn't have an up to date one. Wakes the
+        scheduler if that is due before earliest.
+        """
+        timers = self.timers.get(pid)
+        while timers and self.current(pid, timers[0][1]) != timers[0][0]:
+            heappop(timers)
+        if not timers:
+            self.timers.pop(pid, None)
+            self.heads.pop(pid, None)
+            return
+        base = timers[0][0]
+        head = (base - self.offsets.get(pid, 0), base)
+        if self.heads.get(pid) != head:
+            self.heads[pid] = head
+            heappush(self.heap, (*head, pid))
+            if earliest is None or head[0] < earliest:
+                self.wake.set()
@@ -0,0 +1,50 @@
+from time import time
+
+import metrics
+import planets
+from converters import numformat, to_dhm
+
+
+@metrics.timed("hs_forecast_seconds")
+async def forecast(inter, credits, duration):
+    """
+    Projects a player's credit cap, income and banked credits forward
+    through their running upgrades, and when they will hit the credit cap.
+    Takes duration in seconds; 0 projects to the last running upgrade.
+    """
+    caller_id = str(inter.author.id)
+    await planets.player_snapshot(caller_id)  # Creates new players
+    timeline = planets._player_timeline(caller_id)
+    cur_time = int(time())
+
+    when = cur_time + duration
+    if not duration:
+        when = max(cur_time, timeline.end() or 0)
+    cur_cc, _ = timeline.cap_at(cur_time)
+    cc, _ = timeline.cap_at(when)
+    cur_income = timeline.income_at(cur_time)
+    income = timeline.income_at(when)
+    banked = timeline.credits_at(credits, cur_time, when)
+    completed = timeline.completed(cur_time, when)
+
+    full = timeline.cap_reached(credits, cur_time)
+    if full is None:
+        full_str = "Credit Cap is never reached without shipment income."
+    elif full <= cur_time:
+        full_str = "Credit Cap already reached."
+    else:
+        full_str = (
+            f"Credit Cap reached <t:{full}:f> "
+            f"({to_dhm(full - cur_time)})."
+        )
+
+    await inter.response.send_message(
+        f"Now: {numformat(cur_cc)} CR cap, "
+        f"{numformat(cur_income)} CR/h income\n"
+        f"At <t:{when}:f> ({to_dhm(when - cur_time)}), after "
+        f"{completed} more upgrades: {numformat(cc)} CR cap, "
+        f"{numformat(income)} CR/h income, "
+        f"{numformat(int(banked))} CR banked\n"
+        f"{full_str}"
+    )
+
@@ -0,0 +1,282 @@
+"""
+Static game data: shipment values, art drop rates and research modules.
+
+Usage: python gamedata.py
+
+Validates planet_shipments.json, art_drops.json and research_info.json and
+compiles them, along with the tables derived from them, into one versioned
+snapshot (game_data.pickle). Importing this module loads the snapshot, or
+the JSON files if any of them is newer than the snapshot (or there is no
+snapshot), and fills in the shipment table in rules.
+"""
+import json
+import pickle
+from asyncio import to_thread
+from hashlib import sha256
+from os import path, replace, stat
+from time import perf_counter
+
+import metrics
+from rules import SHIPMENT_VALUE, shipment_table
+
+
+SOURCES = {
+    "shipments": "planet_shipments.json",
+    "art_drops": "art_drops.json",
+    "research": "research_info.json",
+}
+SNAPSHOT = "game_data.pickle"
+VERSION = 2  # Bump whenever the tables' layout changes
+
+CATEGORIES = ["Trade", "Mining", "Weapons", "Shields", "Support"]
+COLORS = {
+    "Trade": "Blues", "Mining": "Blues",
+    "Weapons": "Orbs", "Shields": "Orbs",
+    "Support": "Tets"
+}
+ART_LEVELS = 11
+
+TABLES = None  # Table name -> table, see compile_tables
+LOADED_FROM = None  # "snapshot" or "json"
+LOAD_SECONDS = None
+SOURCE_STATE = {}  # JSON filename -> (mtime, sha256) when last checked
+ON_RELOAD = []  # Functions called after new tables are swapped in
+
+metrics.gauge(
+    "hs_game_data_load_seconds", lambda: LOAD_SECONDS,
+    "Time taken to load the static game data at startup."
+)
+
+
+def compile_tables(shipments, art_drops, research):
+    """
+    Validates the JSON files' contents and returns every table built from
+    them. Raises ValueError naming the file and entry at fault.
+    """
+    _check_art_drops(art_drops)
+    _check_research(research)
+    return {
+        "shipments": shipment_table(shipments, SOURCES["shipments"]),
+        "art_drops": art_drops,
+        "research": research,
+        # Per color, [art level - 1][research level - 1] -> arts per drop
+        "avg_drop": {  # Average plus 20% bonus
+            color: [[sum(drop) * 0.6 for drop in row] for row in rows]
+            for color, rows in art_drops.items()
+        },
+        # Module name -> (category, research level, requirement)
+        "modules": {
+            name: (category, level, req)
+            for category, modules in research.items()
+            for name, level, req in modules
+        },
+    }
+
+
+def read_sources():
+    """
+    Returns the tables compiled from the JSON files.
+    """
+    contents = {}
+    for key, filename in SOURCES.items():
+        with open(filename) as f:
+            contents[key] = json.load(f)
+    return compile_tables(**contents)
+
+
+def build(snapshot=SNAPSHOT):
+    """
+    Compiles the JSON files into the snapshot.
+    """
+    tables = read_sources()
+    with open(snapshot + ".tmp", "wb") as f:
+        pickle.dump(
+            {"version": VERSION, "tables": tables}, f,
+            protocol=pickle.HIGHEST_PROTOCOL
+        )
+    replace(snapshot + ".tmp", snapshot)
+    return tables
+
+
+def load(snapshot=SNAPSHOT):
+    """
+    Returns the tables and where they came from ("snapshot" or "json").
+    """
+    if snapshot_current(snapshot):
+        try:
+            with open(snapshot, "rb") as f:
+                data = pickle.load(f)
+            if data["version"] == VERSION:
+                return data["tables"], "snapshot"
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError):
+            pass
+        print(f"Ignoring unreadable {snapshot}, rebuild it with gamedata.py")
+    return read_sources(), "json"
+
+
+def snapshot_current(snapshot=SNAPSHOT):
+    """
+    Returns whether the snapshot exists and is newer than every JSON file.
+    """
+    if not path.exists(snapshot):
+        return False
+    built = path.getmtime(snapshot)
+    return all(
+        path.getmtime(filename) <= built for filename in SOURCES.values()
+    )
+
+
+def install(tables):
+    """
+    Makes tables the game data in use.
+    """
+    global TABLES
+    # In place, so every module holding SHIPMENT_VALUE sees the new values
+    SHIPMENT_VALUE[:] = tables["shipments"]
+    TABLES = tables
+
+
+async def reload(force=False):
+    """
+    Swaps in new tables if any JSON file's contents have changed (or if
+    forced), and returns the changed files. Files are hashed, parsed and
+    validated on a worker thread. Raises ValueError or OSError, keeping the
+    current tables, if the new files can't be used.
+    """
+    global SOURCE_STATE
+    state = await to_thread(_source_state, SOURCE_STATE)
+    changed = [
+        filename for filename, (_, digest) in state.items()
+        if SOURCE_STATE.get(filename, (None, None))[1] != digest
+    ]
+    # Recorded first, so a broken file is only reported once
+    SOURCE_STATE = state
+    if changed or force:
+        tables = await to_thread(read_sources)
+        # No await between these, so commands see either the old tables
+        # and caches or the new ones
+        install(tables)
+        for hook in ON_RELOAD:
+            hook()
+    return changed
+
+
+async def check_for_changes():
+    """
+    Reloads changed JSON files, logging what happened.
+    """
+    try:
+        changed = await reload()
+    except (OSError, ValueError) as e:
+        print(f"Not reloading game data: {e}")
+    else:
+        if changed:
+            print(f"Reloaded game data: {', '.join(changed)}")
+
+
+async def reload_game_data(inter):
+    """
+    Reloads the game data files, reporting what changed.
+    """
+    try:
+        changed = await reload(force=True)
+    except (OSError, ValueError) as e:
+        await inter.response.send_message(
+            f"Game data not reloaded, still using the old data:\n{e}"
+        )
+        return
+    await inter.response.send_message(
+        "Reloaded game data. " + (
+            f"Changed: {', '.join(changed)}." if changed
+            else "No files had changed."
+        )
+    )
+
+
+def _source_state(previous):
+    """
+    Returns {filename: (mtime, sha256)} for the JSON files, only hashing
+    files whose mtime differs from previous.
+    """
+    state = {}
+    for filename in SOURCES.values():
+        mtime = stat(filename).st_mtime_ns
+        if previous.get(filename, (None, None))[0] == mtime:
+            state[filename] = previous[filename]
+        else:
+            with open(filename, "rb") as f:
+                state[filename] = (mtime, sha256(f.read()).hexdigest())
+    return state
+
+
+def _check_art_drops(art_drops, filename=SOURCES["art_drops"]):
+    """
+    Every color needs one row per art level, with one [min, max] drop range
+    per research level the art can drop.
+    """
+    for color in set(COLORS.values()):
+        rows = art_drops.get(color)
+        if rows is None or len(rows) != ART_LEVELS:
+            raise ValueError(
+                f"{filename}: expected {ART_LEVELS} art levels for {color}."
+            )
+        for art_level, row in enumerate(rows, start=1):
+            if len(row) != art_level:
+                raise ValueError(
+                    f"{filename}: {color} level {art_level} has {len(row)} "
+                    f"drop ranges, expected {art_level}."
+                )
+            for level, drop in enumerate(row, start=1):
+                if (
+                    len(drop) != 2 or
+                    not all(isinstance(n, int) for n in drop) or
+                    not 0 <= drop[0] <= drop[1] or drop[1] == 0
+                ):
+                    raise ValueError(
+                        f"{filename}: {color} level {art_level} r{level} has "
+                        f"invalid drop range {drop!r}."
+                    )
+
+
+def _check_research(research, filename=SOURCES["research"]):
+    """
+    Every category lists [name, research level, requirement] modules, with
+    names unique across categories.
+    """
+    names = set()
+    for category in CATEGORIES:
+        if category not in research:
+            raise ValueError(f"{filename}: missing {category} modules.")
+        for module in research[category]:
+            if (
+                len(module) != 3 or not isinstance(module[0], str) or
+                not isinstance(module[1], int) or
+                not 0 <= module[1] <= ART_LEVELS or
+                not isinstance(module[2], int) or module[2] < 0
+            ):
+                raise ValueError(
+                    f"{filename}: {category} has invalid module {module!r}."
+                )
+            if module[0] in names:
+                raise ValueError(
+                    f"{filename}: duplicate module name {module[0]!r}."
+                )
+            names.add(module[0])
+
+
+def _startup():
+    global LOADED_FROM, LOAD_SECONDS, SOURCE_STATE
+    start = perf_counter()
+    SOURCE_STATE = _source_state({})
+    tables, LOADED_FROM = load()
+    install(tables)
+    LOAD_SECONDS = perf_counter() - start
+
+
+_startup()
+
+
+if __name__ == "__main__":
+    start = perf_counter()
+    build()
+    print(f"Wrote {SNAPSHOT} in {perf_counter() - start:.3f}s")
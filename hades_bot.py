@@ -5,9 +5,16 @@ import disnake
 from disnake.ext import commands, tasks
 from dotenv import load_dotenv
 
+import analytics
+import capture
 import converters
+import forecast
+import gamedata
+import metrics
 import planets
 import research
+import simulation
+from store import ConflictError
 
 
 logging.basicConfig(level=logging.WARNING)
@@ -27,23 +34,49 @@ class HSCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.scan.start()
+        self.compact.start()
+        self.sync.start()
+        self.watch_game_data.start()
 
     def cog_unload(self):
         self.scan.cancel()
+        self.compact.cancel()
+        self.sync.cancel()
+        self.watch_game_data.cancel()
+        planets.flush_player_info()
+        capture.stop(planets.dump_player_info)
 
-    @tasks.loop(minutes=5.0)
+    @tasks.loop()
     async def scan(self):
+        await planets.wait_for_next_upgrade()
         await planets.check_planet_upgrade_status(self.channel)
 
+    @tasks.loop(minutes=30.0)
+    async def compact(self):
+        await planets.compact_player_info()
+
+    @tasks.loop(seconds=1.0)
+    async def sync(self):
+        # Only does anything with SHARED_STORE=1
+        await planets.sync_player_info()
+
+    @tasks.loop(minutes=1.0)
+    async def watch_game_data(self):
+        await gamedata.check_for_changes()
+
     @scan.before_loop
     async def before_scan(self):
         print("HS Cog waiting...")
+        await planets.load_player_info()
+        await metrics.start()
+        await capture.start(planets.dump_player_info)
         await self.bot.wait_until_ready()
         print("HS Cog ready!")
         self.channel = self.bot.get_channel(1097421379005063268)
         if self.channel is None:
             print("Destination channel not found...")
-            self.cog_unload()
+            # Only upgrade alerts need the channel; the other loops go on
+            self.scan.cancel()
 
 bot.add_cog(HSCog(bot))
 
@@ -63,15 +96,34 @@ async def info_error(ctx, error):
 ### HS Slash Commands
 
 @bot.slash_command()
+@metrics.timed("hs_command_seconds", command="hs")
 async def hs(inter):
-    # Check for any completed upgrades
+    # Check for any completed upgrades (a heap peek when none are due)
     await planets.check_planet_upgrade_status(inter.channel)
     pass
 
 
+@hs.error
+async def hs_error(inter, error):
+    if isinstance(getattr(error, "original", None), ConflictError):
+        # Another process sharing the store kept changing the same players
+        await inter.response.send_message(
+            "Your data was being changed elsewhere at the same time, "
+            "please retry."
+        )
+        return
+    # A local handler replaces the bot's default, which prints these
+    logging.error(
+        "Ignoring exception in slash command %r",
+        inter.application_command.name, exc_info=error
+    )
+
+
 @hs.sub_command(description=(
     "Starts an upgrade timer for an added planet."
 ))
+@metrics.timed("hs_command_seconds", command="upgrade_planet")
+@capture.recorded("upgrade_planet")
 async def upgrade_planet(
     inter,
     planet_name: str,
@@ -84,6 +136,8 @@ async def upgrade_planet(
     "Shifts all upgrade times forwards. "
     "Useful to correct discrepancies due to TM usage."
 ))
+@metrics.timed("hs_command_seconds", command="shift_upgrade_times")
+@capture.recorded("shift_upgrade_times")
 async def shift_upgrade_times(
     inter,
     duration: str = commands.Param(converter=converters.duration)
@@ -91,9 +145,24 @@ async def shift_upgrade_times(
     await planets.shift_upgrade_times(inter, duration)
 
 
+@hs.sub_command(description=(
+    "Admin: shifts everyone's upgrade times forwards after an alliance TM."
+))
+@commands.has_permissions(manage_guild=True)
+@metrics.timed("hs_command_seconds", command="shift_all_upgrade_times")
+@capture.recorded("shift_all_upgrade_times")
+async def shift_all_upgrade_times(
+    inter,
+    duration: str = commands.Param(converter=converters.duration)
+):
+    await planets.shift_all_upgrade_times(inter, duration)
+
+
 @hs.sub_command(description=(
     "Adds or overwrites a planet on your list."
 ))
+@metrics.timed("hs_command_seconds", command="add_planet")
+@capture.recorded("add_planet")
 async def add_planet(
     inter,
     planet_name: str,
@@ -110,6 +179,8 @@ async def add_planet(
 @hs.sub_command(description=(
     "Gives an overview of your planets."
 ))
+@metrics.timed("hs_command_seconds", command="list_planets")
+@capture.recorded("list_planets")
 async def list_planets(inter):
     await planets.list_planets(inter)
 
@@ -117,13 +188,107 @@ async def list_planets(inter):
 @hs.sub_command(description=(
     "Shows detailed upgrade info, including CC and suggested planet upgrade."
 ))
+@metrics.timed("hs_command_seconds", command="upgrade_details")
+@capture.recorded("upgrade_details")
 async def upgrade_details(inter):
     await planets.upgrade_details(inter)
 
 
+@hs.sub_command(description=(
+    "Shows your credit and hydro cap at a time, after upgrades due by then."
+))
+@metrics.timed("hs_command_seconds", command="cap_at")
+@capture.recorded("cap_at")
+async def cap_at(
+    inter,
+    duration: str = commands.Param(converter=converters.duration)
+):
+    await planets.cap_at(inter, duration)
+
+
+@hs.sub_command(name="forecast", description=(
+    "Projects your credit cap and income, and when credits hit the cap."
+))
+@metrics.timed("hs_command_seconds", command="forecast")
+@capture.recorded("forecast")
+async def forecast_income(
+    inter,
+    credits: commands.Range[0, 10**12] = 0,
+    duration: str = commands.Param(default=0, converter=converters.duration)
+):
+    await forecast.forecast(inter, credits, duration)
+
+
+@hs.sub_command(description=(
+    "Plans which planets to upgrade, in order, for a budget and duration."
+))
+@metrics.timed("hs_command_seconds", command="plan_upgrades")
+@capture.recorded("plan_upgrades")
+async def plan_upgrades(
+    inter,
+    budget: commands.Range[1, 10**12],
+    duration: str = commands.Param(converter=converters.duration),
+    concurrent: commands.Range[1, 16] = 1,
+    objective: str = commands.Param(
+        default="cap", choices={"Credit Cap": "cap", "Income": "income"}
+    )
+):
+    await planets.plan_upgrades(
+        inter, budget, duration, concurrent, objective
+    )
+
+
+@hs.sub_command(description=(
+    "Ranks players by cap, shipments or maxed planets, with your rank."
+))
+@metrics.timed("hs_command_seconds", command="leaderboard")
+@capture.recorded("leaderboard")
+async def leaderboard(
+    inter,
+    board: str = commands.Param(choices={
+        "Credit Cap": "cc", "Hydro Cap": "hc",
+        "Hourly Shipments": "income", "Maxed Planets": "maxed"
+    }),
+    count: commands.Range[1, 25] = 10
+):
+    await planets.leaderboard(inter, board, count)
+
+
+@hs.sub_command(description=(
+    "Admin: summarizes caps, upgrades and shipments across all players."
+))
+@commands.has_permissions(manage_guild=True)
+@metrics.timed("hs_command_seconds", command="guild_report")
+@capture.recorded("guild_report")
+async def guild_report(inter):
+    await analytics.guild_report(inter)
+
+
+@hs.sub_command(description=(
+    "Admin: shows upgrade notification queue and send latency."
+))
+@commands.has_permissions(manage_guild=True)
+@metrics.timed("hs_command_seconds", command="notification_stats")
+@capture.recorded("notification_stats")
+async def notification_stats(inter):
+    await planets.notification_stats(inter)
+
+
+@hs.sub_command(description=(
+    "Admin: reloads shipment, art drop and research data files."
+))
+@commands.has_permissions(manage_guild=True)
+@metrics.timed("hs_command_seconds", command="reload_game_data")
+@capture.recorded("reload_game_data")
+async def reload_game_data(inter):
+    await gamedata.reload_game_data(inter)
+
+
 @hs.sub_command(description=(
     "Computes how many arts you still need to research."
 ))
+@metrics.timed("hs_command_seconds", command="artifact_count")
+@capture.recorded("artifact_count")
 async def artifact_count(
     inter,
     art_level: commands.Range[1, 11],
@@ -138,6 +303,94 @@ async def artifact_count(
     )
 
 
+@hs.sub_command(description=(
+    "Lists how many arts you still need at every art level."
+))
+@metrics.timed("hs_command_seconds", command="artifact_table")
+@capture.recorded("artifact_table")
+async def artifact_table(
+    inter,
+    trade: str,
+    mining: str,
+    weapons: str,
+    shields: str,
+    support: str
+):
+    await research.artifact_table(
+        inter, trade, mining, weapons, shields, support
+    )
+
+
+@hs.sub_command(description=(
+    "Simulates art drops for likely (p50/p90/p99) art counts."
+))
+@metrics.timed("hs_command_seconds", command="artifact_simulation")
+@capture.recorded("artifact_simulation")
+async def artifact_simulation(
+    inter,
+    art_level: commands.Range[1, 11],
+    trade: str,
+    mining: str,
+    weapons: str,
+    shields: str,
+    support: str,
+    seed: commands.Range[0, 2**32 - 1] = None
+):
+    await simulation.artifact_simulation(
+        inter, art_level, trade, mining, weapons, shields, support, seed
+    )
+
+
+@hs.sub_command_group()
+async def blueprints(inter):
+    pass
+
+
+async def autocomplete_module(inter, name: str):
+    return research.module_names(name)
+
+
+@blueprints.sub_command(name="set", description=(
+    "Saves how many blueprints you have for one research module."
+))
+@metrics.timed("hs_command_seconds", command="blueprints_set")
+@capture.recorded("blueprints_set")
+async def set_blueprint(
+    inter,
+    module: str = commands.Param(autocomplete=autocomplete_module),
+    count: commands.Range[0, 10**6] = commands.Param(),
+    art_level: commands.Range[1, 11] = 11
+):
+    await research.set_blueprint(inter, module, count, art_level)
+
+
+@blueprints.sub_command(name="import", description=(
+    "Saves blueprint counts for every module at once."
+))
+@metrics.timed("hs_command_seconds", command="blueprints_import")
+@capture.recorded("blueprints_import")
+async def import_blueprints(
+    inter,
+    trade: str,
+    mining: str,
+    weapons: str,
+    shields: str,
+    support: str
+):
+    await research.import_blueprints(
+        inter, trade, mining, weapons, shields, support
+    )
+
+
+@blueprints.sub_command(name="arts", description=(
+    "Computes how many arts you still need for your saved blueprints."
+))
+@metrics.timed("hs_command_seconds", command="blueprints_arts")
+@capture.recorded("blueprints_arts")
+async def saved_artifact_count(inter, art_level: commands.Range[1, 11]):
+    await research.saved_artifact_count(inter, art_level)
+
+
 @hs.sub_command_group()
 async def settings(inter):
     pass
@@ -146,11 +399,15 @@ async def settings(inter):
 @settings.sub_command(description=(
     "Set whether you want to be pinged when a planet upgrade completes."
 ))
+@metrics.timed("hs_command_seconds", command="ping_upgraded")
+@capture.recorded("ping_upgraded")
 async def ping_upgraded(inter, flag: bool):
     await planets.change_bool_settings(inter, "ping_when_upgraded", flag)
 
 
 @settings.sub_command(description="Lists your settings.")
+@metrics.timed("hs_command_seconds", command="view")
+@capture.recorded("view")
 async def view(inter):
     await planets.view_settings(inter)
 
@@ -158,5 +415,11 @@ async def view(inter):
 ### Main
 
 if __name__ == "__main__":
+    print(
+        f"Game data loaded from {gamedata.LOADED_FROM} in "
+        f"{gamedata.LOAD_SECONDS * 1000:.1f}ms"
+    )
     load_dotenv()
     bot.run(getenv("API_ACCESS"))
+    planets.flush_player_info()
+    capture.stop(planets.dump_player_info)
@@ -0,0 +1,180 @@
+"""
+Latency histograms and counters, exported in Prometheus text format.
+
+Turned on by setting METRICS_PORT (serve /metrics over HTTP on localhost)
+and/or METRICS_FILE (rewrite the file every METRICS_INTERVAL seconds).
+While off, instrumented functions pay for a single global check.
+"""
+from asyncio import get_running_loop, sleep, start_server
+from bisect import bisect_left
+from functools import wraps
+from inspect import iscoroutinefunction
+from os import getenv, replace
+from time import perf_counter
+
+
+ENABLED = False
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+HISTOGRAMS = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+COUNTERS = {}  # (name, labels) -> value
+GAUGES = {}  # (name, labels) -> function returning the current value
+HELP = {}
+
+
+def observe(name, seconds, **labels):
+    """
+    Records a duration in a histogram.
+    """
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    hist = HISTOGRAMS.get(key)
+    if hist is None:
+        hist = HISTOGRAMS[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+    hist[bisect_left(BUCKETS, seconds)] += 1
+    hist[-1] += seconds
+
+
+def inc(name, amount=1, **labels):
+    """
+    Adds to a counter.
+    """
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    COUNTERS[key] = COUNTERS.get(key, 0) + amount
+
+
+def gauge(name, func, help=""):
+    """
+    Registers a gauge whose value is read from func at export time.
+    """
+    GAUGES[name, ()] = func
+    HELP[name] = help
+
+
+def timed(name, **labels):
+    """
+    Decorator recording each call's duration in the name histogram.
+    Works on both functions and coroutine functions.
+    """
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await func(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe(name, perf_counter() - start, **labels)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return func(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    observe(name, perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+def export():
+    """
+    Returns every metric in Prometheus text exposition format.
+    """
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            if HELP.get(name):
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), hist in sorted(HISTOGRAMS.items()):
+        header(name, "histogram")
+        total = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), hist):
+            total += count
+            lines.append(
+                f"{name}_bucket{_labels(labels, le=bound)} {total}"
+            )
+        lines.append(f"{name}_sum{_labels(labels)} {hist[-1]}")
+        lines.append(f"{name}_count{_labels(labels)} {total}")
+    for (name, labels), value in sorted(COUNTERS.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), func in sorted(GAUGES.items()):
+        header(name, "gauge")
+        lines.append(f"{name}{_labels(labels)} {func()}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+### Exporters
+
+async def start():
+    """
+    Turns metrics on if configured, and starts the exporters and the
+    event loop lag monitor. Returns whether metrics are on.
+    """
+    global ENABLED
+    port, filename = getenv("METRICS_PORT"), getenv("METRICS_FILE")
+    if not port and not filename:
+        return False
+    ENABLED = True
+    loop = get_running_loop()
+    loop.create_task(_monitor_lag())
+    if port:
+        await start_server(_serve, "127.0.0.1", int(port))
+    if filename:
+        loop.create_task(
+            _dump(filename, float(getenv("METRICS_INTERVAL", "60")))
+        )
+    return True
+
+
+async def _serve(reader, writer):
+    # Minimal HTTP: every request gets the metrics page
+    await reader.readline()
+    body = export().encode()
+    writer.write(
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: text/plain; version=0.0.4\r\n"
+        b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+        b"Connection: close\r\n\r\n" + body
+    )
+    await writer.drain()
+    writer.close()
+
+
+async def _dump(filename, interval):
+    while True:
+        await sleep(interval)
+        with open(filename + ".tmp", "w") as f:
+            f.write(export())
+        replace(filename + ".tmp", filename)
+
+
+async def _monitor_lag(interval=0.5):
+    """
+    Records how late the event loop wakes a sleeping task.
+    """
+    while True:
+        start = perf_counter()
+        await sleep(interval)
+        observe("hs_event_loop_lag_seconds", perf_counter() - start - interval)
@@ -0,0 +1,99 @@
+from asyncio import Queue, get_running_loop, sleep
+from time import perf_counter
+
+import metrics
+
+
+class Dispatcher:
+    """
+    Sends upgrade notifications without holding up the caller.
+
+    Notifications are queued per (channel, player). Everything queued for a
+    player before a worker picks them up is merged into one message. At
+    most concurrency messages are in flight at once, and failed sends are
+    retried with exponential backoff (or after the server's retry_after).
+    """
+    def __init__(self, concurrency=4, retries=3, backoff=1.0):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.pending = {}  # (channel id, pid) -> [channel, lines, footer]
+        self.queue = None
+        self.loop = None
+        self.workers = []
+        # Counters
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def notify(self, channel, pid, lines, footer=""):
+        """
+        Queues lines for a player, replacing any earlier queued footer.
+        """
+        loop = get_running_loop()
+        if self.loop is not loop:
+            self._start(loop)
+        key = (channel.id, pid)
+        if key in self.pending:
+            self.pending[key][1].extend(lines)
+            self.pending[key][2] = footer
+            return
+        self.pending[key] = [channel, list(lines), footer]
+        self.queue.put_nowait(key)
+
+    def stats(self):
+        """
+        Returns the dispatcher's counters.
+        """
+        return {
+            "queue_depth": len(self.pending),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "send_latency_avg": self.latency_total / max(1, self.sent),
+            "send_latency_max": self.latency_max,
+        }
+
+    def _start(self, loop):
+        # Workers per event loop: a new loop (e.g. the bot restarted in the
+        # same process) gets its own, which pick up anything still pending
+        self.loop = loop
+        self.queue = Queue()
+        for key in self.pending:
+            self.queue.put_nowait(key)
+        self.workers = [
+            loop.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+
+    async def _work(self):
+        while True:
+            key = await self.queue.get()
+            channel, lines, footer = self.pending.pop(key)
+            message = "\n".join([f"<@{key[1]}> " + lines[0]] + lines[1:])
+            if footer:
+                message += "\n" + footer
+            await self._send(channel, message)
+            self.queue.task_done()
+
+    async def _send(self, channel, message):
+        for attempt in range(self.retries + 1):
+            start = perf_counter()
+            try:
+                await channel.send(message)
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"Failed to send notification: {e}")
+                    self.failed += 1
+                    return
+                self.retried += 1
+                delay = getattr(e, "retry_after", None)
+                await sleep(delay or self.backoff * 2 ** attempt)
+            else:
+                elapsed = perf_counter() - start
+                self.sent += 1
+                self.latency_total += elapsed
+                self.latency_max = max(self.latency_max, elapsed)
+                metrics.observe("hs_notification_send_seconds", elapsed)
+                return
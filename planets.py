@@ -1,54 +1,134 @@
-from enum import Enum
+from asyncio import sleep, to_thread
 from json import dump, load
+from os import getenv, replace
 from time import time
 
+from disnake import AllowedMentions
+
+import gamedata  # Fills in SHIPMENT_VALUE
+import metrics
 from converters import numformat, to_dhm
+from deadlines import DeadlineIndex
+from notifications import Dispatcher
+from player import Player
+from player_cache import PlayerCache
+from planner import plan_upgrades as plan_upgrade_schedule
+from ranking import Board
+from rules import (
+    CREDIT_STORAGE, HYDRO_STORAGE, MAX_LEVEL, PORDER, PTYPE, SHIPMENT_VALUE,
+    UPGRADE_COST, UPGRADE_DURATION, shipment_base
+)
+from state import StateActor
+from timeline import Timeline
+from store import (
+    ConflictError, FileLock, WriteBehind, apply_record, open_store
+)
 
 
-PTYPE = Enum("PTYPE", ["Desert", "Fire", "Water", "Terran", "Gas", "Ice"])
 PTYPE_EMOJI = ["", "🏜️", "🔥", "💧", "🌎", "🪐", "🧊"]
 
-PORDER = [
-    (PTYPE.Desert, 1, ""),
-    (PTYPE.Fire,   1, ""),
-    (PTYPE.Water,  1, ""),
-    (PTYPE.Terran, 1, ""),
-    (PTYPE.Gas,    2, ""),
-    (PTYPE.Terran, 3, ""),
-    (PTYPE.Fire,   3, ""),
-    (PTYPE.Water,  3, ""),
-    (PTYPE.Gas,    4, ""),
-    (PTYPE.Desert, 3, ""),
-    (PTYPE.Fire,   4, ""),
-    (PTYPE.Desert, 4, ""),
-    (PTYPE.Water,  4, ""),
-    (PTYPE.Terran, 4, ""),
-    (PTYPE.Ice,    4, "a"),
-    (PTYPE.Ice,    4, "b")
+# Per slot: (shipment table offset, has hydro storage, max level)
+SLOT_SCORING = [
+    (shipment_base(ptype, ptier), ptype != PTYPE.Fire, MAX_LEVEL[ptier])
+    for ptype, ptier, _ in PORDER
 ]
-
-PLANET_SHIPMENTS = None
+PLAN_LINES = 15  # Keeps plans within Discord's message length
 PLAYER_INFO = None
+STORE = None
+WRITER = None  # Writes STORE changes off the event loop
+CAPS = {}  # pid -> [cur_cc, fut_cc, cur_hc, fut_hc], filled on first use
+SNAPSHOTS = {}  # pid -> read-only Player, until the player next changes
+TIMELINES = {}  # pid -> Timeline, until the player next changes
+# Per-player values derived from PLAYER_INFO, forgotten with the player
+DERIVED = [CAPS, SNAPSHOTS, TIMELINES]
+# Derived values dropped whenever the player changes
+VOLATILE = [SNAPSHOTS, TIMELINES]
+VERIFY_CAPS = False
+# Leaderboards, in the order of _planet_scores, kept up to date as planets
+# change and saved alongside the store (see _read_boards)
+BOARDS = {"cc": Board(), "hc": Board(), "income": Board(), "maxed": Board()}
+BOARD_TITLES = {
+    "cc": ("Credit Cap", "CR"),
+    "hc": ("Hydro Cap", "H"),
+    "income": ("Hourly Shipments", "CR/h"),
+    "maxed": ("Maxed Planets", "planets"),
+}
+RANKED_SHIPMENTS = None  # SHIPMENT_VALUE the income board was ranked with
+STATE = StateActor()  # Applies every change to PLAYER_INFO, in order
+# With SHARED_STORE=1, several bot processes share one store
+SHARED = False
+POSITION = None  # How far this process has followed STORE's change log
+PENDING = []  # Records of the change being applied, if SHARED
+LEADER = FileLock("player_info.leader")  # Held by the process that scans
+LEADING = False
+LEADER_RETRY = 5.0  # Seconds between a follower's attempts to take over
+DISPATCHER = Dispatcher()
+DEADLINES = DeadlineIndex(
+    lambda pid, slot: PLAYER_INFO[pid].base_until(slot)
+)
+
+# Timelines read SHIPMENT_VALUE
+gamedata.ON_RELOAD.append(TIMELINES.clear)
+
+metrics.gauge(
+    "hs_players_loaded", lambda: len(PLAYER_INFO or ()),
+    "Players currently held in memory."
+)
+metrics.gauge(
+    "hs_player_cache_misses",
+    lambda: getattr(PLAYER_INFO, "misses", 0),
+    "Player lookups that had to read from the store (PLAYER_CACHE_SIZE)."
+)
+metrics.gauge(
+    "hs_scan_leader", lambda: int(LEADING or not SHARED),
+    "Whether this process runs the upgrade scan and compaction."
+)
+metrics.gauge(
+    "hs_state_queue_depth", lambda: STATE.stats()["queue_depth"],
+    "Player state changes waiting to be applied."
+)
+metrics.gauge(
+    "hs_notification_queue_depth", lambda: len(DISPATCHER.pending),
+    "Players with upgrade notifications waiting to be sent."
+)
+metrics.gauge(
+    "hs_notifications_sent", lambda: DISPATCHER.sent,
+    "Upgrade notification messages sent."
+)
+metrics.gauge(
+    "hs_notifications_failed", lambda: DISPATCHER.failed,
+    "Upgrade notification messages dropped after retries."
+)
 
 ### Planets
 
 def create_player_if_not_exists(caller_id):
     """
     Creates a player if they do not already exist.
-    Default values as shown.
+    Default values as shown. A change: call it through STATE.
     """
     global PLAYER_INFO
     
     _read_player_info()
     if caller_id not in PLAYER_INFO:
-        PLAYER_INFO[caller_id] = {
-            # [Name, Level, Upgrade Until]
-            "planets": [[None, 0, None] for _ in range(len(PORDER))],
-            "settings": {
-                "ping_when_upgraded": False
-            }
-        }
-        _write_player_info()
+        PLAYER_INFO[caller_id] = Player(len(PORDER))
+        _forget(caller_id)
+        _rank_player(caller_id, PLAYER_INFO[caller_id])
+        _log_change("player", caller_id, PLAYER_INFO[caller_id].to_json())
+
+
+async def player_snapshot(caller_id):
+    """
+    Returns a read-only copy of a player for read-only commands, shared
+    until the player next changes, so readers never wait on STATE.
+    Only a new player's first command waits, to have them created.
+    """
+    if caller_id not in SNAPSHOTS:
+        _read_player_info()
+        if caller_id not in PLAYER_INFO:
+            await STATE.submit(create_player_if_not_exists, caller_id)
+        SNAPSHOTS[caller_id] = PLAYER_INFO[caller_id].snapshot()
+    return SNAPSHOTS[caller_id]
 
 
 async def upgrade_planet(inter, planet_name, duration):
@@ -56,59 +136,57 @@ async def upgrade_planet(inter, planet_name, duration):
     Sets a player's planet as upgrading.
     Takes duration in seconds.
     """
+    caller_id = str(inter.author.id)
+    await inter.response.send_message(
+        await STATE.submit(_upgrade_planet, caller_id, planet_name, duration)
+    )
+
+
+def _upgrade_planet(caller_id, planet_name, duration):
     global PLAYER_INFO
     
-    caller_id = str(inter.author.id)
     create_player_if_not_exists(caller_id)
     
     # Validate planet
-    planets = PLAYER_INFO[caller_id]["planets"]
-    pnames = list(zip(*planets))[0]
-    if planet_name not in pnames:
-        await inter.response.send_message(
-            "Planet name not found. Make sure the planet is added first."
-        )
-        return
-    
-    pnum = pnames.index(planet_name)
+    player = PLAYER_INFO[caller_id]
+    pnum = player.slot_of(planet_name)
+    if pnum is None:
+        return "Planet name not found. Make sure the planet is added first."
 
     # Validate level
-    if planets[pnum][1] >= _max_planet_level(PORDER[pnum][1]):
-        await inter.response.send_message(
-            "This planet is already at max level!"
-        )
-        return
+    level = player.levels[pnum]
+    if level >= MAX_LEVEL[PORDER[pnum][1]]:
+        return "This planet is already at max level!"
 
     # Validate duration
     if duration <= 0:
-        duration = _upgrade_duration(planets[pnum][1])
+        duration = UPGRADE_DURATION[level]
     
     # Write to file
-    old_upgrade_time = planets[pnum][2]
-    planets[pnum][2] = int(time()) + duration
-    _write_player_info()
+    old_upgrade_time = player.upgrade_until(pnum)
+    new_upgrade_time = int(time()) + duration
+    _set_planet(caller_id, pnum, [planet_name, level, new_upgrade_time])
 
     # Respond
     new_dhm = to_dhm(duration)
-    _, fut_cc, _, _ = _compute_cap(planets)
+    _, fut_cc, _, _ = _player_cap(caller_id)
 
     if old_upgrade_time is not None:
         old_dhm = to_dhm(old_upgrade_time - int(time()))
-        await inter.response.send_message(
+        return (
             f"Changed the upgrade timer for Tier "
             f"{PORDER[pnum][1]}{PORDER[pnum][2]} "
             f"{PORDER[pnum][0].name} planet __{planet_name}__ from "
             f"<t:{old_upgrade_time}:F> ({old_dhm}) to "
-            f"<t:{planets[pnum][2]}:F> ({new_dhm})."
-        )
-    else:
-        await inter.response.send_message(
-            f"Started the upgrade timer for Tier "
-            f"{PORDER[pnum][1]}{PORDER[pnum][2]} "
-            f"{PORDER[pnum][0].name} planet __{planet_name}__ to finish at "
-            f"<t:{planets[pnum][2]}:F> ({new_dhm}).\n"
-            f"Upgraded Credit Cap is now {numformat(fut_cc)} CR."
+            f"<t:{new_upgrade_time}:F> ({new_dhm})."
         )
+    return (
+        f"Started the upgrade timer for Tier "
+        f"{PORDER[pnum][1]}{PORDER[pnum][2]} "
+        f"{PORDER[pnum][0].name} planet __{planet_name}__ to finish at "
+        f"<t:{new_upgrade_time}:F> ({new_dhm}).\n"
+        f"Upgraded Credit Cap is now {numformat(fut_cc)} CR."
+    )
 
 
 async def shift_upgrade_times(inter, duration):
@@ -116,35 +194,54 @@ async def shift_upgrade_times(inter, duration):
     Shifts all of a player's planet upgrade times by a fixed duration.
     Used to compensate for TM usage.
     """
+    caller_id = str(inter.author.id)
+    await inter.response.send_message(
+        await STATE.submit(_shift_upgrade_times, caller_id, duration)
+    )
+
+
+def _shift_upgrade_times(caller_id, duration):
     global PLAYER_INFO
     
-    caller_id = str(inter.author.id)
     create_player_if_not_exists(caller_id)
 
     # Validate duration
     if duration <= 0:
-        await inter.response.send_message(
-            "Need to shift by a non-zero duration."
-        )
-        return
+        return "Need to shift by a non-zero duration."
 
     # Shift
-    changed = False
-    for i in range(len(PORDER)):
-        if PLAYER_INFO[caller_id]["planets"][i][2] is not None:
-            PLAYER_INFO[caller_id]["planets"][i][2] -= duration
-            changed = True
-    
-    if changed:
-        _write_player_info()
+    if any(PLAYER_INFO[caller_id].until):
+        _shift_player(caller_id, duration)
         dhm = to_dhm(duration)
-        await inter.response.send_message(
-            f"Shifted all upgrade timers ahead by {dhm}."
-        )
-    else:
-        await inter.response.send_message(
-            "No upgrade timers to shift."
-        )
+        return f"Shifted all upgrade timers ahead by {dhm}."
+    return "No upgrade timers to shift."
+
+
+async def shift_all_upgrade_times(inter, duration):
+    """
+    Shifts every player's planet upgrade times by a fixed duration.
+    Used when the whole alliance gets a TM.
+    """
+    await inter.response.send_message(
+        await STATE.submit(_shift_all_upgrade_times, duration)
+    )
+
+
+def _shift_all_upgrade_times(duration):
+    _read_player_info()
+
+    # Validate duration
+    if duration <= 0:
+        return "Need to shift by a non-zero duration."
+
+    # Only players with a timer running have anything to shift
+    pids = [pid for pid in DEADLINES.timers if any(PLAYER_INFO[pid].until)]
+    for pid in pids:
+        _shift_player(pid, duration)
+    return (
+        f"Shifted upgrade timers ahead by {to_dhm(duration)} "
+        f"for {len(pids)} players."
+    )
 
 
 async def add_planet(inter, planet_name, level, ptype, tier, disc):
@@ -152,18 +249,21 @@ async def add_planet(inter, planet_name, level, ptype, tier, disc):
     Adds a planet to a player's info, creating the player if needed.
     Renames/replaces the level of a planet if it already exists.
     """
+    caller_id = str(inter.author.id)
+    await inter.response.send_message(await STATE.submit(
+        _add_planet, caller_id, planet_name, level, ptype, tier, disc
+    ))
+
+
+def _add_planet(caller_id, planet_name, level, ptype, tier, disc):
     global PLAYER_INFO
     
-    caller_id = str(inter.author.id)
     create_player_if_not_exists(caller_id)
 
     # Validate Tier 4 Ice
     if PTYPE(ptype) == PTYPE.Ice and tier == 4:
         if disc == "":
-            await inter.response.send_message(
-                "Must specify a discriminator a/b for Tier 4 Ice planets."
-            )
-            return
+            return "Must specify a discriminator a/b for Tier 4 Ice planets."
     else:
         # Clear discriminator
         disc = ""
@@ -171,29 +271,24 @@ async def add_planet(inter, planet_name, level, ptype, tier, disc):
     # Validate remaining
     planet = (PTYPE(ptype), tier, disc)
     if planet not in PORDER:
-        await inter.response.send_message(
-            "Invalid planet type/tier."
-        )
-        return
+        return "Invalid planet type/tier."
     
-    # Write to file
+    # Write to file (any running timer is dropped from the deadline index)
     pnum = PORDER.index(planet)
-    old_planet = PLAYER_INFO[caller_id]["planets"][pnum]
-    PLAYER_INFO[caller_id]["planets"][pnum] = [planet_name, level, None]
-    _write_player_info()
+    old_planet = PLAYER_INFO[caller_id].planet(pnum)
+    _set_planet(caller_id, pnum, [planet_name, level, None])
 
     # Respond
     if old_planet[0] is None:
-        await inter.response.send_message(
+        return (
             f"Added Tier {tier}{disc} {PTYPE(ptype).name} planet "
             f"__{planet_name}__ at level {level}."
         )
-    else:
-        await inter.response.send_message(
-            f"Replaced Tier {tier}{disc} {PTYPE(ptype).name} planet "
-            f"__{old_planet[0]}__ at level {old_planet[1]} with "
-            f"__{planet_name}__ at level {level}."
-        )
+    return (
+        f"Replaced Tier {tier}{disc} {PTYPE(ptype).name} planet "
+        f"__{old_planet[0]}__ at level {old_planet[1]} with "
+        f"__{planet_name}__ at level {level}."
+    )
 
 
 async def list_planets(inter):
@@ -201,23 +296,22 @@ async def list_planets(inter):
     Lists all planets, levels, and upgrade status.
     """
     caller_id = str(inter.author.id)
-    create_player_if_not_exists(caller_id)
-
-    p = PLAYER_INFO[caller_id]["planets"]
+    player = await player_snapshot(caller_id)
 
     output = []
     for i in range(len(PORDER)):
+        p_i = player.planet(i)
         # Conditional markers
         upgr_emoji, max_emoji = "", ""
-        if p[i][2] is not None:
-            upgr_emoji = f"🛠️ ({to_dhm(p[i][2] - int(time()))})"
-        if p[i][1] == _max_planet_level(PORDER[i][1]):
+        if p_i[2] is not None:
+            upgr_emoji = f"🛠️ ({to_dhm(p_i[2] - int(time()))})"
+        if p_i[1] == MAX_LEVEL[PORDER[i][1]]:
             max_emoji = "✨"
         # Create string
         outstr = "".join([
             PTYPE_EMOJI[PORDER[i][0].value], str(PORDER[i][1]), PORDER[i][2],
-            " - __", str(p[i][0]), "__ (Level ",
-            str(p[i][1]), "/", str(_max_planet_level(PORDER[i][1])), ") ",
+            " - __", str(p_i[0]), "__ (Level ",
+            str(p_i[1]), "/", str(MAX_LEVEL[PORDER[i][1]]), ") ",
             upgr_emoji,
             max_emoji
         ])
@@ -234,9 +328,8 @@ async def upgrade_details(inter, raw=False):
     Suggests next planet upgrade.
     """
     caller_id = str(inter.author.id)
-    create_player_if_not_exists(caller_id)
-
-    planets = PLAYER_INFO[caller_id]["planets"]
+    player = await player_snapshot(caller_id)
+    timeline = _player_timeline(caller_id)
 
     # Counters and output
     output = []
@@ -245,30 +338,33 @@ async def upgrade_details(inter, raw=False):
     # Check all planets
     for i in range(len(PORDER)):
         ptype, ptier, disc = PORDER[i]
-        pname, level, upgr_until = planets[i]
-        cc = _credit_storage(level)
-        hc = _hydro_storage(level)
+        pname, level, upgr_until = player.planet(i)
+        cc = CREDIT_STORAGE[level]
 
         if upgr_until is not None:
             dhm = to_dhm(upgr_until - int(time()))
+            # The cap once this and every earlier upgrade is done
+            step_cc, step_hc = timeline.cap_at(upgr_until)
             output.append((
                 f"{PTYPE_EMOJI[ptype.value]}{ptier}{disc} __{pname}__ "
                 f"({level} -> {level + 1}):\n"
-                f"- <t:{upgr_until}:f> ({dhm})",
+                f"- <t:{upgr_until}:f> ({dhm})\n"
+                f"- Cap then: {numformat(step_cc)} CR / "
+                f"{numformat(step_hc)} H",
                 upgr_until - int(time())
             ))
-        else:
-            if level < _max_planet_level(ptier):
-                cost = _upgrade_cost(level)
-                cr_incr = (
-                    _shipment_value(ptype, ptier, level + 1) - 
-                    _shipment_value(ptype, ptier, level)
-                )
-                cc_incr = _credit_storage(level + 1) - cc
-                next_upgr.append([
-                    ptype.name, str(ptier) + disc, pname, level, cost,
-                    cr_incr/cost, cc_incr/cost
-                ])
+        elif pname is not None and level < MAX_LEVEL[ptier]:
+            cost = UPGRADE_COST[level]
+            base = shipment_base(ptype, ptier)
+            cr_incr = (
+                SHIPMENT_VALUE[base + level + 1] -
+                SHIPMENT_VALUE[base + level]
+            )
+            cc_incr = CREDIT_STORAGE[level + 1] - cc
+            next_upgr.append([
+                ptype.name, str(ptier) + disc, pname, level, cost,
+                cr_incr/cost, cc_incr/cost
+            ])
     
     # Select next planet to upgrade
     unmaxed = bool(next_upgr)
@@ -281,8 +377,10 @@ async def upgrade_details(inter, raw=False):
             "Tier", next_upgr[1], next_upgr[0] + ":", next_upgr[2],
             "(Level", str(next_upgr[3]), "->", str(next_upgr[3] + 1) + ")",
             f"- {numformat(next_upgr[4])} CR", "/",
-            to_dhm(_upgrade_duration(next_upgr[3]), ignore_min=True)
+            to_dhm(UPGRADE_DURATION[next_upgr[3]], ignore_min=True)
         ])
+    else:
+        next_upgr = ""
     
     # Clean upgrades
     upgrading = bool(output)
@@ -293,7 +391,7 @@ async def upgrade_details(inter, raw=False):
         output = ""
 
     # Compute caps
-    cur_cc, fut_cc, cur_hc, fut_hc = _compute_cap(planets)
+    cur_cc, fut_cc, cur_hc, fut_hc = _player_cap(caller_id)
     
     upgraded_cap = (
         f"Upgraded Credit Cap: {numformat(fut_cc)} CR\n"
@@ -310,37 +408,145 @@ async def upgrade_details(inter, raw=False):
     )
 
 
+async def cap_at(inter, duration):
+    """
+    Shows a player's credit and hydro cap at a point in the future, once
+    the running upgrades due by then are done.
+    Takes duration in seconds.
+    """
+    caller_id = str(inter.author.id)
+    await player_snapshot(caller_id)  # Creates new players
+    timeline = _player_timeline(caller_id)
+    cur_time = int(time())
+    when = cur_time + duration
+
+    cc, hc = timeline.cap_at(when)
+    await inter.response.send_message(
+        f"At <t:{when}:f> ({to_dhm(duration)}), after "
+        f"{timeline.completed(cur_time, when)} more upgrades:\n"
+        f"Credit Cap: {numformat(cc)} CR\n"
+        f"Hydro Cap: {numformat(hc)} H"
+    )
+
+
+async def plan_upgrades(inter, budget, horizon, workers, objective):
+    """
+    Suggests an ordered upgrade schedule for a credit budget and horizon.
+    Maximizes either credit cap or shipment income earned by the horizon.
+    """
+    caller_id = str(inter.author.id)
+    player = await player_snapshot(caller_id)
+    cur_time = int(time())
+
+    # Validate horizon
+    if horizon <= 0:
+        await inter.response.send_message(
+            "Need to plan over a non-zero duration."
+        )
+        return
+
+    slots = []
+    for i in range(len(PORDER)):
+        ptype, ptier, _ = PORDER[i]
+        pname, level, upgr_until = player.planet(i)
+        if pname is None:
+            # Empty slots can't be upgraded
+            slots.append((ptype, ptier, MAX_LEVEL[ptier], 0))
+        else:
+            busy = 0 if upgr_until is None else max(1, upgr_until - cur_time)
+            slots.append((ptype, ptier, level, busy))
+
+    steps, cost, gain = await to_thread(
+        plan_upgrade_schedule, tuple(slots), budget, horizon, workers,
+        objective
+    )
+
+    if not steps:
+        await inter.response.send_message(
+            "No upgrades fit within that budget and duration."
+        )
+        return
+
+    # Respond, keeping within Discord's message length
+    output = []
+    for i, level, start, finish in steps[:PLAN_LINES]:
+        ptype, ptier, disc = PORDER[i]
+        output.append(
+            f"{PTYPE_EMOJI[ptype.value]}{ptier}{disc} __{player.names[i]}__ "
+            f"({level} -> {level + 1}) - {numformat(UPGRADE_COST[level])} CR, "
+            f"start <t:{cur_time + start}:f>"
+        )
+    if len(steps) > PLAN_LINES:
+        output.append(f"...and {len(steps) - PLAN_LINES} more upgrades.")
+
+    gain_str = (
+        f"Credit Cap +{numformat(gain)} CR" if objective == "cap"
+        else f"+{numformat(gain)} CR of shipments"
+    )
+    await inter.response.send_message(
+        f"Upgrade plan for {numformat(budget)} CR over "
+        f"{to_dhm(horizon, ignore_min=True)} with {workers} at a time:\n"
+        + "\n".join(output) +
+        f"\nTotal: {numformat(cost)} CR for {gain_str}."
+    )
+
+
+async def leaderboard(inter, board, count):
+    """
+    Lists the top players on a leaderboard, and where the caller ranks.
+    """
+    caller_id = str(inter.author.id)
+    await player_snapshot(caller_id)  # Creates (and ranks) new players
+    ranked = BOARDS[board]
+    title, unit = BOARD_TITLES[board]
+
+    output = [f"{title} leaderboard:"]
+    for rank, (pid, score) in enumerate(ranked.top(count), start=1):
+        output.append(f"{rank}. <@{pid}> - {numformat(score)} {unit}")
+    rank, score = ranked.rank(caller_id)
+    output.append(
+        f"You are #{rank} of {len(ranked)} with {numformat(score)} {unit}."
+    )
+
+    # Lists players without pinging them
+    await inter.response.send_message(
+        "\n".join(output), allowed_mentions=AllowedMentions.none()
+    )
+
+
 ### Settings
 
 async def change_bool_settings(inter, setting, flag):
     """
     Changes player boolean settings.
     """
-    global PLAYER_INFO
-
     caller_id = str(inter.author.id)
-    create_player_if_not_exists(caller_id)
-
-    PLAYER_INFO[caller_id]["settings"][setting] = flag
-    _write_player_info()
+    await STATE.submit(_change_setting, caller_id, setting, flag)
 
     await inter.response.send_message(
         f"Set {setting.replace('_', ' ').title()} to {flag}."
     )
 
 
+def _change_setting(caller_id, setting, value):
+    global PLAYER_INFO
+
+    create_player_if_not_exists(caller_id)
+
+    PLAYER_INFO[caller_id].settings[setting] = value
+    _log_change("setting", caller_id, setting, value)
+
+
 async def view_settings(inter):
     """
     Lists all player settings.
     """
-    global PLAYER_INFO
-    
     caller_id = str(inter.author.id)
-    create_player_if_not_exists(caller_id)
+    player = await player_snapshot(caller_id)
 
     output = []
     
-    for k, v in PLAYER_INFO[caller_id]["settings"].items():
+    for k, v in player.settings.items():
         output.append(f"{k.replace('_', ' ').title()}: {v}")
     
     await inter.response.send_message("\n".join(output))
@@ -348,157 +554,589 @@ async def view_settings(inter):
 
 ### Checks
 
+@metrics.timed("hs_upgrade_scan_seconds")
 async def check_planet_upgrade_status(channel):
+    """
+    Completes every upgrade whose timer has run out.
+    Only a peek at the deadline index when nothing is due, without waiting
+    for the state actor (upgrades started by other processes sharing the
+    store are picked up when sync_player_info catches up).
+    Notifications are queued, one message per player, and sent separately.
+    Only the leader process scans.
+    """
+    _read_player_info()
+    if not is_leader():
+        return
+    cur_time = int(time())
+    due = DEADLINES.peek()
+    if due is None or due > cur_time:
+        return
+    try:
+        completed = await STATE.submit(_complete_upgrades, cur_time)
+    except ConflictError:
+        # Undone, so still due: the next scan or command tries again
+        return
+
+    # Notify
+    for pid, lines in completed.items():
+        cur_cc, _, _, _ = _player_cap(pid)
+        DISPATCHER.notify(
+            channel, pid, lines,
+            f"Current Credit Cap is now {numformat(cur_cc)} CR."
+        )
+
+
+def _complete_upgrades(cur_time):
+    """
+    Completes every upgrade due by cur_time, returning {pid: lines} of
+    notifications for players who asked to be pinged.
+    """
     global PLAYER_INFO
 
     _read_player_info()
-    cur_time = int(time())
-    changed = False
-
-    for pid in PLAYER_INFO:
-        for i in range(len(PORDER)):
-            planet = PLAYER_INFO[pid]["planets"][i]
-            if planet[2] is not None and planet[2] <= cur_time:
-                # Edit
-                PLAYER_INFO[pid]["planets"][i] = \
-                    [planet[0], planet[1] + 1, None]
-                changed = True
-                # Notify
-                if PLAYER_INFO[pid]["settings"]["ping_when_upgraded"]:
-                    cur_cc, _, _, _ = _compute_cap(PLAYER_INFO[pid]["planets"])
-                    await channel.send(
-                        f"<@{pid}> {planet[0]} completed upgrade to level "
-                        f"{planet[1] + 1}.\n"
-                        f"Current Credit Cap is now {numformat(cur_cc)} CR."
-                    )
-    
-    if changed:
-        _write_player_info()
+
+    completed = {}
+    for pid, i in DEADLINES.pop_expired(cur_time):
+        planet = PLAYER_INFO[pid].planet(i)
+        # Edit
+        _set_planet(pid, i, [planet[0], planet[1] + 1, None])
+        if PLAYER_INFO[pid].settings["ping_when_upgraded"]:
+            completed.setdefault(pid, []).append(
+                f"{planet[0]} completed upgrade to level {planet[1] + 1}."
+            )
+    return completed
+
+
+async def notification_stats(inter):
+    """
+    Lists the upgrade notification dispatcher's counters.
+    """
+    stats = DISPATCHER.stats()
+    await inter.response.send_message(
+        f"Queued: {stats['queue_depth']}\n"
+        f"Sent: {stats['sent']} (failed {stats['failed']}, "
+        f"retried {stats['retried']})\n"
+        f"Send latency: {stats['send_latency_avg'] * 1000:.0f}ms avg, "
+        f"{stats['send_latency_max'] * 1000:.0f}ms max"
+    )
+
+
+async def wait_for_next_upgrade():
+    """
+    Sleeps until the next upgrade is due to complete.
+    Other processes than the leader sleep a while, then check whether the
+    leader is still there.
+    """
+    _read_player_info()
+    if not is_leader():
+        await sleep(LEADER_RETRY)
+        return
+    await DEADLINES.sleep()
+
+
+def is_leader():
+    """
+    Returns whether this process runs the upgrade scan and compaction,
+    taking over if no other process does (the lock on LEADER is released
+    when its holder exits). Always true unless SHARED.
+    """
+    global LEADING
+    if SHARED and not LEADING:
+        LEADING = LEADER.acquire(blocking=False)
+    return LEADING or not SHARED
+
+
+async def sync_player_info():
+    """
+    Catches up with changes made by other processes, if SHARED. Changes
+    catch up first anyway; this keeps read-only commands current.
+    """
+    if SHARED:
+        # The actor catches up before every change, even one doing nothing
+        await STATE.submit(lambda: None)
+
+
+async def load_player_info():
+    """
+    Loads player info on a worker thread, so startup doesn't block the bot.
+    """
+    if PLAYER_INFO is None:
+        store, shared = _open_store()
+        loaded = await to_thread(
+            _load_players, store, int(getenv("PLAYER_CACHE_SIZE", "0")),
+            shared
+        )
+        if PLAYER_INFO is None:
+            _use_player_info(store, *loaded)
+
+
+async def compact_player_info():
+    """
+    Folds the change journal into a fresh player info snapshot.
+    Does nothing if there have been no changes since the last compaction,
+    or if another process is the leader.
+    """
+    if PLAYER_INFO is not None and is_leader():
+        lazy = isinstance(PLAYER_INFO, PlayerCache)
+        if lazy:
+            generation = PLAYER_INFO.begin_compaction()
+        await WRITER.flush()
+        if STORE.pending:
+            await WRITER.run(STORE.compact)
+            _save_boards()
+        if lazy:
+            # Evicted players written back since are now in the store
+            PLAYER_INFO.end_compaction(generation)
+
+
+def flush_player_info():
+    """
+    Writes out any buffered changes and saves the leaderboards, blocking
+    until they are on disk. Call on shutdown.
+    """
+    if WRITER is not None:
+        _save_boards()
+        WRITER.flush_sync()
+
+
+def dump_player_info():
+    """
+    Returns every player in JSON form ({pid: player}), as stored once any
+    buffered changes are written out. Blocks; for startup and shutdown.
+    """
+    _read_player_info()
+    flush_player_info()
+    return STORE.load()
 
 
 ### Private planet helper functions
 
 def _read_player_info():
-    global PLAYER_INFO
     if PLAYER_INFO is None:
-        with open("player_info.json") as f:
-            PLAYER_INFO = load(f)
+        # Only blocks if a command arrives before load_player_info is done
+        store, shared = _open_store()
+        _use_player_info(store, *_load_players(
+            store, int(getenv("PLAYER_CACHE_SIZE", "0")), shared
+        ))
 
 
-def _write_player_info():
-    global PLAYER_INFO
-    if PLAYER_INFO is not None:
-        with open("player_info.json", "w") as f:
-            dump(PLAYER_INFO, f)
-
-
-def _upgrade_cost(cur_lv: int):
-    """
-    Returns the cost to upgrade a planet given its current level.
-    """
-    if cur_lv < 0:
-        return 0
-    elif cur_lv < 8:
-        return [0, 50, 200, 400, 800, 2000, 4000, 8000][cur_lv]
-    elif cur_lv < 13:
-        return 10000 * (cur_lv - 7)
-    elif cur_lv < 19:
-        return 25000 * (cur_lv - 10)
-    elif cur_lv < 25:
-        return [250, 300, 400, 500, 600, 800][cur_lv - 19] * 1000
-    elif cur_lv < 33:
-        return 250000 * (cur_lv - 21)
-    elif cur_lv < 50:
-        return 500000 * (cur_lv - 27)
-    else:
-        return 0
+def _open_store():
+    # Backend is chosen on first use, after the bot has loaded .env
+    shared = getenv("SHARED_STORE") == "1"
+    return open_store(getenv("PLAYER_STORE", "json"), shared), shared
 
 
-def _upgrade_duration(cur_lv: int):
+@metrics.timed("hs_player_info_read_seconds")
+def _load_players(store, cache_size=0, shared=False):
+    """
+    Returns a store's players as Player objects, its running upgrades and
+    time offsets, and (if shared) the change log position they are as of.
+    With a cache_size, players are instead read on first use into an LRU
+    cache of that many players, and only the store's index is opened.
+    Shared stores always have their index open, see _reload_player.
+    Also returns the leaderboards, saved ones brought up to date if they
+    can be (see _read_boards).
+    """
+    position = None
+    if shared:
+        # Taken first: catching up replays records the load already has,
+        # which is harmless
+        position = store.position()
+    # Before open_index, whose compaction changes the store's stamp
+    saved = _read_boards(store, shared)
+    if shared:
+        store.open_index()
+    if cache_size:
+        if not shared:
+            store.open_index()
+        players = PlayerCache(store, cache_size, on_evict=_forget)
+        upgrades = store.deadlines()
+    else:
+        data = store.load()
+        upgrades = store.upgrades(data)
+        players = {
+            pid: Player.from_json(player) for pid, player in data.items()
+        }
+    if saved is None:
+        # Reads every player, even with a cache: O(players)
+        boards = _rank_players(players)
+    else:
+        boards, changed = saved
+        for pid in changed:
+            if pid in players:
+                _rank_player(pid, players[pid], boards)
+    return players, upgrades, position, boards
+
+
+def _use_player_info(store, players, upgrades, position, boards):
+    global PLAYER_INFO, STORE, WRITER, VERIFY_CAPS, SHARED, POSITION
+    global BOARDS, RANKED_SHIPMENTS
+    if store is not STORE:
+        STORE = store
+        WRITER = WriteBehind(store)
+    VERIFY_CAPS = getenv("VERIFY_CAPS") == "1"
+    PLAYER_INFO = players
+    for derived in DERIVED:
+        derived.clear()
+    DEADLINES.rebuild(*upgrades)
+    BOARDS = boards
+    RANKED_SHIPMENTS = list(SHIPMENT_VALUE)
+    SHARED = position is not None
+    POSITION = position
+    STATE.before = _catch_up if SHARED else None
+    STATE.commit = _commit if SHARED else None
+
+
+def _log_change(*record):
     """
-    Returns the number of seconds for a planet upgrade given its current level.
+    Queues a change for the journal instead of rewriting the whole file.
+    The record is serialized later on another thread, so it must not share
+    anything with live player state.
     """
-    if cur_lv < 0:
-        return 0
-    elif cur_lv < 13:
-        return [
-            0, 3, 30, 60, 120, 300, 1200, 3600, 4*3600, 8*3600, 16*3600,
-            24*3600, 36*3600
-        ][cur_lv]
+    if isinstance(PLAYER_INFO, PlayerCache):
+        PLAYER_INFO.mark_dirty(record[1])
+    # Every change is logged, so snapshots and the like are dropped here
+    for derived in VOLATILE:
+        derived.pop(record[1], None)
+    if SHARED:
+        # Written by _commit once the change is done
+        PENDING.append(list(record))
     else:
-        return min(12*3600 * (cur_lv - 8), 14*24*3600)
+        WRITER.append(list(record))
 
 
-def _credit_storage(cur_lv: int):
+async def _catch_up():
     """
-    Returns the current credit storage for a planet given its level.
+    Applies the changes other processes have made since POSITION.
     """
-    if cur_lv < 0:
-        return 0
-    elif cur_lv < 18:
-        return [
-            0, 1000, 1400, 1800, 3000, 4000, 5000, 6000, 7500, 10000, 13000,
-            16000, 20000, 24000, 28000, 35000, 45000, 65000
-        ][cur_lv]
-    else:
-        return min(40000 * (cur_lv - 16) + 10000, 1370000)
+    _read_player_info()
+    position, records = await WRITER.run(STORE.changes_since, POSITION)
+    if records is None:
+        # Too far behind: reloaded on the store's thread, off the event loop
+        _use_player_info(STORE, *await WRITER.run(
+            _load_players, STORE, getattr(PLAYER_INFO, "capacity", 0), True
+        ))
+        return
+    _apply_changes(position, records)
 
 
-def _hydro_storage(cur_lv: int):
+async def _commit():
     """
-    Returns the current hydro storage for a planet given its level.
-    Note that fire planets do not increase hydro storage.
+    Writes out the change just applied, or undoes it if another process
+    has changed the same players meanwhile.
     """
-    if cur_lv < 0:
-        return 0
-    elif cur_lv < 20:
-        return [
-            0, 200, 260, 340, 450, 570, 750, 960, 1250, 1600, 2100, 2750, 3600,
-            5000, 7000, 9000, 11000, 13000, 15000, 17000
-        ][cur_lv]
-    else:
-        return min(1000 * (cur_lv - 1), 49000)
+    records = PENDING[:]
+    PENDING.clear()
+    if not records:
+        return
+    try:
+        position, others = await WRITER.run(STORE.commit, records, POSITION)
+    except ConflictError:
+        # The retry catches up with the other process's changes
+        for pid in {record[1] for record in records}:
+            await _reload_player(pid)
+        raise
+    _apply_changes(position, others)
+    if isinstance(PLAYER_INFO, PlayerCache):
+        pids = {record[1] for record in records}
+        if STORE.in_place:
+            PLAYER_INFO.stored(pids)
+        else:
+            # In case a compaction was found, these aren't in the snapshot
+            for pid in pids:
+                PLAYER_INFO.mark_dirty(pid)
 
 
-def _shipment_value(ptype: PTYPE, ptier: int, cur_lv: int):
+def _apply_changes(position, records):
     """
-    Returns the hourly shipment value for the planet.
+    Brings players changed by other processes up to date with their
+    records since POSITION.
     """
-    global PLANET_SHIPMENTS
+    global POSITION
+    if position[0] != POSITION[0] and isinstance(PLAYER_INFO, PlayerCache):
+        # Compacted since: the store now holds every change this process
+        # knew of, so written-back players needn't be kept
+        PLAYER_INFO.end_compaction(PLAYER_INFO.begin_compaction())
+    POSITION = position
+    changed = {}
+    for record in records:
+        changed.setdefault(record[1], []).append(record)
+    for pid, pid_records in changed.items():
+        players = {}
+        if pid in PLAYER_INFO:
+            players[pid] = PLAYER_INFO[pid].to_json()
+        for record in pid_records:
+            apply_record(players, record)
+        if pid in players:
+            _replace_player(pid, Player.from_json(players[pid]))
+
+
+async def _reload_player(pid):
+    """
+    Replaces a player with the store's latest copy, read on the store's
+    thread.
+    """
+    data = await WRITER.run(STORE.read_latest, pid)
+    if data is not None:
+        _replace_player(pid, Player.from_json(data))
 
-    if ptier < 1 or ptier > 4:
-        print("Invalid tier.")
-        return 0
-    
-    if PLANET_SHIPMENTS is None:
-        with open("planet_shipments.json") as f:
-            PLANET_SHIPMENTS = load(f)
-    
+
+def _replace_player(pid, player):
+    """
+    Swaps in a player changed by another process, keeping derived values
+    and the deadline index in step.
+    """
+    old = PLAYER_INFO[pid] if pid in PLAYER_INFO else None
+    PLAYER_INFO[pid] = player
+    if isinstance(PLAYER_INFO, PlayerCache) and STORE.in_place:
+        # Read from the store, which already holds it
+        PLAYER_INFO.stored([pid])
+    _forget(pid)
+    _rank_player(pid, player)
+    for slot in range(len(PORDER)):
+        base = player.base_until(slot)
+        if base is not None and (old is None or old.base_until(slot) != base):
+            DEADLINES.push(base, pid, slot)
+    if old is None or old.offset != player.offset:
+        DEADLINES.shift(pid, player.offset)
+
+
+def _forget(pid):
+    """
+    Drops a player's derived values, to be rebuilt on next use.
+    """
+    for derived in DERIVED:
+        derived.pop(pid, None)
+
+
+def _set_planet(pid, slot, planet):
+    """
+    Replaces one of a player's planets, keeping the cap totals,
+    leaderboards, journal and deadline index in step.
+    """
+    old_planet = PLAYER_INFO[pid].planet(slot)
+    if pid in CAPS:
+        old = _planet_cap(slot, old_planet)
+        new = _planet_cap(slot, planet)
+        CAPS[pid] = [t + n - o for t, n, o in zip(CAPS[pid], new, old)]
+    for board, old, new in zip(
+        BOARDS.values(), _planet_scores(slot, old_planet),
+        _planet_scores(slot, planet)
+    ):
+        if new != old:
+            board.add(pid, new - old)
+    player = PLAYER_INFO[pid]
+    player.set_planet(slot, planet)
+    # Stored with the base deadline, see Player
+    _log_change("planet", pid, slot, player.stored_planet(slot))
+    if planet[2] is not None:
+        DEADLINES.push(player.base_until(slot), pid, slot)
+
+
+def _shift_player(pid, duration):
+    """
+    Brings all of a player's upgrade deadlines forward by duration.
+    Only the player's time offset changes, however many timers they have.
+    """
+    player = PLAYER_INFO[pid]
+    player.offset += duration
+    # Logged first, so the player is marked dirty before the deadline
+    # index looks up (and may evict) other players
+    _log_change("offset", pid, player.offset)
+    DEADLINES.shift(pid, player.offset)
+
+
+def _player_cap(pid):
+    """
+    Returns a player's current and upgraded credit and hydro cap.
+    Kept as running totals, with a full recompute only on first use.
+    """
+    if pid not in CAPS:
+        CAPS[pid] = list(_compute_cap(PLAYER_INFO[pid]))
+    elif VERIFY_CAPS:
+        full = list(_compute_cap(PLAYER_INFO[pid]))
+        assert CAPS[pid] == full, f"Cap totals {CAPS[pid]} != {full}"
+    return tuple(CAPS[pid])
+
+
+def _planet_cap(slot, planet):
+    """
+    Returns one planet's share of cur_cc, fut_cc, cur_hc and fut_hc.
+    """
+    level = planet[1]
+    fut_level = level + 1 if planet[2] is not None else level
+    if PORDER[slot][0] == PTYPE.Fire:
+        return CREDIT_STORAGE[level], CREDIT_STORAGE[fut_level], 0, 0
+    return (
+        CREDIT_STORAGE[level], CREDIT_STORAGE[fut_level],
+        HYDRO_STORAGE[level], HYDRO_STORAGE[fut_level]
+    )
+
+
+def _planet_scores(slot, planet):
+    """
+    Returns one planet's share of each leaderboard's score: credit cap,
+    hydro cap, hourly shipments and whether it is maxed.
+    """
+    base, hydro, top = SLOT_SCORING[slot]
+    level = planet[1]
+    return (
+        CREDIT_STORAGE[level], HYDRO_STORAGE[level] if hydro else 0,
+        SHIPMENT_VALUE[base + level], int(level == top)
+    )
+
+
+def _player_scores(player: Player):
+    """
+    Returns a player's score on each leaderboard.
+    Ranking every player calls this once each, so it reads the levels
+    directly rather than adding up _planet_scores.
+    """
+    cc, hc, income, maxed = 0, 0, 0, 0
+    for (base, hydro, top), level in zip(SLOT_SCORING, player.levels):
+        cc += CREDIT_STORAGE[level]
+        if hydro:
+            hc += HYDRO_STORAGE[level]
+        income += SHIPMENT_VALUE[base + level]
+        maxed += level == top
+    return cc, hc, income, maxed
+
+
+def _rank_player(pid, player, boards=None):
+    """
+    Sets a player's score on every leaderboard (of BOARDS by default).
+    """
+    if boards is None:
+        boards = BOARDS
+    for board, score in zip(boards.values(), _player_scores(player)):
+        board.set(pid, score)
+
+
+def _rank_players(players):
+    """
+    Returns new leaderboards ranking every player.
+    """
+    scores = {name: {} for name in BOARDS}
+    for pid, player in players.items():
+        for board, score in zip(scores.values(), _player_scores(player)):
+            board[pid] = score
+    return {name: Board(board) for name, board in scores.items()}
+
+
+def _rerank_income():
+    """
+    Ranks every player's shipments again if the shipment values have
+    changed. Reads every player, blocking while it does.
+    """
+    global RANKED_SHIPMENTS
+    if PLAYER_INFO is None or RANKED_SHIPMENTS == list(SHIPMENT_VALUE):
+        return
+    BOARDS["income"] = Board({
+        pid: _player_scores(player)[2] for pid, player in PLAYER_INFO.items()
+    })
+    RANKED_SHIPMENTS = list(SHIPMENT_VALUE)
+
+
+gamedata.ON_RELOAD.append(_rerank_income)
+
+
+def _read_boards(store, shared):
+    """
+    Returns the leaderboards saved alongside the store, and the pids of
+    the players changed since they were saved, to rank again. None if the
+    shipment values they were ranked with have changed, if the store has
+    changed with no change log to tell which players did (or the log has
+    been compacted twice since), or if the store is shared: every player
+    must then be ranked again.
+    """
+    if shared:
+        # Other processes change the store without saving boards
+        return None
     try:
-        return PLANET_SHIPMENTS[ptype.name][ptier - 1][cur_lv - 1]
-    except IndexError as e:
-        print(e)
-        print(
-            f"Failed to get shipments of {ptype.name} Tier {ptier} "
-            f"Level {cur_lv}."
-        )
-    except Exception as e:
-        print(e)
-    
-    return 0
+        with open(store.base + ".leaderboards") as f:
+            saved = load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        saved.get("shipments") != list(SHIPMENT_VALUE) or
+        list(saved.get("boards", ())) != list(BOARDS)
+    ):
+        return None
+    changed = ()
+    if saved.get("stamp") != store.stamp():
+        if not store.change_log or "position" not in saved:
+            return None
+        _, records = store.changes_since(saved["position"])
+        if records is None:
+            return None
+        changed = {record[1] for record in records}
+    return {
+        name: Board(scores) for name, scores in saved["boards"].items()
+    }, changed
+
+
+def _save_boards():
+    """
+    Saves the leaderboards alongside the store on the writer thread,
+    stamped once every change made so far is written. Not if SHARED.
+    """
+    if SHARED:
+        return
+    saved = {
+        "shipments": RANKED_SHIPMENTS,
+        # Copies, so later changes don't reach the writer thread
+        "boards": {
+            name: dict(board.scores) for name, board in BOARDS.items()
+        },
+    }
+    WRITER.after_written(_write_boards, STORE, saved)
+
+
+def _write_boards(store, saved):
+    saved["stamp"] = store.stamp()
+    if store.change_log:
+        # Where to catch up from if the store changes after this
+        saved["position"] = store.position()
+    filename = store.base + ".leaderboards"
+    with open(filename + ".tmp", "w") as f:
+        dump(saved, f, separators=(",", ":"))
+    replace(filename + ".tmp", filename)
+
+
+def _player_timeline(pid):
+    """
+    Returns a player's Timeline, kept until the player next changes.
+    """
+    if pid not in TIMELINES:
+        TIMELINES[pid] = _build_timeline(PLAYER_INFO[pid])
+    return TIMELINES[pid]
 
 
-def _max_planet_level(ptier: int):
+def _build_timeline(player: Player):
     """
-    Returns the maximum level of a planet given its tier.
+    Returns the Timeline of a player's caps and income as their running
+    upgrades complete.
     """
-    if ptier < 1 or ptier > 4:
-        print("Invalid tier.")
-        return 0
-    return [0, 15, 20, 35, 50][ptier]
+    totals = [0, 0, 0]  # cc, hc, income
+    events = []
+    for i in range(len(PORDER)):
+        ptype, ptier, _ = PORDER[i]
+        planet = player.planet(i)
+        level, upgr_until = planet[1], planet[2]
+        cur_cc, fut_cc, cur_hc, fut_hc = _planet_cap(i, planet)
+        base = shipment_base(ptype, ptier)
+        income = SHIPMENT_VALUE[base + level]
+        totals = [t + n for t, n in zip(totals, (cur_cc, cur_hc, income))]
+        if upgr_until is not None:
+            events.append((
+                upgr_until, fut_cc - cur_cc, fut_hc - cur_hc,
+                SHIPMENT_VALUE[base + level + 1] - income
+            ))
+    return Timeline(*totals, events)
 
 
-def _compute_cap(planets: list):
+@metrics.timed("hs_compute_cap_seconds")
+def _compute_cap(player: Player):
     """
     Returns the current and upgraded credit and hydro cap.
     """
@@ -509,16 +1147,16 @@ def _compute_cap(planets: list):
     # Check all planets
     for i in range(len(PORDER)):
         ptype, ptier, disc = PORDER[i]
-        pname, level, upgr_until = planets[i]
-        cc = _credit_storage(level)
-        hc = _hydro_storage(level) if ptype != PTYPE.Fire else 0
+        pname, level, upgr_until = player.planet(i)
+        cc = CREDIT_STORAGE[level]
+        hc = HYDRO_STORAGE[level] if ptype != PTYPE.Fire else 0
 
         cur_cc += cc
         cur_hc += hc
 
         if upgr_until is not None:
-            fut_cc += _credit_storage(level + 1)
-            fut_hc += _hydro_storage(level + 1) if ptype != PTYPE.Fire else 0
+            fut_cc += CREDIT_STORAGE[level + 1]
+            fut_hc += HYDRO_STORAGE[level + 1] if ptype != PTYPE.Fire else 0
         else:
             fut_cc += cc
             fut_hc += hc
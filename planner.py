@@ -0,0 +1,160 @@
+from bisect import bisect_right, insort
+from functools import lru_cache
+
+import gamedata
+from rules import (
+    CREDIT_STORAGE, MAX_LEVEL, SHIPMENT_VALUE, UPGRADE_COST, UPGRADE_DURATION,
+    shipment_base
+)
+
+
+MAX_NODES = 5000  # Partial schedules expanded, bounds the search
+
+
+def plan_upgrades(slots, budget, horizon, workers, objective,
+                  max_nodes=MAX_NODES):
+    """
+    Returns the best upgrade schedule within a budget and time horizon.
+
+    slots holds (ptype, tier, level, busy) per planet, where busy is the
+    number of seconds left on a running upgrade (0 if idle) and level is
+    the level that upgrade started from. Each planet upgrades one level at
+    a time, and at most workers planets upgrade at once. Running upgrades
+    always keep going, even if they alone fill the workers' time.
+
+    objective is "cap" to maximize credit cap, or "income" to maximize
+    shipment credits earned before the horizon.
+
+    Branch and bound over schedules: a partial schedule grows one step at
+    a time, each starting as soon as its planet and a worker are free, and
+    scored at the time it really finishes. Exact, unless more than
+    max_nodes partial schedules are expanded: the best found by then is
+    returned. Blocks; planets runs it on a worker thread.
+
+    Returns (steps, cost, gain), where steps is a list of
+    (slot, level, start, finish) sorted by start, times in seconds from now.
+    """
+    chains = [
+        _chain(ptype, ptier, level + 1 if busy else level, objective)
+        for ptype, ptier, level, busy in slots
+    ]
+    income = objective != "cap"
+
+    def gain(value, finish):
+        return value * (horizon - finish) // 3600 if income else value
+
+    def bound(free, pos, ready, spent):
+        # Each planet's chain on a worker of its own from the earliest free
+        # one, and the whole remaining budget to itself, as (gain, cost,
+        # duration) per upgrade: what the planets can still gain together
+        # is never more than these add up to, nor than the most they could
+        # add up to in the budget or the workers' time left, taking them
+        # best value for money (or time) first and part of the last one
+        steps = []
+        for chain, i, t in zip(chains, pos, ready):
+            t = max(t, free[0])
+            cost = 0
+            for _, c, d, value in chain[i:]:
+                cost += c
+                t += d
+                if cost > budget - spent or t > horizon:
+                    break
+                steps.append((gain(value, t), c, d))
+        total = sum(step[0] for step in steps)
+        for room, at in [
+            (budget - spent, 1),
+            (sum(max(0, horizon - f) for f in free), 2)
+        ]:
+            if sum(step[at] for step in steps) > room:
+                total = min(total, _fill(steps, room, at))
+        return total
+
+    best = [0, 0, []]  # gain, cost, steps
+    seen = {}  # (free, pos, ready) -> [(spent, gain)] reached with
+    nodes = 0
+
+    def search(free, pos, ready, spent, gained, steps):
+        nonlocal nodes
+        key = (tuple(free), pos, ready)
+        reached = seen.setdefault(key, [])
+        if any(s <= spent and g >= gained for s, g in reached):
+            return
+        reached.append((spent, gained))
+        if gained > best[0]:
+            best[:] = gained, spent, steps
+        nodes += 1
+        if nodes > max_nodes or gained + bound(free, pos, ready, spent) <= (
+            best[0]
+        ):
+            return
+
+        options = []
+        for p, (chain, i, r) in enumerate(zip(chains, pos, ready)):
+            if i == len(chain) or spent + chain[i][1] > budget:
+                continue
+            level, c, d, value = chain[i]
+            # The worker freed last by the time the planet is, keeping the
+            # earlier ones for other planets (or else the first to free up)
+            w = max(0, bisect_right(free, r) - 1)
+            start = max(r, free[w])
+            if start + d > horizon:
+                continue
+            g = gain(value, start + d)
+            options.append((g / (c + 1), p, w, level, c, start, start + d, g))
+        # Most gain per credit first, to find good schedules early
+        options.sort(reverse=True)
+        for _, p, w, level, c, start, finish, g in options:
+            after = free[:w] + free[w + 1:]
+            insort(after, finish)
+            search(
+                after, pos[:p] + (pos[p] + 1,) + pos[p + 1:],
+                ready[:p] + (finish,) + ready[p + 1:], spent + c, gained + g,
+                steps + [(p, level, start, finish)]
+            )
+
+    # Running upgrades hold workers: with more of them than workers, a
+    # worker is only free once enough of them have finished
+    busy = sorted([slot[3] for slot in slots if slot[3]] + [0] * workers)
+    search(
+        busy[len(busy) - workers:], (0,) * len(slots),
+        tuple(slot[3] for slot in slots), 0, 0, []
+    )
+    gained, cost, steps = best
+    steps.sort(key=lambda s: (s[2], s[0]))
+    return steps, cost, gained
+
+
+def _fill(steps, room, at):
+    """
+    Returns the most gain steps fit in room, measuring each by step[at]
+    and taking part of a step if it doesn't fit whole.
+    """
+    total = 0
+    for step in sorted(steps, key=lambda s: s[0] / (s[at] or 1e-9),
+                       reverse=True):
+        if step[at] > room:
+            return total + step[0] * room / step[at]
+        room -= step[at]
+        total += step[0]
+    return total
+
+
+@lru_cache(maxsize=4096)
+def _chain(ptype, ptier, level, objective):
+    """
+    Returns (level, cost, duration, value) for each upgrade left on a
+    planet from level, where value is the credit cap gained, or the hourly
+    shipment value gained for "income". Shared by every slot (and every
+    query) with the same planet.
+    """
+    base = shipment_base(ptype, ptier)
+    return [
+        (lv, UPGRADE_COST[lv], UPGRADE_DURATION[lv],
+         CREDIT_STORAGE[lv + 1] - CREDIT_STORAGE[lv] if objective == "cap"
+         else SHIPMENT_VALUE[base + lv + 1] - SHIPMENT_VALUE[base + lv])
+        for lv in range(level, MAX_LEVEL[ptier])
+    ]
+
+
+# Chains read SHIPMENT_VALUE
+gamedata.ON_RELOAD.append(_chain.cache_clear)
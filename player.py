@@ -0,0 +1,135 @@
+from array import array
+from types import MappingProxyType
+
+
+class Player:
+    """
+    A player's planets and settings in a fixed slot layout.
+
+    Levels and upgrade deadlines live in typed arrays, one entry per slot,
+    with a deadline of 0 meaning not upgrading. Planet names are indexed
+    by name so a planet can be found without scanning every slot.
+    Round-trips losslessly to the {"planets": [...], "settings": {...},
+    "blueprints": {...}, "offset": n} JSON format (blueprints may be
+    missing, and offset is left out when 0).
+
+    Deadlines are stored as base times; the effective deadline is the base
+    minus the player's offset, so shifting every timer a player has (the
+    Time Machine) only changes the offset. The JSON form stores base times.
+    """
+    __slots__ = (
+        "names", "levels", "until", "slots", "settings", "blueprints",
+        "offset"
+    )
+
+    def __init__(self, size, settings=None, blueprints=None, offset=0):
+        self.names = [None] * size
+        self.levels = array("B", bytes(size))
+        self.until = array("q", bytes(8 * size))
+        self.slots = {}  # Planet name -> first slot with that name
+        self.settings = settings if settings is not None else {
+            "ping_when_upgraded": False
+        }
+        # Research module name -> blueprints collected
+        self.blueprints = blueprints if blueprints is not None else {}
+        self.offset = offset  # Seconds every deadline has been brought forward
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Returns a Player built from its JSON form.
+        """
+        player = cls(
+            len(data["planets"]), data["settings"], data.get("blueprints"),
+            data.get("offset", 0)
+        )
+        for slot, planet in enumerate(data["planets"]):
+            player.set_stored_planet(slot, planet)
+        return player
+
+    def to_json(self):
+        """
+        Returns the player in its JSON form.
+        """
+        data = {
+            "planets": [
+                self.stored_planet(i) for i in range(len(self.names))
+            ],
+            "settings": dict(self.settings),
+            "blueprints": dict(self.blueprints)
+        }
+        if self.offset:
+            data["offset"] = self.offset
+        return data
+
+    def snapshot(self):
+        """
+        Returns a read-only copy of the player that shares nothing with it,
+        for readers that must not see (or make) later changes.
+        """
+        copy = Player.__new__(Player)
+        copy.names = tuple(self.names)
+        copy.levels = bytes(self.levels)
+        copy.until = tuple(self.until)
+        copy.slots = MappingProxyType(dict(self.slots))
+        copy.settings = MappingProxyType(dict(self.settings))
+        copy.blueprints = MappingProxyType(dict(self.blueprints))
+        copy.offset = self.offset
+        return copy
+
+    def planet(self, slot):
+        """
+        Returns [name, level, upgrade_until] for a slot.
+        """
+        return [self.names[slot], self.levels[slot], self.upgrade_until(slot)]
+
+    def stored_planet(self, slot):
+        """
+        Returns [name, level, base upgrade_until] for a slot, as stored.
+        """
+        return [self.names[slot], self.levels[slot], self.base_until(slot)]
+
+    def upgrade_until(self, slot):
+        """
+        Returns when a slot's upgrade finishes, or None if not upgrading.
+        """
+        return self.until[slot] - self.offset if self.until[slot] else None
+
+    def base_until(self, slot):
+        """
+        Returns a slot's base deadline (before the offset), or None if not
+        upgrading.
+        """
+        return self.until[slot] or None
+
+    def slot_of(self, name):
+        """
+        Returns the slot of the named planet, or None if there isn't one.
+        """
+        return self.slots.get(name)
+
+    def set_planet(self, slot, planet):
+        """
+        Sets a slot from [name, level, upgrade_until].
+        """
+        name, level, upgr_until = planet
+        self.set_stored_planet(
+            slot, [name, level, upgr_until and upgr_until + self.offset]
+        )
+
+    def set_stored_planet(self, slot, planet):
+        """
+        Sets a slot from [name, level, base upgrade_until].
+        """
+        name, level, upgr_until = planet
+        old = self.names[slot]
+        self.names[slot] = name
+        self.levels[slot] = level
+        self.until[slot] = upgr_until or 0
+        if old != name:
+            if self.slots.get(old) == slot:
+                del self.slots[old]
+                if old in self.names:
+                    self.slots[old] = self.names.index(old)
+            if name is not None:
+                self.slots[name] = min(slot, self.slots.get(name, slot))
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from json import dumps, loads
+
+from player import Player
+
+
+class PlayerCache:
+    """
+    A size-bounded, least recently used cache of Players over a store.
+
+    Players are read from the store (see read_player) on first access.
+    A player changed since the last compaction is dirty: if it is evicted,
+    its JSON form is written back to an overlay that is checked before the
+    store, until a compaction has folded the change into the store. Only
+    the cache and the overlay are held in memory, never the whole
+    population. Supports the parts of the dict interface the bot uses.
+    """
+    def __init__(self, store, capacity, on_evict=None):
+        self.store = store
+        self.capacity = max(1, capacity)
+        self.on_evict = on_evict  # Called with each evicted pid
+        self.players = OrderedDict()  # pid -> Player, least recent first
+        self.dirty = {}  # pid -> generation it was last changed in
+        self.overlay = {}  # pid -> (generation, JSON) for evicted players
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, pid):
+        try:
+            self[pid]
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, pid):
+        player = self.players.get(pid)
+        if player is not None:
+            self.players.move_to_end(pid)
+            self.hits += 1
+            return player
+        self.misses += 1
+        if pid in self.overlay:
+            self.dirty[pid], data = self.overlay.pop(pid)
+            data = loads(data)
+        else:
+            data = self.store.read_player(pid)
+            if data is None:
+                raise KeyError(pid)
+        player = Player.from_json(data)
+        self._insert(pid, player)
+        return player
+
+    def __setitem__(self, pid, player):
+        self.overlay.pop(pid, None)
+        self.mark_dirty(pid)
+        self._insert(pid, player)
+
+    def __len__(self):
+        """
+        Returns the number of players held in memory.
+        """
+        return len(self.players)
+
+    def __iter__(self):
+        for pid, _ in self.items():
+            yield pid
+
+    def items(self):
+        """
+        Yields (pid, Player) for every player. Players that aren't cached
+        are read straight from the store without being cached.
+        """
+        seen = set(self.players)
+        yield from list(self.players.items())
+        for pid, (_, data) in list(self.overlay.items()):
+            seen.add(pid)
+            yield pid, Player.from_json(loads(data))
+        for pid, data in self.store.iter_players():
+            if pid not in seen:
+                yield pid, Player.from_json(data)
+
+    def values(self):
+        for _, player in self.items():
+            yield player
+
+    def mark_dirty(self, pid):
+        """
+        Records that a cached player has been changed.
+        """
+        self.dirty[pid] = self.generation
+
+    def stored(self, pids):
+        """
+        Forgets changes to pids now that the store holds them, for stores
+        that write changes in place instead of at compaction.
+        """
+        for pid in pids:
+            self.dirty.pop(pid, None)
+            self.overlay.pop(pid, None)
+
+    def begin_compaction(self):
+        """
+        Returns the generation of changes the next compaction will include.
+        """
+        self.generation += 1
+        return self.generation - 1
+
+    def end_compaction(self, generation):
+        """
+        Forgets changes up to generation, now that the store holds them.
+        """
+        self.dirty = {
+            pid: gen for pid, gen in self.dirty.items() if gen > generation
+        }
+        self.overlay = {
+            pid: entry for pid, entry in self.overlay.items()
+            if entry[0] > generation
+        }
+
+    def _insert(self, pid, player):
+        self.players[pid] = player
+        while len(self.players) > self.capacity:
+            old, evicted = self.players.popitem(last=False)
+            if old in self.dirty:
+                self.overlay[old] = (
+                    self.dirty.pop(old),
+                    dumps(evicted.to_json(), separators=(",", ":"))
+                )
+            if self.on_evict is not None:
+                self.on_evict(old)
@@ -0,0 +1,131 @@
+from bisect import bisect_left, insort
+
+
+LOAD = 1000  # Entries per sublist, split in two past twice this
+
+
+class Board:
+    """
+    Players ranked by a score, highest first.
+
+    Entries are kept sorted by (-score, pid), so ties are ranked by pid, in
+    a list of sorted sublists of up to 2 * LOAD entries each, with the last
+    entry of each sublist alongside to bisect, and a Fenwick tree over the
+    sublists' lengths to count the entries ahead of a sublist. Adding,
+    moving (a changed score) and ranking an entry each take O(log n) steps,
+    plus shifting the rest of one bounded sublist, and the top N are the
+    first N entries. Sublists are split or dropped (and the tree rebuilt)
+    only once every LOAD or so changes to them.
+    """
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})  # pid -> score
+        keys = sorted((-score, pid) for pid, score in self.scores.items())
+        self.lists = [keys[i:i + LOAD] for i in range(0, len(keys), LOAD)]
+        self.maxes = [keys[-1] for keys in self.lists]
+        self.tree = None
+        self._index()
+
+    def __len__(self):
+        return len(self.scores)
+
+    def set(self, pid, score):
+        """
+        Sets a player's score, adding them if they aren't ranked.
+        """
+        old = self.scores.get(pid)
+        if old == score:
+            return
+        if old is not None:
+            self._remove((-old, pid))
+        self._insert((-score, pid))
+        self.scores[pid] = score
+
+    def add(self, pid, delta):
+        """
+        Changes a player's score by delta.
+        """
+        self.set(pid, self.scores.get(pid, 0) + delta)
+
+    def rank(self, pid):
+        """
+        Returns a player's (rank, score), counting from 1, or None if they
+        aren't ranked.
+        """
+        score = self.scores.get(pid)
+        if score is None:
+            return None
+        key = (-score, pid)
+        i = bisect_left(self.maxes, key)
+        return self._before(i) + bisect_left(self.lists[i], key) + 1, score
+
+    def top(self, count):
+        """
+        Returns (pid, score) for the count highest ranked players.
+        """
+        top = []
+        for keys in self.lists:
+            top.extend((pid, -score) for score, pid in keys[:count - len(top)])
+            if len(top) == count:
+                break
+        return top
+
+    def _insert(self, key):
+        if not self.lists:
+            self.lists, self.maxes = [[key]], [key]
+            self._index()
+            return
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            i -= 1
+            self.maxes[i] = key
+        keys = self.lists[i]
+        insort(keys, key)
+        if len(keys) > 2 * LOAD:
+            self.lists.insert(i + 1, keys[LOAD:])
+            self.maxes.insert(i + 1, keys[-1])
+            del keys[LOAD:]
+            self.maxes[i] = keys[-1]
+            self._index()
+        else:
+            self._grow(i, 1)
+
+    def _remove(self, key):
+        i = bisect_left(self.maxes, key)
+        keys = self.lists[i]
+        del keys[bisect_left(keys, key)]
+        if keys:
+            self.maxes[i] = keys[-1]
+            self._grow(i, -1)
+        else:
+            del self.lists[i], self.maxes[i]
+            self._index()
+
+    def _index(self):
+        """
+        Rebuilds the Fenwick tree from the sublists' lengths.
+        """
+        tree = [0] + [len(keys) for keys in self.lists]
+        for i in range(1, len(tree)):
+            j = i + (i & -i)
+            if j < len(tree):
+                tree[j] += tree[i]
+        self.tree = tree
+
+    def _grow(self, i, delta):
+        """
+        Records that sublist i's length changed by delta.
+        """
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _before(self, i):
+        """
+        Returns the number of entries in the sublists before sublist i.
+        """
+        count = 0
+        while i:
+            count += self.tree[i]
+            i -= i & -i
+        return count
@@ -0,0 +1,297 @@
+"""
+Replays a captured command log (see capture.py) offline.
+
+Usage: python replay.py CAPTURE_FILE [--speed 10] [--output results.json]
+
+Run from the repository root, like benchmark.py. The players saved when
+the capture started are copied into a temporary store, and each command
+is fed to planets/research through the benchmark's fake interactions, at
+the captured pace (--speed 1), sped up (--speed 10) or back to back, as
+fast as possible (--speed 0). The handlers' clock follows the capture's,
+so timers land where they did, and each player's commands run in the
+order they were captured at any speed. Reports throughput, latency percentiles
+(next to the captured ones) and whether the players end up as they were
+saved when the capture stopped.
+"""
+import asyncio
+import json
+from argparse import ArgumentParser
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+
+import analytics
+import forecast
+import gamedata
+import planets
+import research
+import simulation
+from benchmark import FakeChannel, FakeInter
+from player import Player
+from store import JournalStore
+
+
+# Captured command name -> handler taking the captured arguments in order
+COMMANDS = {
+    "upgrade_planet": planets.upgrade_planet,
+    "shift_upgrade_times": planets.shift_upgrade_times,
+    "shift_all_upgrade_times": planets.shift_all_upgrade_times,
+    "add_planet": planets.add_planet,
+    "list_planets": planets.list_planets,
+    "upgrade_details": planets.upgrade_details,
+    "cap_at": planets.cap_at,
+    "plan_upgrades": planets.plan_upgrades,
+    "forecast": forecast.forecast,
+    "leaderboard": planets.leaderboard,
+    "guild_report": analytics.guild_report,
+    "notification_stats": planets.notification_stats,
+    "reload_game_data": gamedata.reload_game_data,
+    "artifact_count": research.artifact_count,
+    "artifact_table": research.artifact_table,
+    "artifact_simulation": simulation.artifact_simulation,
+    "blueprints_set": research.set_blueprint,
+    "blueprints_import": research.import_blueprints,
+    "blueprints_arts": research.saved_artifact_count,
+    "ping_upgraded": lambda inter, flag: planets.change_bool_settings(
+        inter, "ping_when_upgraded", flag
+    ),
+    "view": planets.view_settings,
+}
+# Commands changing every player's state, which run once everything
+# before them has finished and before anything after them starts
+GLOBAL = {"shift_all_upgrade_times", "reload_game_data"}
+PERCENTILES = (50, 90, 99)
+
+
+class Clock:
+    """
+    The time the handlers see during a replay, in place of time.time.
+
+    At a speed, captured time passes that many times faster than real
+    time from the start of the replay. Otherwise it is set to each
+    command's captured time as the command is run.
+    """
+    def __init__(self, start, speed):
+        self.start = start
+        self.speed = speed
+        self.now = start
+        self.wall = perf_counter()
+
+    def __call__(self):
+        if self.speed:
+            return self.start + (perf_counter() - self.wall) * self.speed
+        return self.now
+
+    def due(self, captured):
+        """
+        Returns the seconds until a command captured at captured is due.
+        """
+        if not self.speed:
+            return 0
+        return (captured - self.start) / self.speed - (
+            perf_counter() - self.wall
+        )
+
+
+def read_capture(filename):
+    """
+    Returns the captured commands in the order they started, and the
+    start and end player saves (the end is None if the bot didn't stop
+    cleanly).
+    """
+    with open(filename) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.sort(key=lambda entry: entry[0])
+    saves = []
+    for suffix in [".start.json", ".end.json"]:
+        saves.append(None)
+        if path.exists(filename + suffix):
+            with open(filename + suffix) as f:
+                saves[-1] = json.load(f)
+    if saves[0] is None:
+        raise ValueError(f"{filename}.start.json: missing")
+    return entries, *saves
+
+
+async def replay(entries, start, end, speed, tolerance, workdir):
+    """
+    Replays entries from the start player save, returning the report.
+    """
+    store = JournalStore(
+        path.join(workdir, "players.json"),
+        path.join(workdir, "players.journal")
+    )
+    with open(store.snapshot, "w") as f:
+        json.dump(start["players"], f)
+    planets._use_player_info(store, *planets._load_players(store))
+    clock = Clock(entries[0][0] if entries else start["time"], speed)
+    planets.time = forecast.time = clock
+    channels = {}
+    latencies = {}
+    failures = {}
+
+    async def run(entry, after=()):
+        _, command, author, channel_id, args, _ = entry
+        # A player's commands run in the order they were captured, even
+        # when an earlier one is still running when a later one is due
+        await asyncio.gather(*after)
+        if channel_id not in channels:
+            channels[channel_id] = FakeChannel(channel_id or 0)
+        inter = FakeInter(author, channels[channel_id])
+        begin = perf_counter()
+        try:
+            # Every /hs command checks for completed upgrades first
+            await planets.check_planet_upgrade_status(inter.channel)
+            await COMMANDS[command](inter, *args)
+        except Exception:
+            failures[command] = failures.get(command, 0) + 1
+        else:
+            latencies.setdefault(command, []).append(perf_counter() - begin)
+
+    started = perf_counter()
+    running = []
+    last = {}  # author -> the task running their latest command
+    barrier = []  # The task running the latest global command
+    for entry in entries:
+        if speed:
+            await asyncio.sleep(max(0, clock.due(entry[0])))
+            author = entry[2]
+            if entry[1] in GLOBAL:
+                after = [task for task in running if not task.done()]
+            else:
+                after = barrier + [last[author]] if author in last else barrier
+            task = asyncio.create_task(run(entry, after))
+            running.append(task)
+            last[author] = task
+            if entry[1] in GLOBAL:
+                barrier = [task]
+        else:
+            clock.now = entry[0]
+            await run(entry)
+    await asyncio.gather(*running)
+    elapsed = perf_counter() - started
+
+    # Timers that ran out before the capture stopped have completed
+    if end is not None:
+        clock.speed, clock.now = 0, end["time"]
+    await planets.check_planet_upgrade_status(FakeChannel())
+    await planets.STATE.drain()
+    await planets.WRITER.flush()
+    planets.time = forecast.time = time
+    differing = None
+    if end is not None:
+        differing = compare(end["players"], store.load(), tolerance)
+    return report(entries, latencies, failures, elapsed, differing)
+
+
+def compare(expected, actual, tolerance):
+    """
+    Returns the pids of players that differ between two {pid: player}
+    dicts in JSON form, allowing upgrade timers to be up to tolerance
+    seconds apart. Players only in actual (created by read-only commands
+    the capture missed) are ignored.
+    """
+    differing = []
+    for pid, data in expected.items():
+        if pid not in actual:
+            differing.append(pid)
+            continue
+        want, got = Player.from_json(data), Player.from_json(actual[pid])
+        same = (
+            want.names == got.names and want.levels == got.levels and
+            want.settings == got.settings and
+            want.blueprints == got.blueprints
+        )
+        for slot in range(len(want.names)):
+            want_until = want.upgrade_until(slot)
+            got_until = got.upgrade_until(slot)
+            if (want_until is None) != (got_until is None) or (
+                want_until is not None and
+                abs(want_until - got_until) > tolerance
+            ):
+                same = False
+        if not same:
+            differing.append(pid)
+    return differing
+
+
+def report(entries, latencies, failures, elapsed, differing):
+    """
+    Returns the replay's results, printing a summary.
+    """
+    replayed = sorted(t for times in latencies.values() for t in times)
+    captured = sorted(entry[5] for entry in entries)
+    results = {
+        "commands": len(entries),
+        "failed": failures,
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(entries) / max(elapsed, 1e-9),
+        "latency_s": _percentiles(replayed),
+        "captured_latency_s": _percentiles(captured),
+        "per_command": {
+            command: {"calls": len(times), "latency_s": _percentiles(
+                sorted(times)
+            )}
+            for command, times in sorted(latencies.items())
+        },
+        "state_matches": None if differing is None else not differing,
+        "differing_players": differing,
+    }
+    print(
+        f"{len(entries)} commands in {elapsed:.2f}s "
+        f"({results['throughput_per_s']:.1f}/s), "
+        f"{sum(failures.values())} failed"
+    )
+    for name, key in [
+        ("replayed", "latency_s"), ("captured", "captured_latency_s")
+    ]:
+        print(f"{name:>9} latency " + ", ".join(
+            f"{label} {seconds * 1000:.2f}ms"
+            for label, seconds in results[key].items()
+        ))
+    if differing is None:
+        print("No end save to compare with (the bot didn't stop cleanly)")
+    else:
+        print(
+            f"Final state matches the capture: {not differing}"
+            + (f" ({len(differing)} players differ)" if differing else "")
+        )
+    return results
+
+
+def _percentiles(ordered):
+    if not ordered:
+        return {}
+    stats = {
+        f"p{p}": ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+        for p in PERCENTILES
+    }
+    stats["max"] = ordered[-1]
+    return stats
+
+
+async def main(filename, speed, tolerance, output):
+    entries, start, end = read_capture(filename)
+    with TemporaryDirectory() as workdir:
+        results = await replay(entries, start, end, speed, tolerance, workdir)
+    results["capture"] = filename
+    results["speed"] = speed
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", help="The CAPTURE_FILE to replay.")
+    parser.add_argument(
+        "--speed", type=float, default=1.0,
+        help="Times faster than captured; 0 runs commands back to back."
+    )
+    parser.add_argument(
+        "--tolerance", type=int, default=5,
+        help="Seconds upgrade timers may be off by and still match."
+    )
+    parser.add_argument("--output", default="replay_results.json")
+    args = parser.parse_args()
+    asyncio.run(main(args.capture, args.speed, args.tolerance, args.output))
@@ -1,158 +1,384 @@
-from json import load
+from functools import lru_cache
 from math import ceil
 
+import gamedata
+import metrics
+import planets
+from gamedata import ART_LEVELS, CATEGORIES, COLORS
+
 
 ART_DROPS = None
 RESEARCH = None
+# Per color, [art level - 1][research level - 1] -> arts per drop
+AVG_DROP = None  # Average plus 20% bonus
+MODULES = None  # Module name -> (category, research level, requirement)
+MEMO_SIZE = 1024  # Blueprint vectors remembered by _arts_needed
+# pid -> {color: {research level: [arts left per art level]}} of a player's
+# saved blueprints, filled on first use
+ARTS_LEFT = {}
+planets.DERIVED.append(ARTS_LEFT)
 
 def load_info():
-    global ART_DROPS, RESEARCH
-    if ART_DROPS is None:
-        with open("art_drops.json") as f:
-            ART_DROPS = load(f)
-    if RESEARCH is None:
-        with open("research_info.json") as f:
-            RESEARCH = load(f)
+    """
+    Picks up the art drop and research tables loaded by gamedata.
+    """
+    global ART_DROPS, RESEARCH, AVG_DROP, MODULES
+    tables = gamedata.TABLES
+    if ART_DROPS is not tables["art_drops"]:
+        ART_DROPS = tables["art_drops"]
+        RESEARCH = tables["research"]
+        AVG_DROP = tables["avg_drop"]
+        MODULES = tables["modules"]
 
 
-async def artifact_count(
-    inter, art_level, trade, mining, weapons, shields, support
-):
-    load_info()
+def missing_blueprints(bps):
+    """
+    Returns {color: {research level: (blueprints missing, module names)}}
+    with one entry per module, sorted by research level.
+    bps holds one tuple of blueprint counts per category (-1 to skip).
+    """
+    missing = {color: {} for color in ["Blues", "Orbs", "Tets"]}
+    for category, counts in zip(CATEGORIES, bps):
+        levels = missing[COLORS[category]]
+        for (name, level, req), count in zip(RESEARCH[category], counts):
+            # Level 0 modules are unlocked from the start
+            if count > -1 and level > 0:
+                amts, names = levels.setdefault(level, ([], []))
+                amts.append(max(0, req - count))
+                names.append(name)
+    return {
+        color: dict(sorted(levels.items()))
+        for color, levels in missing.items()
+    }
+
 
+@lru_cache(maxsize=MEMO_SIZE)
+def _arts_needed(bps, art_levels):
+    """
+    Returns {color: {research level: [arts per art level, module names]}}
+    for research levels with blueprints still missing. Arts are None for
+    art levels too low to drop that research level's blueprints.
+    """
+    return {
+        color: {
+            level: [
+                [
+                    sum(
+                        ceil(amt / AVG_DROP[color][art_level - 1][level - 1])
+                        for amt in amts
+                    ) if level <= art_level else None
+                    for art_level in art_levels
+                ],
+                names
+            ]
+            for level, (amts, names) in levels.items()
+        }
+        for color, levels in missing_blueprints(bps).items()
+    }
+
+
+# Both are built from the art drop and research tables
+gamedata.ON_RELOAD.append(_arts_needed.cache_clear)
+gamedata.ON_RELOAD.append(ARTS_LEFT.clear)
+
+
+def _parse_blueprints(trade, mining, weapons, shields, support):
+    """
+    Returns the blueprint counts as a tuple per category, and an error
+    message if any category has the wrong number of modules.
+    """
     def parse(arg):
-        return [int(num) if num.isdecimal() else -1 for num in arg.split()]
-    
-    bps = [
-        parse(trade), parse(mining),
-        parse(weapons), parse(shields),
-        parse(support)
-    ]
-
-    given = [len(cat) for cat in bps]
-    order = ["Trade", "Mining", "Weapons", "Shields", "Support"]
-    expected = [len(RESEARCH[t]) for t in order]
+        return tuple(
+            int(num) if num.isdecimal() else -1 for num in arg.split()
+        )
+
+    bps = tuple(
+        parse(arg) for arg in [trade, mining, weapons, shields, support]
+    )
 
     msg = ""
-    for i in range(len(order)):
-        if given[i] != expected[i]:
+    for category, counts in zip(CATEGORIES, bps):
+        if len(counts) != len(RESEARCH[category]):
             msg += (
-                f'Expected {expected[i]} {order[i]} modules, '
-                f'recieved {given[i]}.\n'
+                f'Expected {len(RESEARCH[category])} {category} modules, '
+                f'recieved {len(counts)}.\n'
             )
+    return bps, msg.strip()
+
+
+def _art_emojis(inter):
+    return {
+        "Blues": inter.client.get_emoji(1014264731487440916),
+        "Orbs": inter.client.get_emoji(1014264732867366942),
+        "Tets": inter.client.get_emoji(1014264730350792714)
+    }
+
+
+@metrics.timed("hs_artifact_count_seconds")
+async def artifact_count(
+    inter, art_level, trade, mining, weapons, shields, support
+):
+    load_info()
+
+    bps, msg = _parse_blueprints(trade, mining, weapons, shields, support)
     if msg:
-        await inter.response.send_message(msg.strip())
+        await inter.response.send_message(msg)
         return
-    
-    # List of bps remaining, sorted by level and type
-    blues = [[] for _ in range(11)]
-    orbs = [[] for _ in range(11)]
-    tets = [[] for _ in range(11)]
-
-    def count_missing(art_type, bp_counts, art_color):
-        for i in range(len(RESEARCH[art_type])):
-            name, level, req = RESEARCH[art_type][i]
-            if bp_counts[i] > -1:
-                art_color[level - 1].append([max(0, req - bp_counts[i]), name])
-    
-    count_missing("Trade", bps[0], blues)
-    count_missing("Mining", bps[1], blues)
-    count_missing("Weapons", bps[2], orbs)
-    count_missing("Shields", bps[3], orbs)
-    count_missing("Support", bps[4], tets)
-
-    # color = [blues, blues, orbs, orbs, tets]
-    # for i in range(len(order)):
-    #     for j in range(len(RESEARCH[order[i]])):
-    #         _, level, req = RESEARCH[order[i]][j]
-    #         if bps[i][j] > -1:
-    #             color[i][level - 1].append(max(0, req - bps[i][j]))
-    
-    def compute_arts(art_color_str, art_color, emoji):
+
+    needed = _arts_needed(bps, (art_level,))
+
+    await inter.response.send_message(_arts_message(art_level, {
+        color: {
+            level: (arts, names)
+            for level, ((arts,), names) in levels.items()
+        }
+        for color, levels in needed.items()
+    }, _art_emojis(inter)))
+
+
+def _arts_message(art_level, needed, emojis):
+    """
+    Formats {color: {research level: (arts or None, module names)}}.
+    """
+    def compute_arts(art_color_str, emoji):
         msg = ""
-        for level in range(len(art_color)):
-            if not art_color[level]:
-                continue
-            msg += f"\nr{level+1}: "
-            if level + 1 > art_level:
+        for level, (arts, names) in needed[art_color_str].items():
+            msg += f"\nr{level}: "
+            if arts is None:
                 msg += ":warning: Will not recieve BPs for this level!"
                 continue
-            try:
-                avg_drop = sum(ART_DROPS[art_color_str][art_level - 1][level])
-                avg_drop *= 0.6  # Average plus 20% bonus
-                min_drop = ART_DROPS[art_color_str][art_level - 1][level][0]
-                min_drop *= 1.2  # 20% bonus
-            except IndexError:
-                print(f"IndexError on r{level} {art_color_str}")
-            else:
-                amts, names = list(zip(*art_color[level]))
-                msg += str(int(sum(
-                    [ceil(j / avg_drop) for j in amts]
-                )))
-                msg += f" ({', '.join(names)})"
-            
+            msg += f"{arts} ({', '.join(names)})"
+
         if not msg:
             msg += " Complete!\n"
-        
+
         return f"\n{emoji} {art_color_str}:" + msg + "\n"
-        
-    emojis = (
-        inter.client.get_emoji(1014264731487440916),
-        inter.client.get_emoji(1014264732867366942),
-        inter.client.get_emoji(1014264730350792714)
+
+    return (
+        f"Level {art_level} arts:" +
+        compute_arts("Blues", emojis["Blues"]) +
+        compute_arts("Orbs", emojis["Orbs"]) +
+        compute_arts("Tets", emojis["Tets"])
+    )
+
+
+@metrics.timed("hs_artifact_count_seconds")
+async def artifact_table(inter, trade, mining, weapons, shields, support):
+    """
+    Lists the total arts still needed per color at every art level.
+    """
+    load_info()
+
+    bps, msg = _parse_blueprints(trade, mining, weapons, shields, support)
+    if msg:
+        await inter.response.send_message(msg)
+        return
+
+    needed = _arts_needed(bps, tuple(range(1, ART_LEVELS + 1)))
+    emojis = _art_emojis(inter)
+
+    output = []
+    unreachable = False
+    for art_level in range(1, ART_LEVELS + 1):
+        line = []
+        for color in ["Blues", "Orbs", "Tets"]:
+            per_level = [
+                arts[art_level - 1] for arts, _ in needed[color].values()
+            ]
+            total = sum(arts for arts in per_level if arts is not None)
+            warn = ""
+            if None in per_level:
+                warn, unreachable = " :warning:", True
+            line.append(f"{emojis[color]} {total}{warn}")
+        output.append(f"Level {art_level}: " + " ".join(line))
+
+    if unreachable:
+        output.append(
+            ":warning: Will not recieve BPs for some research levels "
+            "still missing."
+        )
+    await inter.response.send_message("\n".join(output))
+
+
+### Saved blueprints
+
+async def set_blueprint(inter, module, count, art_level):
+    """
+    Saves a player's blueprint count for one research module.
+    Only the totals for that module's color and research level change.
+    """
+    load_info()
+    caller_id = str(inter.author.id)
+    await inter.response.send_message(await planets.STATE.submit(
+        _set_blueprint, caller_id, module, count, art_level
+    ))
+
+
+def _set_blueprint(caller_id, module, count, art_level):
+    planets.create_player_if_not_exists(caller_id)
+
+    name = _find_module(module)
+    if name is None:
+        return "Research module not found. Check the spelling of the name."
+    category, level, req = MODULES[name]
+    color = COLORS[category]
+
+    # Adjust the totals by this module's change
+    player = planets.PLAYER_INFO[caller_id]
+    totals = _arts_left(caller_id)
+    before = _color_arts(totals, color, level, art_level)
+    old = player.blueprints.get(name)
+    if old is not None:
+        _add_module(totals, name, old, -1)
+    player.blueprints[name] = count
+    _add_module(totals, name, count, 1)
+    planets._log_change("blueprint", caller_id, name, count)
+    after = _color_arts(totals, color, level, art_level)
+
+    # Respond
+    msg = (
+        f"Set __{name}__ (r{level} {color}) "
+        f"{'' if old is None else f'from {old} '}to {count}/{req} BPs."
     )
+    if level > art_level:
+        msg += (
+            f"\n:warning: Level {art_level} arts will not drop r{level} BPs!"
+        )
+    elif level > 0:
+        msg += (
+            f"\nLevel {art_level} arts for r{level} {color}: "
+            f"{before[0]} -> {after[0]}\n"
+            f"Level {art_level} arts for all {color}: "
+            f"{before[1]} -> {after[1]}"
+        )
+    return msg
+
 
+async def import_blueprints(
+    inter, trade, mining, weapons, shields, support
+):
+    """
+    Replaces all of a player's saved blueprint counts at once.
+    Takes the same five blueprint strings as artifact_count.
+    """
+    load_info()
+    caller_id = str(inter.author.id)
+
+    bps, msg = _parse_blueprints(trade, mining, weapons, shields, support)
+    if msg:
+        await inter.response.send_message(msg)
+        return
+
+    saved = await planets.STATE.submit(_import_blueprints, caller_id, bps)
     await inter.response.send_message(
-        f"Level {art_level} arts:" +
-        compute_arts("Blues", blues, emojis[0]) +
-        compute_arts("Orbs", orbs, emojis[1]) +
-        compute_arts("Tets", tets, emojis[2])
+        f"Saved blueprint counts for {saved} modules."
     )
 
-    # art_color_str = ("Blues", "Orbs", "Tets")
-    # art_colors = (blues, orbs, tets)
-
-    # for emoji, cstr, color in zip(emojis, art_color_str, art_colors):
-    #     compute_arts(cstr, color)
-    #     msg += f"\n{emoji} {cstr}:"
-    #     if sum(color) > 0:
-    #         msg += "\n"
-    #         for i in range(len(color)):
-    #             if color[i] > 0:
-    #                 msg += f"r{i+1}: {color[i]}\n"
-    #     else:
-    #         msg += " Complete!\n"
-    #     if cstr in warn:
-    #         msg += ":warning: Warning: still missing higher level BPs!\n"
-
-    # msg += ":blue7: Blues:"
-    # if sum(blues) > 0:
-    #     msg += "\n"
-    #     for i in range(len(blues)):
-    #         msg += f"r{i+1}: {blues[i]}\n"
-    # else:
-    #     msg += " Complete!\n"
-    # if "Blues" in warn:
-    #     msg += ":warning: Warning: still missing higher level BPs!\n"
-    
-    # msg += "\n:orb7: Orbs:"
-    # if sum(orbs) > 0:
-    #     msg += "\n"
-    #     for i in range(len(orbs)):
-    #         msg += f"r{i+1}: {orbs[i]}\n"
-    # else:
-    #     msg += " Complete!\n"
-    # if "Orbs" in warn:
-    #     msg += ":warning: Warning: still missing higher level BPs!\n"
-
-    # msg += "\n:tet7: Tets:"
-    # if sum(tets) > 0:
-    #     msg += "\n"
-    #     for i in range(len(tets)):
-    #         msg += f"r{i+1}: {tets[i]}\n"
-    # else:
-    #     msg += " Complete!\n"
-    # if "Tets" in warn:
-    #     msg += ":warning: Warning: still missing higher level BPs!\n"
-    
-    # await inter.response.send_message(msg.strip())
+
+def _import_blueprints(caller_id, bps):
+    planets.create_player_if_not_exists(caller_id)
+
+    player = planets.PLAYER_INFO[caller_id]
+    player.blueprints = {
+        name: count
+        for category, counts in zip(CATEGORIES, bps)
+        for (name, _, _), count in zip(RESEARCH[category], counts)
+        if count > -1
+    }
+    ARTS_LEFT.pop(caller_id, None)
+    planets._log_change("player", caller_id, player.to_json())
+    return len(player.blueprints)
+
+
+async def saved_artifact_count(inter, art_level):
+    """
+    Lists the arts still needed for a player's saved blueprints.
+    """
+    load_info()
+    caller_id = str(inter.author.id)
+    player = await planets.player_snapshot(caller_id)
+    if not player.blueprints:
+        await inter.response.send_message(
+            "No blueprints saved yet. Save them with /hs blueprints import."
+        )
+        return
+
+    totals = _arts_left(caller_id)
+    needed = {color: {} for color in ["Blues", "Orbs", "Tets"]}
+    for category in CATEGORIES:
+        color = COLORS[category]
+        for name, level, _ in RESEARCH[category]:
+            if name in player.blueprints and level > 0:
+                arts = totals[color][level][art_level - 1]
+                entry = needed[color].setdefault(
+                    level, (arts if level <= art_level else None, [])
+                )
+                entry[1].append(name)
+    needed = {
+        color: dict(sorted(levels.items()))
+        for color, levels in needed.items()
+    }
+
+    await inter.response.send_message(
+        _arts_message(art_level, needed, _art_emojis(inter))
+    )
+
+
+def module_names(prefix):
+    """
+    Returns up to 25 research module names containing prefix.
+    """
+    load_info()
+    prefix = prefix.lower()
+    return [name for name in MODULES if prefix in name.lower()][:25]
+
+
+def _find_module(name):
+    if name in MODULES:
+        return name
+    return next(
+        (module for module in MODULES if module.lower() == name.lower()),
+        None
+    )
+
+
+def _arts_left(pid):
+    """
+    Returns a player's arts left per color and research level, kept up to
+    date by set_blueprint after the first full count.
+    """
+    if pid not in ARTS_LEFT:
+        totals = {color: {} for color in ["Blues", "Orbs", "Tets"]}
+        for name, count in planets.PLAYER_INFO[pid].blueprints.items():
+            _add_module(totals, name, count, 1)
+        ARTS_LEFT[pid] = totals
+    return ARTS_LEFT[pid]
+
+
+def _add_module(totals, name, count, sign):
+    """
+    Adds (sign 1) or removes (sign -1) one module's arts left.
+    """
+    if name not in MODULES:
+        return
+    category, level, req = MODULES[name]
+    if level == 0:
+        return
+    color = COLORS[category]
+    level_totals = totals[color].setdefault(level, [0] * ART_LEVELS)
+    missing = max(0, req - count)
+    for art_level in range(level, ART_LEVELS + 1):
+        level_totals[art_level - 1] += sign * ceil(
+            missing / AVG_DROP[color][art_level - 1][level - 1]
+        )
+
+
+def _color_arts(totals, color, level, art_level):
+    """
+    Returns the arts left at art_level for one research level and for the
+    whole color.
+    """
+    return (
+        totals[color].get(level, [0] * ART_LEVELS)[art_level - 1],
+        sum(arts[art_level - 1] for arts in totals[color].values())
+    )
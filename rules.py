@@ -0,0 +1,144 @@
+from array import array
+from enum import Enum
+
+
+PTYPE = Enum("PTYPE", ["Desert", "Fire", "Water", "Terran", "Gas", "Ice"])
+
+MAX_LEVEL = array("l", [0, 15, 20, 35, 50])  # Indexed by tier
+LEVELS = MAX_LEVEL[-1] + 2  # Room to look up level + 1 of a maxed planet
+TIERS = len(MAX_LEVEL)
+
+# (type, tier, discriminator) of the planet in each slot
+PORDER = [
+    (PTYPE.Desert, 1, ""),
+    (PTYPE.Fire,   1, ""),
+    (PTYPE.Water,  1, ""),
+    (PTYPE.Terran, 1, ""),
+    (PTYPE.Gas,    2, ""),
+    (PTYPE.Terran, 3, ""),
+    (PTYPE.Fire,   3, ""),
+    (PTYPE.Water,  3, ""),
+    (PTYPE.Gas,    4, ""),
+    (PTYPE.Desert, 3, ""),
+    (PTYPE.Fire,   4, ""),
+    (PTYPE.Desert, 4, ""),
+    (PTYPE.Water,  4, ""),
+    (PTYPE.Terran, 4, ""),
+    (PTYPE.Ice,    4, "a"),
+    (PTYPE.Ice,    4, "b")
+]
+
+### Formulas, only evaluated while building the tables
+
+def _upgrade_cost(cur_lv: int):
+    """
+    Returns the cost to upgrade a planet given its current level.
+    """
+    if cur_lv < 8:
+        return [0, 50, 200, 400, 800, 2000, 4000, 8000][cur_lv]
+    elif cur_lv < 13:
+        return 10000 * (cur_lv - 7)
+    elif cur_lv < 19:
+        return 25000 * (cur_lv - 10)
+    elif cur_lv < 25:
+        return [250, 300, 400, 500, 600, 800][cur_lv - 19] * 1000
+    elif cur_lv < 33:
+        return 250000 * (cur_lv - 21)
+    elif cur_lv < 50:
+        return 500000 * (cur_lv - 27)
+    else:
+        return 0
+
+
+def _upgrade_duration(cur_lv: int):
+    """
+    Returns the number of seconds for a planet upgrade given its current level.
+    """
+    if cur_lv < 13:
+        return [
+            0, 3, 30, 60, 120, 300, 1200, 3600, 4*3600, 8*3600, 16*3600,
+            24*3600, 36*3600
+        ][cur_lv]
+    else:
+        return min(12*3600 * (cur_lv - 8), 14*24*3600)
+
+
+def _credit_storage(cur_lv: int):
+    """
+    Returns the current credit storage for a planet given its level.
+    """
+    if cur_lv < 18:
+        return [
+            0, 1000, 1400, 1800, 3000, 4000, 5000, 6000, 7500, 10000, 13000,
+            16000, 20000, 24000, 28000, 35000, 45000, 65000
+        ][cur_lv]
+    else:
+        return min(40000 * (cur_lv - 16) + 10000, 1370000)
+
+
+def _hydro_storage(cur_lv: int):
+    """
+    Returns the current hydro storage for a planet given its level.
+    Note that fire planets do not increase hydro storage.
+    """
+    if cur_lv < 20:
+        return [
+            0, 200, 260, 340, 450, 570, 750, 960, 1250, 1600, 2100, 2750, 3600,
+            5000, 7000, 9000, 11000, 13000, 15000, 17000
+        ][cur_lv]
+    else:
+        return min(1000 * (cur_lv - 1), 49000)
+
+
+def shipment_table(shipments, filename="planet_shipments.json"):
+    """
+    Returns the flat shipment value table built from the shipments file's
+    contents. Every planet type must list either no values for a tier (the
+    tier does not exist) or exactly one value per level up to the tier's
+    max level, and every planet in PORDER needs its values.
+    """
+    table = array("l", [0]) * (len(PTYPE) * TIERS * LEVELS)
+    for ptype in PTYPE:
+        tiers = shipments.get(ptype.name)
+        if tiers is None or len(tiers) != TIERS - 1:
+            raise ValueError(
+                f"{filename}: expected {TIERS - 1} tiers for {ptype.name}."
+            )
+        for ptier, values in enumerate(tiers, start=1):
+            if values and len(values) != MAX_LEVEL[ptier]:
+                raise ValueError(
+                    f"{filename}: {ptype.name} Tier {ptier} has "
+                    f"{len(values)} levels, expected {MAX_LEVEL[ptier]}."
+                )
+            for level, value in enumerate(values, start=1):
+                if not isinstance(value, int) or value <= 0:
+                    raise ValueError(
+                        f"{filename}: {ptype.name} Tier {ptier} Level "
+                        f"{level} has invalid value {value!r}."
+                    )
+                table[shipment_base(ptype, ptier) + level] = value
+    for ptype, ptier, _ in PORDER:
+        if not shipments[ptype.name][ptier - 1]:
+            raise ValueError(
+                f"{filename}: {ptype.name} Tier {ptier} has no levels, "
+                f"but is a planet slot."
+            )
+    return table
+
+
+def shipment_base(ptype: PTYPE, ptier: int):
+    """
+    Returns the offset of a planet's level 0 entry in SHIPMENT_VALUE.
+    """
+    return ((ptype.value - 1) * TIERS + ptier) * LEVELS
+
+
+### Tables, indexed by level
+
+UPGRADE_COST = array("l", map(_upgrade_cost, range(LEVELS)))
+UPGRADE_DURATION = array("l", map(_upgrade_duration, range(LEVELS)))
+CREDIT_STORAGE = array("l", map(_credit_storage, range(LEVELS)))
+HYDRO_STORAGE = array("l", map(_hydro_storage, range(LEVELS)))
+# Hourly shipments, SHIPMENT_VALUE[shipment_base(ptype, tier) + level]
+# Filled in place by gamedata when it is imported
+SHIPMENT_VALUE = array("l", [0]) * (len(PTYPE) * TIERS * LEVELS)
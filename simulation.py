@@ -0,0 +1,126 @@
+from asyncio import to_thread
+from math import ceil, sqrt
+from random import randrange
+
+import numpy as np
+
+import metrics
+import research
+
+
+TRIALS = 100_000
+BONUS = 1.2  # Every drop gets a 20% blueprint bonus
+# Modules needing more drops than this on average are approximated
+DIRECT_DRAWS = 32
+PERCENTILES = (50, 90, 99)
+
+
+def drops_needed(rng, amount, low, high, trials=TRIALS):
+    """
+    Returns how many drops of low..high blueprints (plus the bonus) each
+    trial took to collect amount blueprints.
+
+    Drops are drawn directly while few are needed. Beyond DIRECT_DRAWS
+    drops on average the count is close to normal (renewal central limit
+    theorem), so it is drawn from a normal with the same mean and variance.
+    """
+    if amount <= 0:
+        return np.zeros(trials, dtype=np.int64)
+    mean = (low + high) / 2 * BONUS
+    if amount / mean > DIRECT_DRAWS:
+        var = ((high - low + 1) ** 2 - 1) / 12 * BONUS ** 2
+        spread = sqrt(amount * var / mean ** 3)
+        needed = amount / mean + rng.standard_normal(trials) * spread
+        return np.maximum(1, np.ceil(needed)).astype(np.int64)
+
+    # Draw a block of drops per trial, redrawing for trials that fall short
+    block = min(DIRECT_DRAWS, ceil(amount / mean * 1.5) + 2)
+    needed = np.zeros(trials, dtype=np.int64)
+    collected = np.zeros(trials)
+    active = np.arange(trials)
+    while active.size:
+        drops = rng.integers(low, high + 1, size=(active.size, block))
+        totals = collected[active, None] + np.cumsum(drops * BONUS, axis=1)
+        done = totals[:, -1] >= amount
+        needed[active[done]] += np.argmax(totals[done] >= amount, axis=1) + 1
+        needed[active[~done]] += block
+        collected[active[~done]] = totals[~done, -1]
+        active = active[~done]
+    return needed
+
+
+@metrics.timed("hs_artifact_simulation_seconds")
+def simulate(bps, art_level, seed, trials=TRIALS):
+    """
+    Returns {color: {research level: (p50, p90, p99)}} of arts needed to
+    finish each research level, plus a "total" entry per color. Research
+    levels above art_level can't drop from these arts and are None.
+    Runs with the same seed give the same answer.
+    """
+    rng = np.random.default_rng(seed)
+    # Held for the whole run, in case the game data is reloaded meanwhile
+    art_drops = research.ART_DROPS
+    results = {}
+    for color, levels in research.missing_blueprints(bps).items():
+        results[color] = {}
+        total = np.zeros(trials, dtype=np.int64)
+        for level, (amts, _) in levels.items():
+            if level > art_level:
+                results[color][level] = None
+                continue
+            low, high = art_drops[color][art_level - 1][level - 1]
+            arts = sum(
+                drops_needed(rng, amt, low, high, trials) for amt in amts
+            )
+            total += arts
+            results[color][level] = _percentiles(arts)
+        if levels:
+            results[color]["total"] = _percentiles(total)
+    return results
+
+
+def _percentiles(samples):
+    return tuple(
+        int(p) for p in np.percentile(samples, PERCENTILES, method="higher")
+    )
+
+
+async def artifact_simulation(
+    inter, art_level, trade, mining, weapons, shields, support, seed=None
+):
+    """
+    Simulates opening arts and reports how many each research level
+    needs at the 50th, 90th and 99th percentile.
+    """
+    research.load_info()
+
+    bps, msg = research._parse_blueprints(
+        trade, mining, weapons, shields, support
+    )
+    if msg:
+        await inter.response.send_message(msg)
+        return
+
+    if seed is None:
+        seed = randrange(2 ** 32)
+    results = await to_thread(simulate, bps, art_level, seed)
+    emojis = research._art_emojis(inter)
+
+    output = [
+        f"Level {art_level} arts over {TRIALS:,} trials, "
+        f"p50 / p90 / p99 (seed {seed}):"
+    ]
+    for color, levels in results.items():
+        output.append(f"\n{emojis[color]} {color}:")
+        if not levels:
+            output.append("Complete!")
+        for level, spread in levels.items():
+            label = "Total" if level == "total" else f"r{level}"
+            if spread is None:
+                output.append(
+                    f"{label}: :warning: Will not recieve BPs for this level!"
+                )
+            else:
+                output.append(f"{label}: " + " / ".join(map(str, spread)))
+
+    await inter.response.send_message("\n".join(output))
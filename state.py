@@ -0,0 +1,120 @@
+from asyncio import Queue, get_running_loop, sleep
+from random import random
+from time import perf_counter
+
+import metrics
+from store import ConflictError
+
+
+class StateActor:
+    """
+    The single writer of player state.
+
+    Every change is submitted as a plain function, queued, and applied by
+    one worker task in the order it was submitted, so no two changes (nor
+    a change and the upgrade scan) ever interleave. Changes must not
+    await: each one is applied whole, between two steps of the event loop.
+
+    When other processes share the store, before() is awaited ahead of
+    each change to catch up with theirs, and commit() after it to write it
+    out. If commit() raises ConflictError (having undone the change), the
+    change is run again, up to retries times, after a backoff doubling
+    from backoff seconds (with jitter, so processes don't clash again).
+    """
+    def __init__(self, retries=3, backoff=0.01):
+        self.retries = retries
+        self.backoff = backoff
+        self.before = None
+        self.commit = None
+        self.queue = None
+        self.loop = None
+        self.worker = None
+        # Counters
+        self.applied = 0
+        self.failed = 0
+        self.conflicts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def submit(self, func, *args):
+        """
+        Queues func(*args) and returns its result once it has been applied.
+        Exceptions raised by func are raised here.
+        """
+        return await self.post(func, *args)
+
+    def post(self, func, *args):
+        """
+        Queues func(*args) without waiting for it, returning a future for
+        its result.
+        """
+        loop = get_running_loop()
+        if self.loop is not loop:
+            self._start(loop)
+        future = loop.create_future()
+        self.queue.put_nowait((func, args, future, perf_counter()))
+        return future
+
+    async def drain(self):
+        """
+        Waits until every change queued so far has been applied.
+        """
+        if self.queue is not None:
+            await self.queue.join()
+
+    def stats(self):
+        """
+        Returns the actor's counters.
+        """
+        return {
+            "queue_depth": 0 if self.queue is None else self.queue.qsize(),
+            "applied": self.applied,
+            "failed": self.failed,
+            "conflicts": self.conflicts,
+            "wait_avg": self.wait_total / max(1, self.applied + self.failed),
+            "wait_max": self.wait_max,
+        }
+
+    def _start(self, loop):
+        # One worker per event loop; a new loop (e.g. asyncio.run) gets its
+        # own queue
+        self.loop = loop
+        self.queue = Queue()
+        self.worker = loop.create_task(self._work())
+
+    async def _work(self):
+        while True:
+            func, args, future, queued = await self.queue.get()
+            waited = perf_counter() - queued
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            metrics.observe("hs_state_queue_wait_seconds", waited)
+            try:
+                result = await self._apply(func, args)
+            except Exception as e:
+                self.failed += 1
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                self.applied += 1
+                if not future.cancelled():
+                    future.set_result(result)
+            self.queue.task_done()
+
+    async def _apply(self, func, args):
+        for attempt in range(self.retries + 1):
+            if self.before is not None:
+                await self.before()
+            result = func(*args)
+            if self.commit is None:
+                return result
+            try:
+                await self.commit()
+            except ConflictError:
+                self.conflicts += 1
+                metrics.inc("hs_state_conflicts_total")
+                if attempt == self.retries:
+                    raise
+                await sleep(self.backoff * 2 ** attempt * (1 + random()))
+            else:
+                return result
@@ -0,0 +1,1070 @@
+import sqlite3
+from asyncio import get_running_loop, sleep
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from json import JSONDecodeError, dumps, load, loads
+from mmap import ACCESS_READ, mmap
+from os import fstat, fsync, path, pread, replace, stat
+from struct import Struct
+from threading import Lock
+from time import time_ns
+
+import metrics
+
+try:
+    from fcntl import LOCK_EX, LOCK_NB, LOCK_UN, flock
+except ImportError:
+    # Not available on Windows, where SHARED_STORE isn't supported
+    flock = None
+
+
+INDEX_MAGIC = b"HSIDX001"
+INDEX_HEADER = Struct("<8sQ")  # Magic, size of the snapshot it indexes
+INDEX_RECORD = Struct("<24sQI")  # Right-aligned pid, offset, length
+BUSY_TIMEOUT = 30  # Seconds SQLite waits for another process's write
+
+
+class ConflictError(Exception):
+    """
+    Raised by a store's commit when another process has changed one of the
+    same players since the change was made.
+    """
+    def __init__(self, pids):
+        super().__init__(
+            f"Changed by another process: {', '.join(sorted(pids))}"
+        )
+        self.pids = pids
+
+
+class FileLock:
+    """
+    An exclusive lock shared by every thread and process using the same
+    lock file. The OS releases it if the process holding it dies.
+    Not re-entrant.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.thread_lock = Lock()  # flock doesn't exclude other threads
+
+    def acquire(self, blocking=True):
+        """
+        Takes the lock, returning whether it was taken (always, if blocking).
+        """
+        if not self.thread_lock.acquire(blocking):
+            return False
+        if flock is None:
+            return True
+        if self.file is None:
+            self.file = open(self.filename, "a")
+        try:
+            flock(self.file, LOCK_EX if blocking else LOCK_EX | LOCK_NB)
+        except BlockingIOError:
+            self.thread_lock.release()
+            return False
+        return True
+
+    def release(self):
+        if flock is not None:
+            flock(self.file, LOCK_UN)
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class JournalStore:
+    """
+    Player info persisted as a JSON snapshot plus an append-only journal.
+
+    Every change is appended to the journal as one small JSON record.
+    Records always carry the new value (never a delta), so replaying a
+    record twice is harmless. Compaction folds the journal into a fresh
+    snapshot, which is written to a temporary file and atomically swapped
+    in, so a crash mid-write never leaves a corrupt snapshot behind.
+
+    Snapshots are written one player per line, alongside a sorted index of
+    each player's byte range and a list of running upgrades (with players'
+    time offsets), so a single player can be read without loading the rest
+    (see read_player). The journal's records are indexed by player in
+    memory as they are read, and applied on top.
+
+    Several processes can share the files: writes, loads and compaction
+    hold a lock file, and the journal doubles as a change log other
+    processes follow (see changes_since). Each journal starts with a
+    ["journal", generation] header, and compaction keeps the previous
+    journal as .old for processes that haven't read all of it yet.
+    """
+    def __init__(
+        self, snapshot="player_info.json", journal="player_info.journal"
+    ):
+        self.snapshot = snapshot
+        self.journal = journal
+        # Files kept alongside the store are named base + an extension
+        self.base = base = path.splitext(snapshot)[0]
+        self.index = base + ".index"
+        self.deadline_file = base + ".deadlines"
+        # Shared with other processes using the same files
+        self.file_lock = FileLock(base + ".lock")
+        self.pending = 0  # Records in the journal since the last compaction
+        self.in_place = False  # Changes are only stored once compacted
+        self.change_log = True  # changes_since sees every change
+        self.lock = Lock()  # Guards the readers while compaction swaps files
+        self.index_map = None
+        self.reader = None
+        self.journal_reader = None
+        self.overlay = {}  # pid -> [(offset, length)] of its journal records
+        self.indexed = 0  # Offset the journal is indexed up to
+
+    def load(self):
+        """
+        Returns the player info dict: the snapshot with the journal replayed.
+        """
+        players = {}
+        with self.file_lock:
+            if path.exists(self.snapshot):
+                with open(self.snapshot) as f:
+                    players = load(f)
+            self.pending = self._replay(players)
+        return players
+
+    def append(self, record):
+        """
+        Appends a single change record to the journal.
+        """
+        self.append_many([record])
+
+    def append_many(self, records):
+        """
+        Appends a batch of change records with a single write and fsync.
+        """
+        with self.file_lock:
+            self._append(records)
+            if self.reader is not None:
+                with self.lock:
+                    self._index_journal()
+
+    def position(self):
+        """
+        Returns the end of the change log, as (journal generation, offset).
+        A record's position is its version: see commit.
+        """
+        with self.file_lock:
+            return self._position()
+
+    def changes_since(self, position):
+        """
+        Returns the position now, and every record appended after position
+        by any process. The records are None if position is from before
+        the last compaction but one: everything must be reloaded.
+        """
+        with self.file_lock:
+            return self._changes_since(position)
+
+    def commit(self, records, base):
+        """
+        Appends records made against the change log as of position base,
+        unless another process has since changed one of the same players
+        (optimistic concurrency), in which case nothing is written and
+        ConflictError is raised. Returns the new position and the other
+        processes' records since base.
+        """
+        with self.file_lock:
+            position, others = self._changes_since(base)
+            if others is None:
+                raise ConflictError(set())
+            pids = {record[1] for record in records}
+            pids &= {record[1] for record in others}
+            if pids:
+                raise ConflictError(pids)
+            self._append(records)
+            if self.reader is not None:
+                with self.lock:
+                    self._index_journal()
+            return self._position(), others
+
+    def read_latest(self, pid):
+        """
+        Returns one player with every change any process has made, or None
+        if there isn't one. Needs open_index.
+        """
+        with self.file_lock:
+            reading = fstat(self.reader.fileno()).st_ino
+            with self.lock:
+                if reading != stat(self.snapshot).st_ino:
+                    # Another process has compacted since the readers were
+                    # opened
+                    self._open_readers()
+                else:
+                    self._index_journal()
+            return self.read_player(pid)
+
+    def compact(self):
+        """
+        Folds the journal into a new snapshot and starts a new journal.
+        Works only from the files on disk, so it never reads live state.
+        The old snapshot is streamed, so only the journal is held in memory.
+        """
+        with self.file_lock:
+            self._compact()
+
+    def _compact(self):
+        changes = {}
+        for record in self._records():
+            changes.setdefault(record[1], []).append(record)
+        index, upgrades, offsets = [], [], {}
+        tmp = self.snapshot + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"{")
+
+            def write(pid, player):
+                f.write(b",\n" if index else b"\n")
+                line = dumps({pid: player})[1:-1].encode()
+                index.append((pid.encode().rjust(24), f.tell(), len(line)))
+                f.write(line)
+                upgrades.extend(
+                    (planet[2], pid, i)
+                    for i, planet in enumerate(player["planets"])
+                    if planet[2] is not None
+                )
+                if player.get("offset"):
+                    offsets[pid] = player["offset"]
+
+            for pid, player in self._snapshot_items():
+                write(pid, _fold(pid, player, changes.pop(pid, ())))
+            for pid, records in changes.items():
+                # Players created since the last compaction
+                player = _fold(pid, None, records)
+                if player is not None:
+                    write(pid, player)
+            f.write(b"\n}\n")
+            f.flush()
+            fsync(f.fileno())
+            size = f.tell()
+            metrics.inc("hs_persisted_bytes_total", size, file="snapshot")
+        index.sort()
+        _write_file(self.index + ".tmp", b"".join(
+            [INDEX_HEADER.pack(INDEX_MAGIC, size)] +
+            [INDEX_RECORD.pack(*entry) for entry in index]
+        ))
+        _write_file(self.deadline_file + ".tmp", dumps({
+            "upgrades": sorted(upgrades), "offsets": offsets
+        }).encode())
+        with self.lock:
+            # An index left without its snapshot by a crash fails its size
+            # check, and is rebuilt by the next open_index
+            replace(self.index + ".tmp", self.index)
+            replace(self.deadline_file + ".tmp", self.deadline_file)
+            replace(tmp, self.snapshot)
+            # A crash here replays an already-folded journal, which is harmless
+            if path.exists(self.journal):
+                # Kept for other processes still following it
+                replace(self.journal, self.journal + ".old")
+            self._new_journal()
+            self.pending = 0
+            if self.reader is not None:
+                self._open_readers()
+
+    def open_index(self):
+        """
+        Readies read_player, indexing the journal's records, so opening
+        takes time in the journal's length, not the snapshot's. Compacts
+        first only if the index doesn't match the snapshot.
+        """
+        with self.file_lock:
+            if not self._index_current():
+                self._compact()
+            self._ensure_journal()
+            with self.lock:
+                self._open_readers()
+                self.pending = sum(map(len, self.overlay.values()))
+
+    def read_player(self, pid):
+        """
+        Returns one player from the snapshot with their journal records
+        applied, or None if there isn't one. Includes every change this
+        process has written, and other processes' changes as of the last
+        read_latest.
+        """
+        with self.lock:
+            player = self._read_snapshot(pid)
+            records = [
+                loads(pread(self.journal_reader.fileno(), length, offset))
+                for offset, length in self.overlay.get(pid, ())
+            ]
+        return _fold(pid, player, records)
+
+    def iter_players(self):
+        """
+        Yields (pid, player) for every player, one at a time, with the
+        journal records indexed so far applied (see read_player).
+        """
+        with self.lock:
+            changed = set(self.overlay)
+        for pid, player in self._snapshot_items():
+            if pid in changed:
+                changed.discard(pid)
+                player = self.read_player(pid)
+            yield pid, player
+        for pid in sorted(changed):
+            # Players created since the last compaction
+            player = self.read_player(pid)
+            if player is not None:
+                yield pid, player
+
+    def deadlines(self):
+        """
+        Returns (upgrade_until, pid, slot) for every running upgrade, and
+        {pid: offset} for every player with a time offset. Needs open_index:
+        the list saved at the last compaction is brought up to date with
+        the players changed in the journal since.
+        """
+        with open(self.deadline_file) as f:
+            data = load(f)
+        if isinstance(data, list):
+            # Written before time offsets
+            data = {"upgrades": data, "offsets": {}}
+        with self.lock:
+            changed = set(self.overlay)
+        upgrades = [
+            tuple(entry) for entry in data["upgrades"]
+            if entry[1] not in changed
+        ]
+        offsets = {
+            pid: offset for pid, offset in data["offsets"].items()
+            if pid not in changed
+        }
+        players = {pid: self.read_player(pid) for pid in changed}
+        newer, newer_offsets = self.upgrades({
+            pid: player for pid, player in players.items()
+            if player is not None
+        })
+        offsets.update(newer_offsets)
+        return sorted(upgrades + newer), offsets
+
+    def upgrades(self, players):
+        """
+        Returns (upgrade_until, pid, slot) for every running upgrade, and
+        {pid: offset} for every player with a time offset.
+        """
+        return [
+            (planet[2], pid, i)
+            for pid in players
+            for i, planet in enumerate(players[pid]["planets"])
+            if planet[2] is not None
+        ], {
+            pid: player["offset"] for pid, player in players.items()
+            if player.get("offset")
+        }
+
+    def stamp(self):
+        """
+        Returns a value that changes whenever the stored players do, for
+        data saved alongside the store to check it is still current.
+        """
+        return [_file_stamp(self.snapshot), _file_stamp(self.journal)]
+
+    def _replay(self, players):
+        """
+        Applies every journal record to players in order.
+        """
+        count = 0
+        for record in self._records():
+            apply_record(players, record)
+            count += 1
+        return count
+
+    def _records(self):
+        """
+        Yields the journal's records in order.
+        Discards a torn final record left behind by a crash mid-append.
+        """
+        if not path.exists(self.journal):
+            return
+        good = 0
+        with open(self.journal, "rb") as f:
+            for line in f:
+                try:
+                    record = loads(line)
+                except (JSONDecodeError, UnicodeDecodeError):
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                if record[0] != "journal":
+                    yield record
+                good += len(line)
+        if good < path.getsize(self.journal):
+            with open(self.journal, "r+b") as f:
+                f.truncate(good)
+
+    def _append(self, records):
+        # Called with the file lock held
+        self._ensure_journal()
+        data = "".join(
+            dumps(record, separators=(",", ":")) + "\n" for record in records
+        )
+        with open(self.journal, "a") as f:
+            f.write(data)
+            f.flush()
+            fsync(f.fileno())
+        self.pending += len(records)
+        metrics.inc("hs_persisted_bytes_total", len(data), file="journal")
+
+    def _position(self):
+        # Called with the file lock held
+        self._ensure_journal()
+        return self._generation(self.journal), path.getsize(self.journal)
+
+    def _changes_since(self, position):
+        # Called with the file lock held
+        self._ensure_journal()
+        generation, offset = position
+        records = []
+        if self._generation(self.journal) != generation:
+            # Compacted since: finish reading the journal position is in
+            old = self.journal + ".old"
+            if not path.exists(old) or self._generation(old) != generation:
+                return self._position(), None
+            records, _ = self._read_records(old, offset)
+            offset = 0
+            self.pending = 0
+            if self.reader is not None:
+                with self.lock:
+                    self._open_readers()
+        newer, offset = self._read_records(self.journal, offset)
+        self.pending += len(newer)
+        return (self._generation(self.journal), offset), records + newer
+
+    def _read_records(self, filename, offset):
+        """
+        Returns the complete records in a journal after offset, and the
+        offset they end at.
+        """
+        records = []
+        with open(filename, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = loads(line)
+                except (JSONDecodeError, UnicodeDecodeError):
+                    break
+                offset += len(line)
+                if record[0] != "journal":
+                    records.append(record)
+        return records, offset
+
+    def _new_journal(self):
+        # A unique generation, so positions in older journals are spotted
+        _write_file(
+            self.journal, dumps(["journal", time_ns()]).encode() + b"\n"
+        )
+
+    def _ensure_journal(self):
+        if not path.exists(self.journal):
+            self._new_journal()
+
+    def _generation(self, filename):
+        """
+        Returns a journal's generation, or None if it has no header.
+        """
+        try:
+            with open(filename, "rb") as f:
+                record = loads(f.readline())
+        except (OSError, JSONDecodeError, UnicodeDecodeError):
+            return None
+        return record[1] if record[0] == "journal" else None
+
+    def _snapshot_items(self):
+        """
+        Yields (pid, player) from the snapshot. Snapshots written before
+        the one-player-per-line format are loaded whole.
+        """
+        if not path.exists(self.snapshot):
+            return
+        with open(self.snapshot, "rb") as f:
+            if f.read(2) != b"{\n":
+                f.seek(0)
+                yield from load(f).items()
+                return
+            for line in f:
+                line = line.rstrip(b",\n")
+                if line and line != b"}":
+                    yield from loads(b"{" + line + b"}").items()
+
+    def _index_current(self):
+        if not path.exists(self.index) or not path.exists(self.snapshot):
+            return False
+        with open(self.index, "rb") as f:
+            header = f.read(INDEX_HEADER.size)
+        return (
+            len(header) == INDEX_HEADER.size and
+            INDEX_HEADER.unpack(header) ==
+            (INDEX_MAGIC, path.getsize(self.snapshot))
+        )
+
+    def _open_readers(self):
+        # Called with the lock held
+        if self.reader is not None:
+            self.index_map.close()
+            self.reader.close()
+            self.journal_reader.close()
+        with open(self.index, "rb") as f:
+            self.index_map = mmap(f.fileno(), 0, access=ACCESS_READ)
+        self.reader = open(self.snapshot, "rb")
+        self.journal_reader = open(self.journal, "rb")
+        self.overlay = {}
+        self.indexed = 0
+        self._index_journal()
+
+    def _index_journal(self):
+        """
+        Adds the journal's records since the last call to the overlay.
+        Called with the lock held.
+        """
+        offset = self.indexed
+        self.journal_reader.seek(offset)
+        for line in self.journal_reader:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = loads(line)
+            except (JSONDecodeError, UnicodeDecodeError):
+                break
+            if record[0] != "journal":
+                self.overlay.setdefault(record[1], []).append(
+                    (offset, len(line))
+                )
+            offset += len(line)
+        self.indexed = offset
+
+    def _index_key(self, i):
+        start = INDEX_HEADER.size + i * INDEX_RECORD.size
+        return self.index_map[start:start + 24]
+
+    def _read_snapshot(self, pid):
+        """
+        Returns one player from the snapshot, or None if they aren't in it.
+        Called with the lock held.
+        """
+        key = pid.encode().rjust(24)
+        # Binary search over the fixed-size index records
+        count = (len(self.index_map) - INDEX_HEADER.size) // INDEX_RECORD.size
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._index_key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == count:
+            return None
+        found, offset, length = INDEX_RECORD.unpack_from(
+            self.index_map, INDEX_HEADER.size + lo * INDEX_RECORD.size
+        )
+        if found != key:
+            return None
+        line = pread(self.reader.fileno(), length, offset)
+        return loads(b"{" + line + b"}")[pid]
+
+
+def apply_record(players, record):
+    """
+    Applies a single journal record to the player info dict.
+
+    Record formats:
+    - ["player", pid, player]: sets a whole player
+    - ["planet", pid, slot, [name, level, upgrade_until]]: sets one planet
+    - ["setting", pid, key, value]: sets one setting
+    - ["blueprint", pid, module, count]: sets one module's blueprint count
+    - ["offset", pid, offset]: sets the player's time offset
+
+    Planets' upgrade_until is always the base deadline, before the offset.
+    """
+    op, pid = record[0], record[1]
+    if op == "player":
+        players[pid] = record[2]
+    elif op == "planet":
+        players[pid]["planets"][record[2]] = record[3]
+    elif op == "setting":
+        players[pid]["settings"][record[2]] = record[3]
+    elif op == "blueprint":
+        players[pid].setdefault("blueprints", {})[record[2]] = record[3]
+    elif op == "offset":
+        players[pid]["offset"] = record[2]
+
+
+def _fold(pid, player, records):
+    """
+    Returns a player (None if absent) with the given records applied.
+    """
+    players = {} if player is None else {pid: player}
+    for record in records:
+        apply_record(players, record)
+    return players.get(pid)
+
+
+def _file_stamp(filename):
+    """
+    Returns [size, modification time] of a file, or None if it's missing.
+    """
+    try:
+        info = stat(filename)
+    except FileNotFoundError:
+        return None
+    return [info.st_size, info.st_mtime_ns]
+
+
+def _write_file(filename, data):
+    with open(filename, "wb") as f:
+        f.write(data)
+        f.flush()
+        fsync(f.fileno())
+
+
+class SqliteStore:
+    """
+    Player info persisted in SQLite, one row per change target.
+
+    Planets are stored one row per (player, slot) and settings one row per
+    player, so a single upgrade touches a single row (as do blueprint
+    counts, one row per player and module, and time offsets, one row per
+    player that has one). Running upgrades are listed in deadline order
+    with an indexed query on upgrade_until.
+
+    When shared with other processes, the database runs in WAL mode and
+    every change is also logged to a changes table, whose row numbers are
+    the change log positions other processes follow (see changes_since).
+    """
+    def __init__(self, database="player_info.db", shared=False):
+        self.database = database
+        self.shared = shared
+        self.base = path.splitext(database)[0]  # See JournalStore
+        # Rows are written immediately, so compaction only trims the change
+        # log (if shared): changes logged since the last compaction
+        self.pending = 0
+        self.logged_to = 0  # Change log rows the next compaction drops
+        self.in_place = True  # read_player sees every written change
+        self.change_log = shared  # See JournalStore
+        self.reader = None  # Connection for read_player, see open_index
+        new = not path.exists(database)
+        # Only ever used by one thread at a time, see WriteBehind
+        self.db = sqlite3.connect(
+            database, timeout=BUSY_TIMEOUT, check_same_thread=False
+        )
+        if shared:
+            self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS settings (
+                pid TEXT PRIMARY KEY,
+                settings TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS planets (
+                pid TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                name TEXT,
+                level INTEGER NOT NULL,
+                upgrade_until INTEGER,
+                PRIMARY KEY (pid, slot)
+            );
+            CREATE INDEX IF NOT EXISTS planets_upgrade_until
+                ON planets (upgrade_until)
+                WHERE upgrade_until IS NOT NULL;
+            CREATE TABLE IF NOT EXISTS blueprints (
+                pid TEXT NOT NULL,
+                module TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (pid, module)
+            );
+            CREATE TABLE IF NOT EXISTS offsets (
+                pid TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                record TEXT NOT NULL
+            );
+        """)
+        if new and path.exists("player_info.json"):
+            migrate(JournalStore(), self)
+
+    def load(self):
+        """
+        Returns the player info dict built from the database rows.
+        """
+        players = {}
+        for pid, settings in self.db.execute(
+            "SELECT pid, settings FROM settings"
+        ):
+            players[pid] = {
+                "planets": [], "settings": loads(settings), "blueprints": {}
+            }
+        for pid, slot, name, level, upgrade_until in self.db.execute(
+            "SELECT pid, slot, name, level, upgrade_until FROM planets "
+            "ORDER BY pid, slot"
+        ):
+            players[pid]["planets"].append([name, level, upgrade_until])
+        for pid, module, count in self.db.execute(
+            "SELECT pid, module, count FROM blueprints"
+        ):
+            players[pid]["blueprints"][module] = count
+        for pid, offset in self.db.execute("SELECT pid, offset FROM offsets"):
+            players[pid]["offset"] = offset
+        return players
+
+    def append(self, record):
+        """
+        Applies a single change record to the rows it touches.
+        """
+        self.append_many([record])
+
+    def append_many(self, records):
+        """
+        Applies a batch of change records in a single transaction.
+        """
+        with self.db:
+            for record in records:
+                self._apply(record)
+            if self.shared:
+                self._log(records)
+        if self.shared:
+            self.pending += len(records)
+
+    def position(self):
+        """
+        Returns the end of the change log: (0, last change row number).
+        A record's position is its version: see commit.
+        """
+        row = self.db.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+        ).fetchone()
+        return 0, 0 if row is None else row[0]
+
+    def changes_since(self, position):
+        """
+        Returns the position now, and every record logged after position
+        by any process. The records are None if some have already been
+        dropped by compaction: everything must be reloaded.
+        """
+        rows = self.db.execute(
+            "SELECT seq, record FROM changes WHERE seq > ? ORDER BY seq",
+            (position[1],)
+        ).fetchall()
+        end = self.position()
+        if end[1] > position[1] and (
+            not rows or rows[0][0] != position[1] + 1
+        ):
+            return end, None
+        return end, [loads(record) for _, record in rows]
+
+    def commit(self, records, base):
+        """
+        Applies records made against the change log as of position base,
+        unless another process has since changed one of the same players
+        (optimistic concurrency), in which case nothing is written and
+        ConflictError is raised. Returns the new position and the other
+        processes' records since base.
+        """
+        # Takes the database's write lock up front, so nothing can be
+        # logged between the check and the write
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            _, others = self.changes_since(base)
+            if others is None:
+                raise ConflictError(set())
+            pids = {record[1] for record in records}
+            pids &= {record[1] for record in others}
+            if pids:
+                raise ConflictError(pids)
+            for record in records:
+                self._apply(record)
+            self._log(records)
+        except BaseException:
+            self.db.rollback()
+            raise
+        self.db.commit()
+        self.pending += len(records)
+        return self.position(), others
+
+    def read_latest(self, pid):
+        """
+        Returns one player with every change any process has made, or None
+        if there isn't one. Needs open_index.
+        """
+        return self.read_player(pid)
+
+    def compact(self):
+        """
+        Drops change log rows from before the last compaction, so other
+        processes have a whole compaction interval to read them. Nothing
+        else to do: every change is already stored in place.
+        """
+        if self.shared:
+            with self.db:
+                self.db.execute(
+                    "DELETE FROM changes WHERE seq <= ?", (self.logged_to,)
+                )
+            self.logged_to = self.position()[1]
+            self.pending = 0
+
+    def open_index(self):
+        """
+        Readies read_player with its own connection, so reads on the event
+        loop don't share a connection with the writer thread.
+        """
+        self.reader = sqlite3.connect(
+            self.database, timeout=BUSY_TIMEOUT, check_same_thread=False
+        )
+
+    def read_player(self, pid):
+        """
+        Returns one player from the database, or None if there isn't one.
+        """
+        row = self.reader.execute(
+            "SELECT settings FROM settings WHERE pid = ?", (pid,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "planets": [
+                list(planet) for planet in self.reader.execute(
+                    "SELECT name, level, upgrade_until FROM planets "
+                    "WHERE pid = ? ORDER BY slot", (pid,)
+                )
+            ],
+            "settings": loads(row[0]),
+            "blueprints": dict(self.reader.execute(
+                "SELECT module, count FROM blueprints WHERE pid = ?", (pid,)
+            )),
+            **self._offset(pid)
+        }
+
+    def iter_players(self):
+        """
+        Yields (pid, player) for every player, one at a time.
+        """
+        rows = self.reader.execute(
+            "SELECT pid, settings, name, level, upgrade_until "
+            "FROM settings JOIN planets USING (pid) ORDER BY pid, slot"
+        )
+        for pid, group in groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            yield pid, {
+                "planets": [list(row[2:]) for row in group],
+                "settings": loads(group[0][1]),
+                "blueprints": dict(self.reader.execute(
+                    "SELECT module, count FROM blueprints WHERE pid = ?",
+                    (pid,)
+                )),
+                **self._offset(pid)
+            }
+
+    def deadlines(self):
+        """
+        Returns (upgrade_until, pid, slot) for every running upgrade, and
+        {pid: offset} for every player with a time offset.
+        """
+        return self.upgrades(None)
+
+    def stamp(self):
+        """
+        Returns a value that changes whenever the stored players do, for
+        data saved alongside the store to check it is still current.
+        """
+        return [
+            _file_stamp(self.database), _file_stamp(self.database + "-wal")
+        ]
+
+    def _apply(self, record):
+        op, pid = record[0], record[1]
+        if op == "player":
+            self._put_settings(pid, record[2]["settings"])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO planets VALUES (?, ?, ?, ?, ?)",
+                [
+                    (pid, i, *planet)
+                    for i, planet in enumerate(record[2]["planets"])
+                ]
+            )
+            self.db.execute("DELETE FROM blueprints WHERE pid = ?", (pid,))
+            self.db.executemany(
+                "INSERT INTO blueprints VALUES (?, ?, ?)",
+                [
+                    (pid, module, count) for module, count
+                    in record[2].get("blueprints", {}).items()
+                ]
+            )
+            self._put_offset(pid, record[2].get("offset", 0))
+        elif op == "planet":
+            self.db.execute(
+                "INSERT OR REPLACE INTO planets VALUES (?, ?, ?, ?, ?)",
+                (pid, record[2], *record[3])
+            )
+        elif op == "setting":
+            (settings,) = self.db.execute(
+                "SELECT settings FROM settings WHERE pid = ?", (pid,)
+            ).fetchone()
+            settings = loads(settings)
+            settings[record[2]] = record[3]
+            self._put_settings(pid, settings)
+        elif op == "blueprint":
+            self.db.execute(
+                "INSERT OR REPLACE INTO blueprints VALUES (?, ?, ?)",
+                (pid, record[2], record[3])
+            )
+        elif op == "offset":
+            self._put_offset(pid, record[2])
+
+    def upgrades(self, players):
+        """
+        Returns (upgrade_until, pid, slot) for every running upgrade, and
+        {pid: offset} for every player with a time offset.
+        """
+        return self.db.execute(
+            "SELECT upgrade_until, pid, slot FROM planets "
+            "WHERE upgrade_until IS NOT NULL ORDER BY upgrade_until"
+        ).fetchall(), dict(self.db.execute("SELECT pid, offset FROM offsets"))
+
+    def _offset(self, pid):
+        # {"offset": offset}, or {} as players without one leave it out
+        return {"offset": offset for (offset,) in self.reader.execute(
+            "SELECT offset FROM offsets WHERE pid = ?", (pid,)
+        )}
+
+    def _put_offset(self, pid, offset):
+        # Only players with an offset get a row
+        if offset:
+            self.db.execute(
+                "INSERT OR REPLACE INTO offsets VALUES (?, ?)", (pid, offset)
+            )
+        else:
+            self.db.execute("DELETE FROM offsets WHERE pid = ?", (pid,))
+
+    def _log(self, records):
+        self.db.executemany(
+            "INSERT INTO changes (record) VALUES (?)",
+            [(dumps(record, separators=(",", ":")),) for record in records]
+        )
+
+    def _put_settings(self, pid, settings):
+        self.db.execute(
+            "INSERT OR REPLACE INTO settings VALUES (?, ?)",
+            (pid, dumps(settings))
+        )
+
+
+class WriteBehind:
+    """
+    Moves a store's writes off the event loop.
+
+    Records are buffered and, after a short window, committed together as
+    one batch (group commit) on a single worker thread, so writes reach the
+    store in the order they were made. Outside an event loop, records are
+    written straight away.
+    """
+    def __init__(self, store, window=0.05):
+        self.store = store
+        self.window = window
+        self.buffer = []
+        self.task = None
+        self.worker = ThreadPoolExecutor(max_workers=1)
+
+    def append(self, record):
+        """
+        Queues a record to be written with the next batch.
+        """
+        self.buffer.append(record)
+        try:
+            loop = get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+        if self.task is None:
+            self.task = loop.create_task(self._commit())
+
+    def after_written(self, func, *args):
+        """
+        Runs func(*args) on the worker thread once every record queued so
+        far is written, and before any queued later is. Returns a
+        concurrent.futures.Future for its result. Doesn't wait, so it can
+        be called from a change.
+        """
+        # A pending commit (if any) will find the buffer empty
+        self.task = None
+        batch, self.buffer = self.buffer, []
+        self.worker.submit(self._write, batch)
+        return self.worker.submit(func, *args)
+
+    async def run(self, func, *args):
+        """
+        Runs func on the worker thread after every write queued so far.
+        """
+        await self.flush()
+        return await get_running_loop().run_in_executor(
+            self.worker, func, *args
+        )
+
+    async def flush(self):
+        """
+        Writes every buffered record and waits for it to land.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        batch, self.buffer = self.buffer, []
+        await get_running_loop().run_in_executor(
+            self.worker, self._write, batch
+        )
+
+    def flush_sync(self):
+        """
+        Writes every buffered record, blocking until done.
+        For shutdown and other places without a running event loop.
+        """
+        # A pending commit (if any) will find the buffer empty
+        self.task = None
+        batch, self.buffer = self.buffer, []
+        self.worker.submit(self._write, batch).result()
+
+    async def _commit(self):
+        # Let a burst of changes build up before writing it out
+        await sleep(self.window)
+        batch, self.buffer = self.buffer, []
+        self.task = None
+        await get_running_loop().run_in_executor(
+            self.worker, self._write, batch
+        )
+
+    @metrics.timed("hs_player_info_write_seconds")
+    def _write(self, batch):
+        if batch:
+            self.store.append_many(batch)
+
+
+def open_store(kind, shared=False):
+    """
+    Returns the player store for the given backend name ("json"/"sqlite").
+    Pass shared if other processes use the same store.
+    """
+    if kind == "sqlite":
+        return SqliteStore(shared=shared)
+    return JournalStore()
+
+
+def migrate(source, dest):
+    """
+    Copies every player from one store into another.
+    """
+    dest.append_many([
+        ["player", pid, player] for pid, player in source.load().items()
+    ])
+
+
+if __name__ == "__main__":
+    # One-shot migration of player_info.json (and its journal) to SQLite
+    SqliteStore()
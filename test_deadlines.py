@@ -0,0 +1,76 @@
+import pytest
+
+import planets
+from conftest import player_json
+from deadlines import DeadlineIndex
+
+
+def index(timers, offsets=None):
+    """
+    Returns a DeadlineIndex over {(pid, slot): base deadline}.
+    """
+    deadlines = DeadlineIndex(lambda pid, slot: timers.get((pid, slot)))
+    deadlines.rebuild(
+        [(until, pid, slot) for (pid, slot), until in timers.items()],
+        offsets
+    )
+    return deadlines
+
+
+def test_offsets_move_every_timer():
+    timers = {("a", 0): 100, ("a", 1): 300, ("b", 0): 200}
+    deadlines = index(timers, {"a": 0, "b": 50})
+    assert deadlines.peek() == 100
+    deadlines.shift("a", 60)
+    assert deadlines.peek() == 40
+    assert deadlines.pop_expired(39) == []
+    assert sorted(deadlines.pop_expired(150)) == [("a", 0), ("b", 0)]
+    assert deadlines.peek() == 240  # a's second timer, 300 - 60
+    deadlines.shift("a", 0)
+    assert deadlines.peek() == 300
+    assert deadlines.pop_expired(10**9) == [("a", 1)]
+    assert deadlines.peek() is None
+
+
+def test_changed_timers_are_dropped():
+    timers = {("a", 0): 100, ("b", 0): 200}
+    deadlines = index(timers)
+    timers[("a", 0)] = 400
+    deadlines.push(400, "a", 0)
+    del timers[("b", 0)]
+    assert deadlines.peek() == 400
+    assert deadlines.pop_expired(399) == []
+    assert deadlines.pop_expired(400) == [("a", 0)]
+
+
+@pytest.mark.parametrize("cache_size", [0, 1])
+def test_shift_player(load_planets, cache_size):
+    store = load_planets({
+        "1": player_json(["A", 2, 1000], ["B", 3, 5000], offset=100),
+        "2": player_json(["C", 1, 950]),
+    }, cache_size)
+    assert planets.DEADLINES.peek() == 900
+    planets._shift_player("1", 400)
+    player = planets.PLAYER_INFO["1"]
+    assert (player.offset, player.base_until(0)) == (500, 1000)
+    assert player.upgrade_until(0) == 500
+    assert planets.DEADLINES.peek() == 500
+
+    # Persisted as the offset alone, and the same after a restart
+    planets.WRITER.flush_sync()
+    assert store.load()["1"] == player_json(
+        ["A", 2, 1000], ["B", 3, 5000], offset=500
+    )
+    load_planets(cache_size=cache_size)
+    assert planets.DEADLINES.peek() == 500
+
+    assert planets._complete_upgrades(949) == {}
+    assert planets.PLAYER_INFO["1"].levels[0] == 3
+    assert planets.PLAYER_INFO["2"].levels[0] == 1
+    assert planets.DEADLINES.peek() == 950
+    planets._shift_player("1", 4000)
+    assert planets.DEADLINES.peek() == 500  # B's 5000 - 4500
+    planets._complete_upgrades(950)
+    assert planets.PLAYER_INFO["1"].levels[1] == 4
+    assert planets.PLAYER_INFO["2"].levels[0] == 2
+    assert planets.DEADLINES.peek() is None
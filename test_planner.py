@@ -0,0 +1,111 @@
+from random import Random
+
+import pytest
+
+from planner import plan_upgrades
+from rules import (
+    CREDIT_STORAGE, MAX_LEVEL, PTYPE, SHIPMENT_VALUE, UPGRADE_COST,
+    UPGRADE_DURATION, shipment_base
+)
+
+TIER_1 = [PTYPE.Desert, PTYPE.Fire, PTYPE.Water, PTYPE.Terran]
+
+
+def brute_force(slots, budget, horizon, workers, objective):
+    """
+    Returns the best gain over every order of upgrades on every choice of
+    worker, each upgrade starting once both are free.
+    """
+    def value(ptype, ptier, lv, finish):
+        if objective == "cap":
+            return CREDIT_STORAGE[lv + 1] - CREDIT_STORAGE[lv]
+        base = shipment_base(ptype, ptier)
+        hourly = SHIPMENT_VALUE[base + lv + 1] - SHIPMENT_VALUE[base + lv]
+        return hourly * (horizon - finish) // 3600
+
+    def search(free, levels, ready, spent):
+        best = 0
+        for p, (ptype, ptier, _, _) in enumerate(slots):
+            lv = levels[p]
+            if lv >= MAX_LEVEL[ptier] or spent + UPGRADE_COST[lv] > budget:
+                continue
+            for w in range(workers):
+                finish = max(free[w], ready[p]) + UPGRADE_DURATION[lv]
+                if finish > horizon:
+                    continue
+                best = max(best, value(ptype, ptier, lv, finish) + search(
+                    free[:w] + [finish] + free[w + 1:],
+                    levels[:p] + [lv + 1] + levels[p + 1:],
+                    ready[:p] + [finish] + ready[p + 1:],
+                    spent + UPGRADE_COST[lv]
+                ))
+        return best
+
+    busy = sorted([slot[3] for slot in slots if slot[3]] + [0] * workers)
+    return search(
+        busy[len(busy) - workers:],
+        [level + 1 if busy else level for _, _, level, busy in slots],
+        [slot[3] for slot in slots], 0
+    )
+
+
+def check_schedule(slots, budget, horizon, workers, plan):
+    """
+    Asserts a plan keeps to the budget, horizon, workers and level order.
+    """
+    steps, cost, _ = plan
+    assert cost == sum(UPGRADE_COST[level] for _, level, _, _ in steps)
+    assert cost <= budget
+    levels = [level + 1 if busy else level for _, _, level, busy in slots]
+    ready = [slot[3] for slot in slots]
+    for slot, level, start, finish in steps:
+        assert level == levels[slot] and start >= ready[slot]
+        assert finish == start + UPGRADE_DURATION[level] <= horizon
+        levels[slot], ready[slot] = level + 1, finish
+    running = [slot[3] for slot in slots if slot[3]]
+    for _, _, start, _ in steps:
+        busy = sum(s <= start < f for _, _, s, f in steps)
+        busy += sum(start < until for until in running)
+        assert busy <= workers
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_matches_brute_force(seed):
+    rng = Random(seed)
+    slots = tuple(
+        (rng.choice(TIER_1), 1, rng.randrange(1, 7),
+         rng.choice([0, 0, rng.randrange(1, 400)]))
+        for _ in range(rng.randrange(1, 4))
+    )
+    budget = rng.randrange(100, 5000)
+    horizon = rng.randrange(60, 3000)
+    workers = rng.randrange(1, 3)
+    objective = rng.choice(["cap", "income"])
+    plan = plan_upgrades(slots, budget, horizon, workers, objective)
+    check_schedule(slots, budget, horizon, workers, plan)
+    assert plan[2] == brute_force(slots, budget, horizon, workers, objective)
+
+
+def test_workers_are_shared():
+    # Two planets, one worker: the second planet waits for the first
+    slots = ((PTYPE.Desert, 1, 6, 0), (PTYPE.Water, 1, 6, 0))
+    plan = plan_upgrades(slots, 10**6, 2400, 1, "cap")
+    check_schedule(slots, 10**6, 2400, 1, plan)
+    assert [step[2] for step in plan[0]] == [0, 1200]
+
+
+def test_running_upgrades_longer_than_horizon():
+    # A two-day upgrade in progress fills the only worker's hour
+    slots = tuple(
+        [(PTYPE.Desert, 1, 5, 0)] * 15 + [(PTYPE.Ice, 4, 20, 2 * 86400)]
+    )
+    steps, cost, gain = plan_upgrades(slots, 10**6, 3600, 1, "cap")
+    assert (steps, cost, gain) == ([], 0, 0)
+
+
+def test_running_upgrades_over_workers():
+    busy = (PTYPE.Ice, 4, 20, 86400)
+    slots = tuple([busy, busy] + [(PTYPE.Desert, 1, 5, 0)] * 14)
+    for objective in ["cap", "income"]:
+        steps, _, _ = plan_upgrades(slots, 10**6, 3600, 1, objective)
+        assert steps == []
@@ -0,0 +1,85 @@
+import pytest
+
+from player import Player
+from player_cache import PlayerCache
+from store import JournalStore
+
+
+def player(level):
+    return {
+        "planets": [["A", level, None], [None, 0, None]],
+        "settings": {"ping_when_upgraded": False}, "blueprints": {}
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JournalStore(
+        str(tmp_path / "players.json"), str(tmp_path / "players.journal")
+    )
+    store.append_many([["player", str(pid), player(pid)] for pid in range(5)])
+    store.compact()
+    store.open_index()
+    return store
+
+
+def level(cache, pid):
+    return cache[pid].levels[0]
+
+
+def change(cache, pid, new):
+    cache[pid].levels[0] = new
+    cache.mark_dirty(pid)
+
+
+def test_reads_and_evicts_least_recent(store):
+    evicted = []
+    cache = PlayerCache(store, 2, on_evict=evicted.append)
+    assert [level(cache, pid) for pid in "012"] == [0, 1, 2]
+    assert evicted == ["0"] and list(cache.players) == ["1", "2"]
+    level(cache, "1")  # Now the most recent
+    level(cache, "3")
+    assert evicted == ["0", "2"] and list(cache.players) == ["1", "3"]
+    assert (cache.hits, cache.misses) == (1, 4)
+    assert "9" not in cache
+    with pytest.raises(KeyError):
+        cache["9"]
+
+
+def test_writes_back_evicted_changes(store):
+    cache = PlayerCache(store, 1)
+    change(cache, "0", 7)
+    cache["9"] = Player.from_json(player(9))
+    assert cache.overlay["0"][0] == 0 and "0" not in cache.players
+    # Read back from the overlay, not the store, and dirty again
+    assert level(cache, "0") == 7 and cache.dirty["0"] == 0
+    assert "9" in cache.overlay
+    assert {pid: p.levels[0] for pid, p in cache.items()} == {
+        "0": 7, "9": 9, "1": 1, "2": 2, "3": 3, "4": 4
+    }
+    assert list(cache.players) == ["0"]
+
+
+def test_compaction_generations(store):
+    cache = PlayerCache(store, 1)
+    change(cache, "0", 7)
+    level(cache, "1")
+    generation = cache.begin_compaction()
+    # Changed while the compaction runs: not in the snapshot it writes
+    change(cache, "2", 8)
+    level(cache, "3")
+    assert set(cache.overlay) == {"0", "2"}
+    store.append(["player", "0", player(7)])
+    store.compact()
+    cache.end_compaction(generation)
+    assert set(cache.overlay) == {"2"} and cache.dirty == {}
+    assert level(cache, "0") == 7 and level(cache, "2") == 8
+    assert cache.dirty == {"2": 1}
+
+
+def test_stored_forgets_changes(store):
+    cache = PlayerCache(store, 1)
+    change(cache, "0", 7)
+    level(cache, "1")
+    cache.stored(["0"])
+    assert cache.overlay == {} and level(cache, "0") == 0
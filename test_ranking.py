@@ -0,0 +1,87 @@
+from random import Random
+
+import pytest
+
+import planets
+import ranking
+from conftest import player_json
+from ranking import Board
+from rules import MAX_LEVEL
+
+
+def check(board, scores):
+    """
+    Asserts a board ranks scores highest first, ties by pid.
+    """
+    ordered = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    assert len(board) == len(scores)
+    assert board.top(len(scores) + 1) == ordered
+    assert board.top(3) == ordered[:3]
+    for rank, (pid, score) in enumerate(ordered, 1):
+        assert board.rank(pid) == (rank, score)
+    assert board.rank("missing") is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_board_matches_sorting(monkeypatch, seed):
+    # Small sublists, to split and drop them often
+    monkeypatch.setattr(ranking, "LOAD", 4)
+    rng = Random(seed)
+    scores = {str(pid): rng.randrange(20) for pid in range(30)}
+    board = Board(scores)
+    check(board, scores)
+    for _ in range(300):
+        pid = str(rng.randrange(60))
+        if rng.random() < 0.5:
+            board.set(pid, rng.randrange(20))
+            scores[pid] = board.scores[pid]
+        else:
+            delta = rng.randrange(-5, 6)
+            board.add(pid, delta)
+            scores[pid] = scores.get(pid, 0) + delta
+    check(board, scores)
+    check(Board(scores), scores)
+
+
+def check_boards():
+    full = planets._rank_players(planets.PLAYER_INFO)
+    assert list(full) == list(planets.BOARDS)
+    for name, board in planets.BOARDS.items():
+        check(board, full[name].scores)
+
+
+@pytest.mark.parametrize("cache_size", [0, 2])
+def test_boards_follow_changes(load_planets, cache_size):
+    rng = Random(cache_size)
+    load_planets({
+        str(pid): player_json(
+            *[[f"P{pid}-{i}", rng.randrange(1, 6), None] for i in range(4)]
+        )
+        for pid in range(8)
+    }, cache_size)
+    check_boards()
+
+    for pid in map(str, range(10)):
+        slot = rng.randrange(6)
+        ptype, tier, disc = planets.PORDER[slot]
+        planets._add_planet(
+            pid, f"N{pid}", rng.randrange(1, MAX_LEVEL[tier] + 1), ptype,
+            tier, disc
+        )
+        planets._upgrade_planet(pid, f"P{pid}-0", rng.randrange(1, 100))
+    check_boards()
+
+    planets._complete_upgrades(10**10)
+    check_boards()
+    # Saved with the store, and caught up with later changes on restart
+    # without ranking every player again
+    planets.flush_player_info()
+    planets._add_planet("3", "X", 1, *planets.PORDER[0])
+    planets.WRITER.flush_sync()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(planets, "_rank_players", None)
+        load_planets(cache_size=cache_size)
+    check_boards()
+    assert planets.BOARDS["cc"].scores["3"] == (
+        planets._player_scores(planets.PLAYER_INFO["3"])[0]
+    )
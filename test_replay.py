@@ -0,0 +1,57 @@
+import asyncio
+
+import planets
+import replay
+from store import JournalStore
+
+START = 1_700_000_000
+PLAYERS = 10
+
+
+def capture():
+    """
+    Returns a start save and a capture where each player's timer runs out
+    just before they start an upgrade and shift their timers straight
+    after, so the upgrade's completion check holds up the first command.
+    """
+    players = {}
+    entries = []
+    for i in range(PLAYERS):
+        pid = str(1000 + i)
+        names = [f"A{i}", f"B{i}"]
+        slots = [[None, 0, None]] * len(planets.PORDER)
+        slots[:2] = [
+            [names[0], 3, START + i + 1], [names[1], 2, None]
+        ]
+        players[pid] = {
+            "planets": slots, "settings": {"ping_when_upgraded": False}
+        }
+        at = START + i + 1.5
+        entries += [
+            [at, "upgrade_planet", int(pid), 1, [names[1], 3600], 0.001],
+            [at + 0.001, "shift_upgrade_times", int(pid), 1, [600], 0.001],
+            [at + 0.002, "list_planets", int(pid), 1, [], 0.001],
+        ]
+    return entries, {"time": START, "players": players}
+
+
+def run(entries, start, end, speed, workdir):
+    results = asyncio.run(
+        replay.replay(entries, start, end, speed, 5, str(workdir))
+    )
+    store = JournalStore(
+        str(workdir / "players.json"), str(workdir / "players.journal")
+    )
+    return results, store.load()
+
+
+def test_same_state_at_any_speed(tmp_path):
+    entries, start = capture()
+    (tmp_path / "fast").mkdir()
+    (tmp_path / "paced").mkdir()
+    results, players = run(entries, start, None, 0, tmp_path / "fast")
+    assert not results["failed"]
+    end = {"time": entries[-1][0], "players": players}
+    results, _ = run(entries, start, end, 10, tmp_path / "paced")
+    assert not results["failed"]
+    assert results["state_matches"], results["differing_players"]
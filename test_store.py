@@ -0,0 +1,149 @@
+import json
+from os import path
+
+import pytest
+
+from store import ConflictError, JournalStore, SqliteStore
+
+
+def player(level=1, until=None, **extra):
+    planets = [[None, 0, None]] * 4
+    planets[0] = ["A", level, until]
+    return {
+        "planets": planets, "settings": {"ping_when_upgraded": False},
+        "blueprints": {}, **extra
+    }
+
+
+PLAYERS = {"1": player(3, 500), "2": player(5), "3": player(2, 900)}
+
+
+def open_store(kind, directory, shared=False):
+    if kind == "json":
+        return JournalStore(
+            str(directory / "players.json"), str(directory / "players.journal")
+        )
+    return SqliteStore(str(directory / "players.db"), shared)
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # SqliteStore migrates a player_info.json it finds
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def changed_players():
+    players = json.loads(json.dumps(PLAYERS))
+    players["1"]["planets"][0] = ["A", 4, None]
+    players["2"]["offset"] = 30
+    players["2"]["settings"]["ping_when_upgraded"] = True
+    players["3"]["blueprints"]["Shield"] = 2
+    players["4"] = player(1, 700)
+    return players
+
+
+CHANGES = [
+    ["planet", "1", 0, ["A", 4, None]],
+    ["offset", "2", 30],
+    ["setting", "2", "ping_when_upgraded", True],
+    ["blueprint", "3", "Shield", 2],
+    ["player", "4", player(1, 700)],
+]
+
+
+def check_reads(store, players):
+    store.open_index()
+    assert {pid: store.read_player(pid) for pid in players} == players
+    assert store.read_player("5") is None
+    assert dict(store.iter_players()) == players
+    upgrades, offsets = store.deadlines()
+    assert (sorted(upgrades), offsets) == (
+        sorted(store.upgrades(players)[0]), store.upgrades(players)[1]
+    )
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_round_trip_and_restart(workdir, kind):
+    store = open_store(kind, workdir)
+    store.append_many([["player", pid, p] for pid, p in PLAYERS.items()])
+    store.compact()
+    for record in CHANGES:
+        store.append(record)
+    players = changed_players()
+    assert store.load() == players
+    check_reads(store, players)
+
+    again = open_store(kind, workdir)
+    assert again.load() == players
+    check_reads(again, players)
+    again.compact()
+    check_reads(open_store(kind, workdir), players)
+
+
+def test_open_index_leaves_the_journal(workdir):
+    store = open_store("json", workdir)
+    store.append_many([["player", pid, p] for pid, p in PLAYERS.items()])
+    store.compact()
+    store.append_many(CHANGES)
+    snapshot = path.getmtime(store.snapshot), path.getsize(store.snapshot)
+
+    again = open_store("json", workdir)
+    check_reads(again, changed_players())
+    assert (path.getmtime(again.snapshot), path.getsize(again.snapshot)) == (
+        snapshot
+    )
+    assert again.pending == len(CHANGES)
+    # Changes written after opening are read too
+    again.append(["planet", "4", 0, ["B", 1, None]])
+    assert again.read_player("4")["planets"][0] == ["B", 1, None]
+    again.compact()
+    assert again.pending == 0 and again.overlay == {}
+    assert again.read_player("4")["planets"][0] == ["B", 1, None]
+
+
+def test_legacy_snapshot(workdir):
+    # Saved whole, before one player per line, index files and offsets
+    store = open_store("json", workdir)
+    with open(store.snapshot, "w") as f:
+        json.dump(PLAYERS, f)
+    check_reads(store, PLAYERS)
+    assert not any("offset" in p for p in PLAYERS.values())
+
+    # Deadlines saved as a bare list, before offsets
+    upgrades, _ = store.deadlines()
+    with open(store.deadline_file, "w") as f:
+        json.dump(upgrades, f)
+    again = open_store("json", workdir)
+    check_reads(again, PLAYERS)
+    assert again.deadlines() == (upgrades, {})
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_racing_processes(workdir, kind):
+    first = open_store(kind, workdir, shared=True)
+    first.append_many([["player", pid, p] for pid, p in PLAYERS.items()])
+    second = open_store(kind, workdir, shared=True)
+    for store in [first, second]:
+        store.open_index()
+    base = first.position()
+    assert second.position() == base
+
+    won = ["planet", "1", 0, ["A", 4, None]]
+    assert first.commit([won], base)[1] == []
+    with pytest.raises(ConflictError) as raised:
+        second.commit([["planet", "1", 0, ["A", 9, None]]], base)
+    assert raised.value.pids == {"1"}
+    assert second.read_latest("1")["planets"][0] == ["A", 4, None]
+
+    # Other players don't conflict, and come back with the winner's change
+    other = ["setting", "2", "ping_when_upgraded", True]
+    position, others = second.commit([other], base)
+    assert others == [won]
+    assert first.changes_since(base) == (position, [won, other])
+    assert first.read_latest("2")["settings"]["ping_when_upgraded"]
+
+    # Compacted by one process, still read by the other
+    first.compact()
+    assert second.read_latest("1")["planets"][0] == ["A", 4, None]
+    assert second.read_latest("2")["settings"]["ping_when_upgraded"]
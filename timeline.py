@@ -0,0 +1,96 @@
+from bisect import bisect_right
+from math import ceil
+
+
+class Timeline:
+    """
+    A player's credit cap, hydro cap and hourly shipment income over time,
+    as their running upgrades complete.
+
+    times holds the completions in order, and cc, hc and income the running
+    totals (prefix sums of each completion's change): entry i holds from
+    times[i - 1] until times[i], so entry 0 is before any completion and
+    entry -1 after all of them. The totals at any time are a bisect away.
+    Nothing changes between two completions, so credits banked over any
+    stretch of time are worked out in closed form, one step per completion.
+    """
+    __slots__ = ("times", "cc", "hc", "income")
+
+    def __init__(self, cc, hc, income, events):
+        """
+        Takes the totals now and (time, cc, hc, income change) for each
+        running upgrade.
+        """
+        self.times = []
+        self.cc, self.hc, self.income = [cc], [hc], [income]
+        for when, cc_incr, hc_incr, income_incr in sorted(events):
+            self.times.append(when)
+            self.cc.append(self.cc[-1] + cc_incr)
+            self.hc.append(self.hc[-1] + hc_incr)
+            self.income.append(self.income[-1] + income_incr)
+
+    def cap_at(self, when):
+        """
+        Returns (credit cap, hydro cap) at a time.
+        """
+        i = bisect_right(self.times, when)
+        return self.cc[i], self.hc[i]
+
+    def income_at(self, when):
+        """
+        Returns the hourly shipment income at a time.
+        """
+        return self.income[bisect_right(self.times, when)]
+
+    def completed(self, start, when):
+        """
+        Returns the number of upgrades completing after start, up to when.
+        """
+        return (
+            bisect_right(self.times, when) - bisect_right(self.times, start)
+        )
+
+    def end(self):
+        """
+        Returns when the last running upgrade completes, or None.
+        """
+        return self.times[-1] if self.times else None
+
+    def credits_at(self, credits, start, when):
+        """
+        Returns the credits banked by when, holding credits at start.
+        Shipments stop adding to credits at or over the credit cap.
+        """
+        for begin, end, cap, income in self._steps(start):
+            stop = when if end is None else min(end, when)
+            if credits < cap:
+                credits = min(cap, credits + income * (stop - begin) / 3600)
+            if stop == when:
+                return credits
+
+    def cap_reached(self, credits, start):
+        """
+        Returns when credits banked from start reach the credit cap, or
+        None if they never do.
+        """
+        for begin, end, cap, income in self._steps(start):
+            if credits >= cap:
+                return begin
+            if income:
+                full = begin + (cap - credits) * 3600 / income
+                if end is None or full <= end:
+                    return ceil(full)
+                credits += income * (end - begin) / 3600
+        return None
+
+    def _steps(self, start):
+        """
+        Yields (begin, end, credit cap, hourly income) for the stretches
+        between completions from start on, the last with an end of None.
+        """
+        i = bisect_right(self.times, start)
+        begin = start
+        for j in range(i, len(self.times)):
+            yield begin, self.times[j], self.cc[j], self.income[j]
+            begin = self.times[j]
+        yield begin, None, self.cc[-1], self.income[-1]